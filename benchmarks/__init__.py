@@ -0,0 +1,9 @@
+"""
+Benchmarks for nginx-config-builder.
+
+Run them from the root of the repository, for instance::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --compare results.json
+
+"""
@@ -0,0 +1,72 @@
+"""
+Compares adding routes one at a time through the builder with adding them in bulk.
+
+Usage::
+
+    python -m benchmarks.bulk_routes --routes 100000
+
+"""
+import argparse
+
+from nginx.config.builder import NginxConfigBuilder
+
+from .run import best_of
+
+
+def route_rows(count):
+    """ Returns ``count`` rows of (path, options), like a route table would hold. """
+    return [
+        ('/service{0}'.format(i), {
+            'proxy_pass': 'http://upstream{0}'.format(i % 100),
+            'proxy_read_timeout': 30 + i % 5,
+            'proxy_connect_timeout': 5,
+            'expires': '1m' if i % 2 else 'off',
+        })
+        for i in range(count)
+    ]
+
+
+def one_at_a_time(rows):
+    nginx = NginxConfigBuilder()
+    with nginx.add_server(hostname='example.com') as server:
+        for path, options in rows:
+            server.add_route(path, **options).end()
+    return nginx
+
+
+def bulk(rows):
+    nginx = NginxConfigBuilder()
+    with nginx.add_server(hostname='example.com') as server:
+        server.add_routes(rows)
+    return nginx
+
+
+def columns(rows):
+    nginx = NginxConfigBuilder()
+    names = list(rows[0][1])
+    with nginx.add_server(hostname='example.com') as server:
+        server.add_routes(path=[path for path, _ in rows], **dict(
+            (name, [options[name] for _, options in rows]) for name in names
+        ))
+    return nginx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--routes', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = route_rows(args.routes)
+    expected = repr(one_at_a_time(rows))
+    baseline = None
+    for name, build in (('add_route', one_at_a_time), ('add_routes', bulk), ('columns', columns)):
+        if repr(build(rows)) != expected:
+            raise AssertionError('{0} built a different config'.format(name))
+        elapsed = best_of(args.repeat, lambda: rows, build)
+        baseline = baseline or elapsed
+        print('{0:<12} {1:.4f}s  {2:.1f}x'.format(name, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
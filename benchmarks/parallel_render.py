@@ -0,0 +1,43 @@
+"""
+Compares serial and parallel rendering of a large synthetic config.
+
+Usage::
+
+    python -m benchmarks.parallel_render --servers 20000 --workers 2 4 8
+
+"""
+import argparse
+import time
+
+from nginx.config.helpers import render
+
+from .synthetic import build_blocks
+
+
+def timed(servers, locations, **kwargs):
+    config = build_blocks(servers=servers, locations=locations, depth=0)
+    start = time.time()
+    output = render(config, **kwargs)
+    return time.time() - start, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', type=int, default=20000)
+    parser.add_argument('--locations', type=int, default=5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--threads', action='store_true', help='use a thread pool instead of processes')
+    args = parser.parse_args()
+
+    serial, expected = timed(args.servers, args.locations)
+    print('{0} servers, {1:.1f} MB of output'.format(args.servers, len(expected) / 1e6))
+    print('serial:     {0:.2f}s'.format(serial))
+
+    for workers in args.workers:
+        elapsed, output = timed(args.servers, args.locations, workers=workers, threads=args.threads)
+        assert output == expected, 'parallel output differs from serial output'
+        print('workers={0}:  {1:.2f}s ({2:.2f}x)'.format(workers, elapsed, serial / elapsed))
+
+
+if __name__ == '__main__':
+    main()
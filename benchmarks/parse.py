@@ -0,0 +1,75 @@
+"""
+Measures parser throughput in MB/s, on a synthetic config and on a config with a huge map block.
+
+Usage::
+
+    python -m benchmarks.parse --servers 2000 --map-entries 500000
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from nginx.config.parser import parse_file, tokenize
+
+from .synthetic import build_blocks
+
+
+def write_map_config(path, entries):
+    with open(path, 'w') as fp:
+        fp.write('http {\n    map $host $backend {\n        default default;\n')
+        for i in range(entries):
+            fp.write('        host{0}.example.com backend{1};\n'.format(i, i % 50))
+        fp.write('    }\n}\n')
+
+
+def throughput(path, repeat):
+    """ Returns the best (tokenize, parse) throughput in MB/s for a file. """
+    size = os.path.getsize(path) / 1e6
+    with open(path, 'rb') as fp:
+        data = fp.read()
+
+    tokenize_best = parse_best = None
+    for _ in range(repeat):
+        start = time.time()
+        for _ in tokenize(data):
+            pass
+        elapsed = time.time() - start
+        tokenize_best = elapsed if tokenize_best is None else min(tokenize_best, elapsed)
+
+        start = time.time()
+        parse_file(path)
+        elapsed = time.time() - start
+        parse_best = elapsed if parse_best is None else min(parse_best, elapsed)
+    return size / tokenize_best, size / parse_best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', type=int, default=2000)
+    parser.add_argument('--locations', type=int, default=10)
+    parser.add_argument('--map-entries', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        synthetic = os.path.join(directory, 'synthetic.conf')
+        with open(synthetic, 'w') as fp:
+            build_blocks(servers=args.servers, locations=args.locations, depth=1, options=4).render_to(fp)
+        huge_map = os.path.join(directory, 'map.conf')
+        write_map_config(huge_map, args.map_entries)
+
+        for name, path in (('synthetic', synthetic), ('map', huge_map)):
+            tokens, parsed = throughput(path, args.repeat)
+            print('{0:<10} {1:7.1f} MB  tokenize {2:6.1f} MB/s  parse {3:6.1f} MB/s'.format(
+                name, os.path.getsize(path) / 1e6, tokens, parsed
+            ))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
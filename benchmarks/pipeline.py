@@ -0,0 +1,96 @@
+"""
+Compares generating a config from a slow async source through the pipeline with reading the whole
+source before building and writing the config.
+
+Usage::
+
+    python -m benchmarks.pipeline --tenants 2000 --page-size 50 --latency 0.02
+
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+
+from nginx.config.builder import NginxConfigBuilder
+from nginx.config.pipeline import generate
+from nginx.config.writer import ConfigWriter
+
+from .run import best_of
+
+
+class Source(object):
+    """ Stands in for an async database or API client, fetching rows a page at a time with each
+    page taking ``latency`` seconds to arrive.
+    """
+    def __init__(self, count, routes, page_size, latency):
+        self.rows = iter(range(count))
+        self.routes = routes
+        self.page_size = page_size
+        self.latency = latency
+        self.page = []
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.page:
+            await asyncio.sleep(self.latency)
+            self.page = [i for _, i in zip(range(self.page_size), self.rows)]
+            if not self.page:
+                raise StopAsyncIteration
+        i = self.page.pop(0)
+        return {
+            'hostname': 'tenant{0}.example.com'.format(i),
+            'listen': 443,
+            'routes': [('/service{0}'.format(j), {'proxy_pass': 'http://t{0}_{1}'.format(i, j)}) for j in range(self.routes)],
+        }
+
+
+async def materialized(source, directory):
+    specs = [spec async for spec in source]
+    nginx = NginxConfigBuilder()
+    for spec in specs:
+        nginx.add_server(**spec).end()
+    return ConfigWriter(directory).write(nginx._config())
+
+
+async def pipelined(source, directory):
+    return await generate(source, ConfigWriter(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=2000)
+    parser.add_argument('--routes', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    directories = []
+    baseline = None
+    for name, run in (('materialized', materialized), ('pipeline', pipelined)):
+        def setup():
+            # the previous run's files are removed before timing the next one
+            while directories:
+                shutil.rmtree(directories.pop())
+            directories.append(tempfile.mkdtemp())
+            return Source(args.tenants, args.routes, args.page_size, args.latency), directories[-1]
+
+        def generate_config(arg):
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(run(*arg))
+            finally:
+                loop.close()
+
+        elapsed = best_of(args.repeat, setup, generate_config)
+        baseline = baseline or elapsed
+        print('{0:<12} {1:.4f}s  {2:.1f}x'.format(name, elapsed, baseline / elapsed))
+    for directory in directories:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Runs the benchmark suite and optionally compares the results with a previous run.
+
+Usage::
+
+    python -m benchmarks.run --servers 1000 --output results.json
+    python -m benchmarks.run --servers 1000 --compare results.json --threshold 0.2
+
+Each benchmark reports the best time out of ``--repeat`` runs. When comparing, any timing or
+memory figure that got worse by more than the threshold is reported and the exit status is 1.
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+
+from nginx.config.api.render import RenderContext, render
+from nginx.config.parser import parse
+
+from .synthetic import build_blocks, build_with_builder, count_nodes
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+
+class _NullWriter(object):
+    def write(self, data):
+        pass
+
+
+def best_of(repeat, setup, func):
+    """ Returns the fastest of ``repeat`` runs of ``func(setup())``; setup is not timed. """
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        start = time.time()
+        func(arg)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure_memory(build, shape):
+    """ Returns the bytes allocated per node by building a config, or None without tracemalloc. """
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        config = build(**shape)
+        allocated = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return allocated / float(count_nodes(config))
+
+
+def run(shape, repeat):
+    def blocks():
+        return build_blocks(**shape)
+
+    config = blocks()
+    cold = RenderContext(use_cache=False)
+
+    timings = {
+        'build_blocks': best_of(repeat, lambda: None, lambda _: build_blocks(**shape)),
+        'build_builder': best_of(repeat, lambda: None, lambda _: build_with_builder(**shape)),
+        'render_cold': best_of(repeat, blocks, lambda config: render(config, cold)),
+        'render_stream': best_of(repeat, blocks, lambda config: config.render_to(_NullWriter())),
+        'render_builder': best_of(repeat, lambda: build_with_builder(**shape), repr),
+    }
+
+    text = repr(config)
+    timings['render_cached'] = best_of(repeat, lambda: config, repr)
+    timings['parse'] = best_of(repeat, lambda: text, parse)
+
+    memory = {
+        'bytes_per_node': measure_memory(build_blocks, shape),
+    }
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.time(),
+            'shape': shape,
+            'nodes': count_nodes(config),
+            'output_bytes': len(repr(config)),
+        },
+        'timings': timings,
+        'memory': memory,
+    }
+
+
+def compare(baseline, results, threshold, min_time=0.001):
+    """ Returns a description of every figure that regressed by more than ``threshold``.
+
+    Timings below ``min_time`` seconds in the baseline are too noisy to compare and are skipped.
+    """
+    regressions = []
+    if baseline['meta'].get('shape') != results['meta']['shape']:
+        regressions.append('config shape differs from the baseline, results are not comparable')
+        return regressions
+
+    for section in ('timings', 'memory'):
+        for name, value in sorted(results[section].items()):
+            old = baseline.get(section, {}).get(name)
+            if not old or value is None or (section == 'timings' and old < min_time):
+                continue
+            change = (value - old) / old
+            if change > threshold:
+                regressions.append('{0}.{1}: {2:.4g} -> {3:.4g} (+{4:.0%})'.format(section, name, old, value, change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', type=int, default=200)
+    parser.add_argument('--locations', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--options', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare results with this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown as a fraction (default: 0.25)')
+    parser.add_argument('--min-time', type=float, default=0.001, help='ignore baseline timings below this (default: 0.001)')
+    args = parser.parse_args(argv)
+
+    shape = dict(servers=args.servers, locations=args.locations, depth=args.depth, options=args.options)
+    results = run(shape, args.repeat)
+
+    print('{nodes} nodes, {output_bytes} bytes of output'.format(**results['meta']))
+    for name, value in sorted(results['timings'].items()):
+        print('{0:<16} {1:.4f}s'.format(name, value))
+    for name, value in sorted(results['memory'].items()):
+        if value is not None:
+            print('{0:<16} {1:.0f}'.format(name, value))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(json.load(fp), results, args.threshold, args.min_time)
+        if regressions:
+            print('\nRegressions against {0}:'.format(args.compare))
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print('\nNo regressions against {0}'.format(args.compare))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Compares the size and speed of the serialized forms of a config tree with pickle.
+
+Usage::
+
+    python -m benchmarks.serialize --servers 2000 --locations 10
+
+"""
+import argparse
+import json
+import pickle
+
+from nginx.config.serialize import from_bytes, from_dict, to_bytes, to_dict
+
+from .run import best_of
+from .synthetic import build_blocks
+
+
+FORMATS = [
+    ('pickle', lambda config: pickle.dumps(config, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    ('json', lambda config: json.dumps(to_dict(config)), lambda data: from_dict(json.loads(data))),
+    ('binary', to_bytes, from_bytes),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', type=int, default=2000)
+    parser.add_argument('--locations', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=1)
+    parser.add_argument('--options', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    config = build_blocks(servers=args.servers, locations=args.locations, depth=args.depth, options=args.options)
+    expected = repr(config)
+    for name, dump, load in FORMATS:
+        data = dump(config)
+        if repr(load(data)) != expected:
+            raise AssertionError('{0} round trip changed the config'.format(name))
+        dump_time = best_of(args.repeat, lambda: config, dump)
+        load_time = best_of(args.repeat, lambda: data, load)
+        print('{0:<8} {1:8.2f} MB  dump {2:.4f}s  load {3:.4f}s'.format(name, len(data) / 1e6, dump_time, load_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Generators for large synthetic configs.
+
+Every generator takes the same shape parameters:
+
+* ``servers``: number of server blocks
+* ``locations``: number of top-level locations per server
+* ``depth``: how many levels of locations to nest below each top-level location
+* ``options``: number of options set on each server and location
+
+"""
+from nginx.config.api import Block, Config, EmptyBlock, Location
+from nginx.config.builder import NginxConfigBuilder
+from nginx.config.builder.plugins import UWSGICacheRoutePlugin
+
+
+def location_options(server, location, options):
+    values = {
+        'proxy_pass': 'http://upstream{0}'.format(server),
+        'proxy_set_header': ['X-Location', str(location)],
+        'proxy_read_timeout': 30,
+        'proxy_buffering': False,
+    }
+    for i in range(len(values), options):
+        values['proxy_option{0}'.format(i)] = 'value{0}'.format(i)
+    return dict(list(values.items())[:options])
+
+
+def server_options(server, options):
+    values = {
+        'server_name': 'tenant{0}.example.com'.format(server),
+        'listen': 8000 + server % 1000,
+        'access_log': ['logs/tenant{0}.log'.format(server), 'combined'],
+    }
+    for i in range(len(values), options):
+        values['server_option{0}'.format(i)] = 'value{0}'.format(i)
+    return dict(list(values.items())[:options])
+
+
+def _location(server, path, depth, options):
+    location = Location(path, **location_options(server, path, options))
+    if depth:
+        location.sections.add(_location(server, path + '/nested', depth - 1, options))
+    return location
+
+
+def build_blocks(servers=100, locations=10, depth=1, options=4):
+    """ Builds a config with the block API. """
+    http = Block('http', include='../conf/mime.types')
+    for i in range(servers):
+        http.sections.add(Block(
+            'server',
+            *[_location(i, '/service{0}'.format(j), depth, options) for j in range(locations)],
+            **server_options(i, options)
+        ))
+
+    return Config(
+        EmptyBlock(worker_processes='auto', daemon='off', error_log='logs/error.log'),
+        Block('events', worker_connections=512),
+        http,
+    )
+
+
+def _add_routes(route, server, path, depth, options, cache):
+    with route.add_route(path, **location_options(server, path, options)) as nested:
+        if cache:
+            nested.cache_uwsgi_route(cache_valid={'200': '1m'})
+        if depth:
+            _add_routes(nested, server, path + '/nested', depth - 1, options, False)
+
+
+def build_with_builder(servers=100, locations=10, depth=1, options=4):
+    """ Builds a config through NginxConfigBuilder and its plugins.
+
+    Every top-level route is cached through :class:`UWSGICacheRoutePlugin`, so plugin dispatch is
+    exercised as well.
+    """
+    nginx = NginxConfigBuilder()
+    nginx.register_plugin(UWSGICacheRoutePlugin())
+    for i in range(servers):
+        kwargs = server_options(i, options)
+        hostname = kwargs.pop('server_name', '_')
+        with nginx.add_server(hostname=hostname, **kwargs) as server:
+            for j in range(locations):
+                _add_routes(server, i, '/service{0}'.format(j), depth, options, True)
+    return nginx
+
+
+def count_nodes(node):
+    """ Counts the blocks and options in a tree. """
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if node._is_block:
+            stack.extend(node._directives)
+    return count
@@ -0,0 +1,81 @@
+"""
+Compares building and rendering many similar servers from a template with building full trees.
+
+Usage::
+
+    python -m benchmarks.templates --tenants 10000
+
+"""
+import argparse
+
+from nginx.config.api import Block, Location
+from nginx.config.builder import NginxConfigBuilder
+from nginx.config.templates import Template, placeholder
+
+from .run import best_of
+
+
+def server_options(hostname, port, upstream):
+    return dict(
+        listen=[port, 'ssl'],
+        ssl_certificate='/etc/ssl/{0}.crt'.format(hostname),
+        ssl_certificate_key='/etc/ssl/{0}.key'.format(hostname),
+        access_log=['logs/{0}.log'.format(hostname), 'combined'],
+        client_max_body_size='10m',
+        keepalive_timeout=30,
+    )
+
+
+def locations(upstream):
+    return [
+        Location('/', proxy_pass='http://{0}'.format(upstream), proxy_read_timeout=30, proxy_buffering=False),
+        Location('/static', root='/srv/static', expires='1d', gzip_static='on'),
+        Location('/health', access_log='off', return_='200 ok'),
+        Location('= /favicon.ico', log_not_found='off', access_log='off'),
+    ]
+
+
+def tenants(count):
+    return [('tenant{0}.example.com'.format(i), 8000 + i % 1000, 'backend{0}'.format(i % 50)) for i in range(count)]
+
+
+def full_trees(rows):
+    nginx = NginxConfigBuilder()
+    for hostname, port, upstream in rows:
+        server = nginx.add_server(hostname=hostname, **server_options(hostname, port, upstream))
+        server.current_obj.sections.extend(locations(upstream))
+        server.end()
+    return repr(nginx)
+
+
+def from_template(rows):
+    template = Template(Block(
+        'server',
+        *locations(placeholder('upstream')),
+        server_name=placeholder('hostname'),
+        **server_options(placeholder('hostname'), placeholder('port'), placeholder('upstream'))
+    ))
+    nginx = NginxConfigBuilder()
+    for hostname, port, upstream in rows:
+        nginx.add_server(hostname=hostname, port=port, upstream=upstream, template=template).end()
+    return repr(nginx)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tenants', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = tenants(args.tenants)
+    if full_trees(rows) != from_template(rows):
+        raise AssertionError('the template renders differently')
+    baseline = None
+    for name, build in (('full trees', full_trees), ('template', from_template)):
+        elapsed = best_of(args.repeat, lambda: rows, build)
+        baseline = baseline or elapsed
+        print('{0:<12} {1:.4f}s  {2:.1f}x'.format(name, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
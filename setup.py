@@ -3,6 +3,8 @@ import setuptools
 import subprocess
 import sys
 
+from setuptools.command.build_py import build_py
+
 
 requirements = [
     'six>=1.10.0',
@@ -13,8 +15,25 @@ extras = {}
 if int(setuptools.__version__.split(".", 1)[0]) < 18:
     if sys.version_info[0:2] < (3, 3):
         requirements.append("enum34==1.1.6")
+    if sys.version_info[0:2] < (3, 2):
+        requirements.append("futures>=3.0.0")
 else:
     extras[":python_version<'3.3'"] = ["enum34"]
+    extras[":python_version<'3.2'"] = ["futures>=3.0.0"]
+
+
+# modules using syntax that Python 2 can't compile, left out of Python 2 installs
+PY3_ONLY = [
+    ('nginx.config', 'pipeline'),
+]
+
+
+class BuildPy(build_py):
+    def find_package_modules(self, package, package_dir):
+        modules = build_py.find_package_modules(self, package, package_dir)
+        if sys.version_info[0] < 3:
+            modules = [module for module in modules if module[:2] not in PY3_ONLY]
+        return modules
 
 
 class Venv(setuptools.Command):
@@ -72,5 +91,5 @@ setuptools.setup(
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
     ],
-    cmdclass={'venv': Venv},
+    cmdclass={'build_py': BuildPy, 'venv': Venv},
 )
@@ -45,7 +45,7 @@ Example::
 
 """
 from .blocks import EmptyBlock, Block, Location
-from .options import Comment, KeyOption, KeyValueOption, KeyMultiValueOption
+from .options import Comment, Fragment, KeyOption, KeyValueOption, KeyMultiValueOption
 
 __all__ = [
     'EmptyBlock',
@@ -56,6 +56,7 @@ __all__ = [
     'KeyValueMultilines',
     'KeyMultiValueOption',
     'Comment',
+    'Fragment',
     'Config',
     'Section'
 ]
@@ -1,9 +1,55 @@
+import weakref
+
+from .fingerprint import fingerprint
+from .render import iter_lines, render
+
+
+# slots that are not pickled, either because pickle handles them itself or because they only make
+# sense within the tree an object currently lives in
+_UNPICKLED_SLOTS = ('__dict__', '__weakref__', '_parent_ref', '_render_cache', '_fingerprint')
+_state_slots_cache = {}
+# the parents of an object placed in several blocks, see Base._parents
+_Parents = weakref.WeakValueDictionary
+
+
+def _state_slots(cls):
+    """ Returns the names of the slots of a class that should be pickled. """
+    try:
+        return _state_slots_cache[cls]
+    except KeyError:
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name in getattr(klass, '__slots__', ()):
+                if name not in _UNPICKLED_SLOTS and name not in names:
+                    names.append(name)
+        _state_slots_cache[cls] = names
+        return names
+
+
 class Base(object):
-    """ This is the base class for all blocks and options. """
-    _indent_level = 0
+    """ This is the base class for all blocks and options.
+
+    Blocks and options use ``__slots__`` to keep large trees small, and children only hold a weak
+    reference to their parent so that trees contain no reference cycles and are freed as soon as
+    they are no longer used.
+    """
+    __slots__ = ('_parent_ref',)
+
     _indent_char = ' '
     _indent = 4
-    _parent = None
+    _is_block = False
+    _is_fragment = False
+
+    @property
+    def _indent_level(self):
+        """ Always 0: the level a node is rendered at comes from the render context. """
+        return 0
+
+    @_indent_level.setter
+    def _indent_level(self, value):
+        # nodes no longer keep their level, so setting it is accepted and ignored; pass
+        # RenderContext(indent_level=...) to render at another level
+        pass
 
     def _get_indent(self):
         return self._indent_char * self._indent * self._indent_level
@@ -14,9 +60,128 @@ class Base(object):
             indent=self._get_indent()
         )
 
+    def _lines(self):
+        """ Returns the unindented text of each line this object renders to. """
+        return []
+
+    def iter_lines(self, context=None):
+        """ Lazily renders this object, yielding one indented line (or cached block) at a time.
+
+        Chunks are yielded without their leading newline, so ``repr(obj)`` is equivalent to
+        ``''.join('\\n' + line for line in obj.iter_lines())``.
+
+        :param nginx.config.api.render.RenderContext context: render options (default: derived from this object)
+        :rtype: iterator of str
+        """
+        return iter_lines(self, context)
+
+    def render_to(self, fp, context=None):
+        """ Writes the rendered config to a file-like object line by line.
+
+        Nothing larger than a single line is built in memory, so this is the preferred way
+        to write out very large configs.
+
+        :param fp: any object with a ``write`` method accepting str
+        :param nginx.config.api.render.RenderContext context: render options (default: derived from this object)
+        """
+        for line in self.iter_lines(context):
+            fp.write('\n' + line)
+
+    @property
+    def fingerprint(self):
+        """ A hash of the content of this object, equal for objects that render the same.
+
+        See :mod:`nginx.config.api.fingerprint`.
+
+        :rtype: str
+        """
+        return fingerprint(self)
+
+    def __repr__(self):
+        return render(self)
+
+    def __getstate__(self):
+        # Parents are restored by the containers holding this object when they are unpickled,
+        # so pickling a subtree doesn't drag the rest of the tree along with it.
+        state = dict(
+            (name, getattr(self, name)) for name in _state_slots(self.__class__) if hasattr(self, name)
+        )
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __str__(self):
         return str(self.__repr__())
 
+    # A node is usually placed in a single block, which _parent_ref weakly refers to. A node placed
+    # in several blocks at once (such as the shared groups of nginx.config.common) holds a
+    # WeakValueDictionary of all of them by id instead, so that changing it reaches every tree it
+    # renders in, and adding it to many blocks stays cheap.
+
+    def _parents(self):
+        """ Returns every block this object is placed in. """
+        ref = getattr(self, '_parent_ref', None)
+        if ref is None:
+            return []
+        if type(ref) is _Parents:
+            return list(ref.values())
+        parent = ref()
+        return [parent] if parent is not None else []
+
+    def _add_parent(self, ref):
+        """ Records that this object is placed in the block a weak reference points to, in addition
+        to the blocks it is already in.
+        """
+        current = getattr(self, '_parent_ref', None)
+        if current is None or current is ref:
+            self._parent_ref = ref
+            return
+        parent = ref()
+        if type(current) is not _Parents:
+            previous = current()
+            if previous is None or previous is parent:
+                self._parent_ref = ref
+                return
+            current = self._parent_ref = _Parents()
+            current[id(previous)] = previous
+        # the block added last comes last
+        current.pop(id(parent), None)
+        current[id(parent)] = parent
+
+    def _remove_parent(self, parent):
+        """ Forgets that this object is placed in a block it was taken out of. """
+        current = getattr(self, '_parent_ref', None)
+        if type(current) is _Parents:
+            current.pop(id(parent), None)
+        elif current is not None and current() in (parent, None):
+            self._parent_ref = None
+
+    def _get_parent(self):
+        # the block this object was last placed in
+        ref = getattr(self, '_parent_ref', None)
+        if type(ref) is _Parents:
+            parents = list(ref.values())
+            return parents[-1] if parents else None
+        return ref() if ref is not None else None
+
+    def _set_parent(self, parent):
+        if parent is None:
+            self._parent_ref = None
+        else:
+            self._add_parent(weakref.ref(parent))
+
+    _parent = property(_get_parent, _set_parent)
+
+    def _changed(self):
+        """ Tells the blocks holding this object that it was modified, as if it had been taken out
+        and put back in.
+        """
+        for parent in self._parents():
+            parent._invalidate(added=(self,), removed=(self,))
+
     @property
     def parent(self):
         return self._parent
@@ -1,7 +1,13 @@
-import six
+import weakref
 
-from .base import Base
-from .options import AttrDict, AttrList, KeyOption, KeyValueOption, KeyMultiValueOption
+from .base import Base, _Parents
+from .options import AttrList, OptionDict, KeyOption, KeyValueOption, KeyMultiValueOption
+
+
+# block -> observers notified of changes anywhere below that block, see Block.add_observer
+_observers = weakref.WeakKeyDictionary()
+# block made by Block.clone -> the block it was cloned from
+_origins = weakref.WeakKeyDictionary()
 
 
 class Block(Base):
@@ -22,6 +28,11 @@ class Block(Base):
 
 
     """
+    __slots__ = ('name', 'sections', 'options', '_render_cache', '_fingerprint', '__weakref__')
+
+    _is_block = True
+    _opens_scope = True
+
     def __init__(self, name, *sections, **options):
         """ Creates a block.
 
@@ -32,20 +43,174 @@ class Block(Base):
         """
         self.name = name
         self.sections = AttrList(self)
-        self.options = AttrDict(self)
+        self.options = OptionDict(self)
+        self._render_cache = None
+        self._fingerprint = None
 
         self._set_directives(*sections, **options)
 
     @property
     def _directives(self):
-        dirs = self._dump_options() + list(self.sections)
-        return [directive for directive in dirs if directive is not self]
+        return self._dump_options() + list(self.sections)
+
+    def _invalidate(self, added=(), removed=(), options=()):
+        """ Discards the cached render and fingerprint of this block and of every block above it,
+        and lets any observers of those blocks know what changed.
+
+        :param added: sections that were added to this block
+        :param removed: sections that were removed from this block
+        :param options: names of options of this block that were set or removed
+        """
+        node = self
+        pending = seen = None
+        while node is not None:
+            node._render_cache = None
+            node._fingerprint = None
+            if _observers:
+                for observer in _observers.get(node, ()):
+                    observer.block_changed(self, added, removed, options)
+            ref = getattr(node, '_parent_ref', None)
+            if seen is None and type(ref) is not _Parents:
+                node = ref() if ref is not None else None
+                continue
+            # past a block placed in several others, every way up is followed, reaching each block once
+            if seen is None:
+                seen, pending = set([id(node)]), []
+            pending.extend(node._parents())
+            node = None
+            while pending and node is None:
+                node = pending.pop()
+                if id(node) in seen:
+                    node = None
+            if node is not None:
+                seen.add(id(node))
+
+    def add_observer(self, observer):
+        """ Registers an object to be told about every change to this block or anything below it.
+
+        The observer's ``block_changed(block, added, removed, options)`` method is called with the
+        block that was modified, the sections added to and removed from it, and the names of any
+        of its options that were set or deleted. Observers are held until this block is freed or
+        :meth:`remove_observer` is called.
+        """
+        _observers.setdefault(self, []).append(observer)
+
+    def remove_observer(self, observer):
+        """ Stops notifying an observer registered with :meth:`add_observer`. """
+        observers = _observers.get(self, [])
+        if observer in observers:
+            observers.remove(observer)
+        if not observers:
+            _observers.pop(self, None)
+
+    def clone(self):
+        """ Returns a copy of this block that shares its sections and options with it.
+
+        Only the block itself is copied, so cloning takes time proportional to the number of its
+        sections, not to the size of the tree below it. The sections of the copy are the original
+        sections, so they must not be modified directly: :meth:`edit` gives a private copy of any
+        block in the clone to modify, copying only the blocks on the path to it. The original tree
+        should not be modified while its clones are in use, as the changes would show in them too.
+
+        Example::
+
+            >>> production = Block('http', Block('server', Location('/', proxy_pass='http://prod')))
+            >>> canary = production.clone()
+            >>> location = canary.edit(production.sections.server.sections['location /'])
+            >>> location.options.proxy_pass = 'http://canary'
+            >>> production.sections.server.sections['location /'].options.proxy_pass
+            'http://prod'
+
+        :rtype: Block
+        """
+        copy = self.__class__.__new__(self.__class__)
+        if self._opens_scope:
+            copy.name = self.name
+        copy.sections = self.sections._clone(copy)
+        copy.options = self.options._clone(copy)
+        # the copy renders exactly like the original until it is modified
+        copy._render_cache = self._render_cache
+        copy._fingerprint = self._fingerprint
+        _origins[copy] = self
+        return copy
+
+    def edit(self, node):
+        """ Returns a copy of a block of this tree that can be modified without changing any
+        other tree sharing it, see :meth:`clone`.
+
+        ``node`` can be found through this tree, or be the block at the same place in the tree this
+        one was cloned from. The node and every block above it that is still shared are cloned,
+        and replace the shared blocks in this tree; blocks that were already copied are reused,
+        so editing the same node twice returns the same block.
+
+        :param Block node: block to edit
+        :rtype: Block
+        """
+        # the node's ancestors, up to where it meets this block or one of the blocks it was cloned from
+        sources = set()
+        source = self
+        while source is not None:
+            sources.add(id(source))
+            source = _origins.get(source)
+        # a node placed in several blocks has several ways up, only some of which may lead here
+        stack = [(node, [])]
+        visited = set()
+        current = None
+        while stack:
+            current, chain = stack.pop()
+            if id(current) in sources:
+                break
+            if id(current) not in visited:
+                visited.add(id(current))
+                stack.extend((parent, chain + [current]) for parent in current._parents())
+            current = None
+        if current is None:
+            raise ValueError('{0!r} is not part of this tree'.format(getattr(node, 'name', node)))
+        if current is self:
+            # every block on the way up belongs to this tree, so the node is already private to it
+            return node
+
+        block = self
+        for original in reversed(chain):
+            block = block._edit_child(original)
+        return block
+
+    def _edit_child(self, original):
+        """ Returns this block's own copy of one of its sections or option values. """
+        option_keys = dict((id(value), key) for key, value in self.options.items() if isinstance(value, Block))
+        for child in list(self.sections) + [self.options[key] for key in option_keys.values()]:
+            if not isinstance(child, Block):
+                continue
+            # the child is the original, or was cloned from it
+            source = child
+            while source is not None and source is not original:
+                source = _origins.get(source)
+            if source is None:
+                continue
+            if any(parent is self for parent in child._parents()):
+                return child
+            copy = child.clone()
+            if id(child) in option_keys:
+                self.options[option_keys[id(child)]] = copy
+            else:
+                self.sections._replace(child, copy)
+            return copy
+        raise ValueError('{0!r} is not part of this tree'.format(getattr(original, 'name', original)))
+
+    def _holds(self, node):
+        """ Tells whether an object is one of the sections or option values of this block. """
+        return any(section is node for section in self.sections) or any(value is node for value in self.options.values())
+
+    def __setstate__(self, state):
+        self._render_cache = None
+        self._fingerprint = None
+        super(Block, self).__setstate__(state)
 
     def _set_directives(self, *sections, **options):
         for section in sections:
             self.sections.append(section)
-        for key, value in six.iteritems(options):
-            setattr(self.options, key, value)
+        if options:
+            self.options.update(options)
 
     def _build_options(self, key, value):
         if isinstance(value, Block):
@@ -62,20 +227,7 @@ class Block(Base):
         return option
 
     def _dump_options(self):
-        return [self._build_options(key, value) for key, value in six.iteritems(self.options)]
-
-    def __repr__(self):
-        directives = self._directives
-
-        for directive in directives:
-            if directive is not self:
-                directive._indent_level = self._indent_level + 1
-
-        return '\n{indent}{name}{{{directives}\n{indent}}}'.format(
-            name='{0} '.format(self.name),
-            directives=''.join([repr(e) for e in directives]),
-            indent=self._get_indent(),
-        )
+        return self.options.prepared()
 
 
 class EmptyBlock(Block):
@@ -99,23 +251,23 @@ class EmptyBlock(Block):
 
 
     """
+    __slots__ = ()
+
+    _opens_scope = False
+
     def __init__(self, *sections, **options):
         """ Create an EmptyBlock. """
         self.sections = AttrList(self)
-        self.options = AttrDict(self)
+        self.options = OptionDict(self)
+        self._render_cache = None
+        self._fingerprint = None
 
         self._set_directives(*sections, **options)
 
-    def __repr__(self):
-        directives = self._directives
-
-        for directive in directives:
-            directive._indent_level = self._indent_level
-
-        return ''.join([repr(o) for o in directives])
-
 
 class Location(Block):
     """ A Location is just a named block with "location" prefixed """
+    __slots__ = ()
+
     def __init__(self, location, *args, **kwargs):
         super(Location, self).__init__('location {0}'.format(location), *args, **kwargs)
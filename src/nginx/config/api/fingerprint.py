@@ -0,0 +1,70 @@
+"""
+Content fingerprints of blocks and options.
+
+A fingerprint is a hash of everything a node renders to, except indentation: the text of an
+option, or the name of a block along with the fingerprints of its directives. Two nodes with the
+same fingerprint render to the same text, so comparing fingerprints answers "are these identical?"
+without rendering either, and a fingerprint taken before and after some changes tells whether
+anything changed. Fingerprints are stable across processes, so they can key external caches.
+
+Blocks cache their fingerprint until they or anything below them is modified, so it is only
+recomputed along the modified path (see :meth:`nginx.config.api.Block._invalidate`).
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> a = Block('server', Location('/'), server_name='a.com')
+    >>> b = Block('server', Location('/'), server_name='a.com')
+    >>> a.fingerprint == b.fingerprint
+    True
+    >>> b.options.server_name = 'b.com'
+    >>> a.fingerprint == b.fingerprint
+    False
+
+"""
+import hashlib
+
+
+def _option_fingerprint(node):
+    return hashlib.sha1(('L' + '\n'.join(node._lines())).encode('utf-8')).hexdigest()
+
+
+def _block_fingerprint(node, directives, fingerprints):
+    if not node._opens_scope and len(directives) == 1 and directives[0]._is_block:
+        # an unnamed block around a single block renders exactly like it
+        return fingerprints[0]
+    digest = hashlib.sha1()
+    digest.update(('S' + node.name if node._opens_scope else 'E').encode('utf-8'))
+    for child in fingerprints:
+        digest.update(b'\0' + child.encode('ascii'))
+    return digest.hexdigest()
+
+
+def fingerprint(node):
+    """ Returns the fingerprint of a block or option, as a hex string.
+
+    :param nginx.config.api.base.Base node: block or option
+    :rtype: str
+    """
+    if not node._is_block:
+        return _option_fingerprint(node)
+    if node._fingerprint is not None:
+        return node._fingerprint
+
+    # (block, directives) entries; a block's directives are all fingerprinted before the block
+    stack = [(node, None)]
+    while stack:
+        block, directives = stack.pop()
+        if directives is None:
+            if block._fingerprint is not None:
+                continue
+            directives = block._directives
+            stack.append((block, directives))
+            stack.extend((child, None) for child in directives if child._is_block and child._fingerprint is None)
+            continue
+        fingerprints = [
+            child._fingerprint if child._is_block else _option_fingerprint(child)
+            for child in directives
+        ]
+        block._fingerprint = _block_fingerprint(block, directives, fingerprints)
+    return node._fingerprint
@@ -1,4 +1,30 @@
+import operator
+import weakref
+
+import six
+
 from .base import Base
+from .render import RenderContext, iter_lines
+
+
+def _attribute(slot):
+    """ Returns a property for an attribute of an option kept in a slot, marking the blocks holding
+    the option as changed when it is set.
+    """
+    def set_value(self, value):
+        setattr(self, slot, value)
+        self._changed()
+
+    return property(operator.attrgetter(slot), set_value)
+
+
+def _detach(owner, nodes):
+    """ Forgets that a block holds objects taken out of it, unless they are still in it elsewhere. """
+    if owner is None:
+        return
+    for node in nodes:
+        if isinstance(node, Base) and not owner._holds(node):
+            node._remove_parent(owner)
 
 
 class KeyOption(Base):
@@ -7,37 +33,38 @@ class KeyOption(Base):
     For example: http://nginx.org/en/docs/http/ngx_http_core_module.html#internal
 
     """
+    __slots__ = ('_name', '_value')
+
+    name = _attribute('_name')
+    value = _attribute('_value')
+
     def __init__(self, name):
-        self.name = self.value = name
+        self._name = self._value = name
 
-    def __repr__(self):
-        return self._render(
-            '{name};'.format(
-                name=self.name,
-            )
-        )
+    def _lines(self):
+        return ['{name};'.format(name=self._name)]
 
 
 class KeyValueOption(Base):
     """ A key/value directive. This covers most directives available for Nginx """
+    __slots__ = ('_name', '_value')
+
+    name = _attribute('_name')
+    value = _attribute('_value')
+
     def __init__(self, name, value=''):
-        self.name = name
+        self._name = name
         if isinstance(value, bool):
-            self.value = 'off' if value is False else 'on'
+            self._value = 'off' if value is False else 'on'
         elif isinstance(value, int):
-            self.value = str(value)
+            self._value = str(value)
         elif isinstance(value, list):
-            self.value = [str(e) for e in value]
+            self._value = [str(e) for e in value]
         else:
-            self.value = value
+            self._value = value
 
-    def __repr__(self):
-        return self._render(
-            '{name} {value};'.format(
-                name=self.name,
-                value=self.value
-            )
-        )
+    def _lines(self):
+        return ['{name} {value};'.format(name=self._name, value=self._value)]
 
 
 class KeyMultiValueOption(KeyValueOption):
@@ -54,85 +81,590 @@ class KeyMultiValueOption(KeyValueOption):
         access_log /path/to/log.gz combined gzip flush=5m;
 
     """
-    def __repr__(self):
-        return self._render(
-            '{name} {value};'.format(
-                name=self.name,
-                value=' '.join(self.value)
-            )
-        )
+    __slots__ = ()
+
+    def _lines(self):
+        return ['{name} {value};'.format(name=self._name, value=' '.join(self._value))]
 
 
 class KeyValuesMultiLines(Base):
+    __slots__ = ('_name', '_texts')
+
+    name = _attribute('_name')
+    lines = _attribute('_texts')
+
     def __init__(self, name, values=[]):
-        self.name = name
-        self.lines = []
+        self._name = name
+        self._texts = []
         for value in values:
             if isinstance(value, list):
-                self.lines.append(' '.join([str(v) for v in value]))
+                self._texts.append(' '.join([str(v) for v in value]))
             else:
-                self.lines.append(str(value))
+                self._texts.append(str(value))
 
-    def __repr__(self):
-        return ''.join(
-            [self._render('{name} {value};'.format(name=self.name, value=line)) for line in self.lines]
-        )
+    def _lines(self):
+        return ['{name} {value};'.format(name=self._name, value=line) for line in self._texts]
 
 
 class Comment(Base):
     """ A simple comment object. """
-
-    _offset = ''
-    _comment = ''
+    __slots__ = ('_offset', '_comment')
 
     def __init__(self, offset='', comment='', **kwargs):
         self._offset = offset
         self._comment = comment
         super(Comment, self).__init__(**kwargs)
 
-    def __repr__(self):
-        return self._render(
-            '{offset}# {comment}'.format(
-                offset=self._offset,
-                comment=self._comment,
-            )
-        )
+    def _lines(self):
+        return ['{offset}# {comment}'.format(offset=self._offset, comment=self._comment)]
+
+
+class Fragment(Base):
+    """ Config text embedded verbatim.
+
+    A fragment holds text that is already rendered, split into lines along with how deeply each
+    line is nested. Rendering it only indents those lines to wherever it is placed, and the result
+    is cached for each indentation, so embedding a fragment costs the same however many directives
+    it holds. Fragments can't be modified and don't keep track of where they are placed, so a
+    single fragment can be embedded in any number of blocks.
+
+    Example::
+
+        >>> from nginx.config.api import Block, EmptyBlock, Fragment
+        >>> gzip = Fragment.freeze(EmptyBlock(gzip='on', gzip_comp_level=2))
+        >>> print(Block('server', gzip, Block('location /', gzip)))
+
+        server {
+            gzip on;
+            gzip_comp_level 2;
+            location / {
+                gzip on;
+                gzip_comp_level 2;
+            }
+        }
+
+    :param str text: config text; every line is kept as it is, including its own indentation
+    """
+    __slots__ = ('_nested', '_chunks')
+
+    _is_fragment = True
+
+    def __init__(self, text=''):
+        self._nested = tuple((0, line.rstrip()) for line in text.strip('\n').split('\n')) if text.strip() else ()
+        self._chunks = {}
+
+    @classmethod
+    def freeze(cls, node):
+        """ Creates a fragment rendering like a block or option does now.
+
+        Later changes to the node don't show in the fragment.
+
+        :param nginx.config.api.base.Base node: block or option to freeze
+        :rtype: Fragment
+        """
+        # indenting with a character that can't appear in a directive tells how deep each line is
+        context = RenderContext(indent_char='\0', indent=1, use_cache=False, fill_cache=False)
+        nested = []
+        for chunk in iter_lines(node, context):
+            for line in chunk.split('\n'):
+                text = line.lstrip('\0')
+                nested.append((len(line) - len(text), text))
+        return cls._from_nested(nested)
+
+    @classmethod
+    def _from_nested(cls, nested):
+        fragment = cls.__new__(cls)
+        fragment._nested = tuple((depth, text) for depth, text in nested)
+        fragment._chunks = {}
+        return fragment
+
+    # a fragment can be in many places at once, so it has no parent
+    _parent = property(lambda self: None, lambda self, parent: None)
+
+    def _add_parent(self, ref):
+        pass
+
+    def _remove_parent(self, parent):
+        pass
+
+    def _lines(self):
+        unit = self._indent_char * self._indent
+        return [unit * depth + text if text else '' for depth, text in self._nested]
+
+    def _chunk(self, context, level):
+        """ Returns the text of the fragment indented for ``level``, formatted like a chunk from
+        :func:`nginx.config.api.render.iter_lines`.
+        """
+        key = (context.cache_key, level)
+        try:
+            return self._chunks[key]
+        except KeyError:
+            get_indent = context.get_indent
+            chunk = self._chunks[key] = '\n'.join([
+                get_indent(level + depth) + text if text else '' for depth, text in self._nested
+            ])
+            return chunk
+
+    def __getstate__(self):
+        return {'_nested': self._nested}
+
+    def __setstate__(self, state):
+        self._nested = state['_nested']
+        self._chunks = {}
 
 
 class AttrDict(dict):
-    """ A dictionary that exposes it's values as attributes. """
+    """ A dictionary that exposes it's values as attributes.
+
+    Any modification marks the owning block (and its parents) as changed, so that they get
+    rendered again instead of reusing their cached text. The owner is only weakly referenced,
+    so a block and its options don't keep each other alive.
+    """
+    __slots__ = ('_owner_ref',)
+
     def __init__(self, owner):
-        self.__dict__ = self
-        self._owner = owner
+        object.__setattr__(self, '_owner_ref', weakref.ref(owner))
 
-    def __setitem__(self, key, val):
+    @property
+    def _owner(self):
+        return self._owner_ref()
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def _store(self, key, val, owner):
+        old = dict.get(self, key)
         if hasattr(val, '_parent'):
-            val._parent = self._owner
-        return super(AttrDict, self).__setitem__(key, val)
+            val._parent = owner
+        dict.__setitem__(self, key, val)
+        if isinstance(old, Base) and old is not val:
+            _detach(owner, (old,))
 
-    def __repr__(self):
-        owner = self.pop('_owner')
-        ret = super(AttrDict, self).__repr__()
-        self._owner = owner
+    def __setitem__(self, key, val):
+        self._store(key, val, self._owner)
+        self._changed((key,))
+
+    def __setattr__(self, key, val):
+        self[key] = val
+
+    def _changed(self, keys):
+        owner = self._owner
+        if owner is not None:
+            owner._invalidate(options=keys)
+
+    def __delitem__(self, key):
+        old = self[key]
+        super(AttrDict, self).__delitem__(key)
+        _detach(self._owner, (old,))
+        self._changed((key,))
+
+    def __delattr__(self, key):
+        try:
+            del self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def pop(self, *args):
+        ret = super(AttrDict, self).pop(*args)
+        _detach(self._owner, (ret,))
+        self._changed(args[:1])
         return ret
 
+    def popitem(self):
+        ret = super(AttrDict, self).popitem()
+        _detach(self._owner, ret[1:])
+        self._changed(ret[:1])
+        return ret
 
-class AttrList(AttrDict):
-    """ A dictionary/list hybrid that exposes values as attributes. """
-    def __iter__(self):
-        return iter(self.values())
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        """ Sets several values at once, marking the owner as changed only once. """
+        items = list(six.iteritems(dict(*args, **kwargs)))
+        if not items:
+            return
+        owner = self._owner
+        for key, val in items:
+            self._store(key, val, owner)
+        self._changed([key for key, _ in items])
+
+    def clear(self):
+        keys = list(self.keys())
+        values = list(self.values())
+        super(AttrDict, self).clear()
+        _detach(self._owner, values)
+        self._changed(keys)
+
+    def __reduce__(self):
+        return (self.__class__, (self._owner,), None, None, iter(list(six.iteritems(self))))
+
+
+class OptionList(list):
+    """ The list value of a block option, marking the block as changed when it is modified in place.
+
+    Lists are copied into an OptionList when they are set as an option, so it is the list held by
+    the options that is to be modified, not the one that was assigned.
+    """
+    __slots__ = ('_owner_ref', '_key')
+
+    def __init__(self, items, owner_ref, key):
+        list.__init__(self, items)
+        self._owner_ref = owner_ref
+        self._key = key
+
+    def _changed(self, added=None):
+        owner = self._owner_ref()
+        # a list that was replaced or removed isn't part of the config anymore
+        if owner is not None and dict.get(owner.options, self._key) is self:
+            owner.options._list_changed(self._key, added)
 
     def append(self, item):
-        if hasattr(item, '_parent'):
-            item._parent = self._owner
-        if hasattr(item, 'name'):
-            self[item.name] = item
+        list.append(self, item)
+        self._changed((item,))
+
+    def extend(self, items):
+        items = list(items)
+        list.extend(self, items)
+        self._changed(items)
+
+    def __iadd__(self, items):
+        self.extend(items)
+        return self
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+def _mutator(name):
+    method = getattr(list, name)
+
+    def mutate(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._changed()
+        return result
+
+    mutate.__name__ = name
+    return mutate
+
+
+for _name in ('insert', 'remove', 'pop', 'clear', 'sort', 'reverse', '__setitem__', '__delitem__', '__imul__',
+              '__setslice__', '__delslice__'):
+    if hasattr(list, _name):
+        setattr(OptionList, _name, _mutator(_name))
+del _name
+
+
+class OptionDict(AttrDict):
+    """ The options of a block.
+
+    Values are kept as they were assigned, except for lists which are copied into an
+    :class:`OptionList`. The option objects they render as (see
+    :meth:`nginx.config.api.blocks.Block._build_options`) are built as soon as an option is set
+    and kept until it changes, so rendering only reads them. Items appended to a list option are
+    converted and added to its option object, rather than building it again.
+    """
+    __slots__ = ('_prepared',)
+
+    def __init__(self, owner):
+        super(OptionDict, self).__init__(owner)
+        object.__setattr__(self, '_prepared', ())
+
+    def _store(self, key, val, owner):
+        if isinstance(val, list):
+            val = OptionList(val, self._owner_ref, key)
+        super(OptionDict, self)._store(key, val, owner)
+
+    def _changed(self, keys):
+        self._prepare(keys)
+        super(OptionDict, self)._changed(keys)
+
+    def _prepare(self, keys):
+        """ Builds the option objects of the given options again, keeping those of the others. """
+        owner = self._owner
+        if owner is None:
+            return
+        build = owner._build_options
+        kept = dict((option._name, option) for option in self._prepared if not option._is_block)
+        for key in keys:
+            kept.pop(key, None)
+        prepared = []
+        for key, val in six.iteritems(self):
+            option = kept.get(key)
+            prepared.append(build(key, val) if option is None else option)
+        object.__setattr__(self, '_prepared', tuple(prepared))
+
+    def _list_changed(self, key, added):
+        """ Updates the option object of a list option changed in place.
+
+        :param added: items appended to the list, or None if it was changed in any other way
+        """
+        if added is not None:
+            for option in self._prepared:
+                if type(option) is KeyMultiValueOption and option._name == key:
+                    option._value.extend([str(item) for item in added])
+                    super(OptionDict, self)._changed((key,))
+                    return
+        self._changed((key,))
+
+    def _restore(self, items):
+        """ Sets options along with the option objects they are rendered with, as returned by
+        :meth:`prepared`, instead of building those again. Used to rebuild trees in bulk.
+
+        :param items: (key, value, option object) triples
+        """
+        owner_ref = self._owner_ref
+        store = dict.__setitem__
+        for key, val, _ in items:
+            if isinstance(val, Base):
+                val._add_parent(owner_ref)
+            elif isinstance(val, list):
+                val = OptionList(val, owner_ref, key)
+            store(self, key, val)
+        options = dict((key, option) for key, _, option in items)
+        object.__setattr__(self, '_prepared', tuple(options[key] for key in self))
+        super(OptionDict, self)._changed([key for key, _, _ in items])
+
+    def _clone(self, owner):
+        """ Returns a copy of these options for another block, sharing the values and option objects. """
+        options = OptionDict(owner)
+        dict.update(options, self)
+        object.__setattr__(options, '_prepared', self._prepared)
+        # lists changed through the copy must change the copy only
+        keys = [key for key, val in six.iteritems(self) if isinstance(val, OptionList)]
+        for key in keys:
+            dict.__setitem__(options, key, OptionList(self[key], options._owner_ref, key))
+        if keys:
+            options._prepare(keys)
+        return options
+
+    def prepared(self):
+        """ Returns the option objects for every option. """
+        return list(self._prepared)
+
+
+class AttrList(object):
+    """ An ordered multi-map of the sections of a block, exposing them as attributes.
+
+    Sections are kept in the order they were added, including any number of sections with the
+    same name (such as several ``server`` blocks). Looking a name up, by item or by attribute,
+    returns the first section with that name in constant time; :meth:`getall` returns all of them.
+
+    Example::
+
+        >>> from nginx.config.api import Block
+        >>> http = Block('http', Block('server', listen=80), Block('server', listen=443))
+        >>> len(http.sections), http.sections.server.options.listen
+        (2, 80)
+        >>> [server.options.listen for server in http.sections.getall('server')]
+        [80, 443]
+
+    """
+    __slots__ = ('_owner_ref', '_items', '_index')
+
+    def __init__(self, owner):
+        object.__setattr__(self, '_owner_ref', weakref.ref(owner))
+        # Most blocks are leaves, so the containers are only created once something is added.
+        # _index maps name -> the section with that name, or a list of them once a name is reused.
+        object.__setattr__(self, '_items', ())
+        object.__setattr__(self, '_index', None)
+
+    @property
+    def _owner(self):
+        return self._owner_ref()
+
+    def _changed(self, added=(), removed=()):
+        owner = self._owner
+        if owner is not None:
+            owner._invalidate(added=added, removed=removed)
+
+    def _add_to_index(self, item):
+        name = getattr(item, 'name', None)
+        if name is None:
+            return
+        index = self._index
+        if index is None:
+            index = {}
+            object.__setattr__(self, '_index', index)
+        found = index.get(name)
+        if found is None:
+            index[name] = item
+        elif type(found) is list:
+            found.append(item)
         else:
-            self[hash(item)] = item
+            index[name] = [found, item]
+
+    def _rebuild_index(self):
+        object.__setattr__(self, '_index', None)
+        for item in self._items:
+            self._add_to_index(item)
+
+    def append(self, item):
+        if isinstance(item, Base):
+            item._add_parent(self._owner_ref)
+        elif hasattr(item, '_parent'):
+            item._parent = self._owner
+        if not self._items:
+            object.__setattr__(self, '_items', [])
+        self._items.append(item)
+        self._add_to_index(item)
+        self._changed(added=(item,))
 
     def add(self, *items):
+        self.extend(items)
+
+    def extend(self, items):
+        """ Appends several sections at once, marking the owner as changed only once. """
+        items = list(items)
+        if not items:
+            return
+        owner_ref = self._owner_ref
+        add_to_index = self._add_to_index
         for item in items:
-            self.append(item)
+            if isinstance(item, Base):
+                item._add_parent(owner_ref)
+            elif hasattr(item, '_parent'):
+                item._parent = self._owner
+            add_to_index(item)
+        if not self._items:
+            object.__setattr__(self, '_items', items)
+        else:
+            self._items.extend(items)
+        self._changed(added=tuple(items))
+
+    def _clone(self, owner):
+        """ Returns a copy of this list for another block, sharing the sections without taking them over. """
+        sections = AttrList(owner)
+        if self._items:
+            object.__setattr__(sections, '_items', list(self._items))
+            object.__setattr__(sections, '_index', dict(
+                (name, list(found) if type(found) is list else found) for name, found in self._index.items()
+            ) if self._index else None)
+        return sections
+
+    def _replace(self, old, new):
+        """ Puts ``new`` in place of a section, compared by identity. """
+        for position, section in enumerate(self._items):
+            if section is old:
+                break
+        else:
+            raise ValueError('section not found')
+        if hasattr(new, '_parent'):
+            new._parent = self._owner
+        self._items[position] = new
+        self._rebuild_index()
+        _detach(self._owner, (old,))
+        self._changed(added=(new,), removed=(old,))
+
+    def remove(self, item):
+        """ Removes a section, compared by identity. """
+        for position, section in enumerate(self._items):
+            if section is item:
+                del self._items[position]
+                break
+        else:
+            raise ValueError('section not found')
+        self._rebuild_index()
+        _detach(self._owner, (item,))
+        self._changed(removed=(item,))
+
+    def getall(self, name):
+        """ Returns every section with the given name, in order. """
+        found = self._index.get(name) if self._index else None
+        if found is None:
+            return []
+        return list(found) if type(found) is list else [found]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._index.keys()) if self._index else []
+
+    def values(self):
+        return list(self._items)
+
+    def items(self):
+        return [(getattr(item, 'name', None), item) for item in self._items]
+
+    def __getitem__(self, name):
+        if isinstance(name, (int, slice)):
+            return self._items[name]
+        if not self._index:
+            raise KeyError(name)
+        found = self._index[name]
+        return found[0] if type(found) is list else found
+
+    def __setitem__(self, name, item):
+        """ Replaces every section with this name by ``item``, at the position of the first one. """
+        if hasattr(item, '_parent'):
+            item._parent = self._owner
+        items = list(self._items)
+        object.__setattr__(self, '_items', items)
+        positions = [i for i, section in enumerate(items) if getattr(section, 'name', None) == name]
+        removed = [items[position] for position in positions]
+        if positions:
+            items[positions[0]] = item
+            for position in reversed(positions[1:]):
+                del items[position]
+        else:
+            items.append(item)
+        self._rebuild_index()
+        _detach(self._owner, [section for section in removed if section is not item])
+        self._changed(added=(item,), removed=removed)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        removed = self.getall(name)
+        items = [section for section in self._items if getattr(section, 'name', None) != name]
+        object.__setattr__(self, '_items', items)
+        self._rebuild_index()
+        _detach(self._owner, removed)
+        self._changed(removed=removed)
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, item):
+        self[name] = item
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, name):
+        return bool(self._index) and name in self._index
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    __nonzero__ = __bool__
+
+    def __reduce__(self):
+        return (self.__class__, (self._owner,), None, iter(list(self._items)))
+
+    def __repr__(self):
+        return 'AttrList({0!r})'.format(self._items)
 
 
 # alias for backwards compatibility
@@ -0,0 +1,270 @@
+"""
+The render engine turns a tree of blocks and options into nginx config text.
+
+Rendering walks the tree iteratively with an explicit stack instead of recursing through ``repr``,
+so arbitrarily deep trees render without hitting the interpreter's recursion limit. All of the state
+needed while rendering (such as the current indentation) lives in a :class:`RenderContext` rather
+than on the nodes themselves, which means the same tree can safely be rendered from several threads
+at once.
+
+Blocks cache the text they render to and only the blocks along a modified path are walked again on
+the next render, see :class:`RenderContext` and :data:`cache_stats`.
+
+While a tracer is installed (see :mod:`nginx.config.tracing`), every render and every named block
+walked is traced as a span in the ``render`` category.
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> from nginx.config.api.render import RenderContext, render
+    >>> server = Block('server', Location('/foo', proxy_pass='upstream'))
+    >>> print(render(server, RenderContext(indent=2)))
+
+    server {
+      location /foo {
+        proxy_pass upstream;
+      }
+    }
+
+"""
+import six
+
+from ..tracing import get_tracer
+
+
+class CacheStats(object):
+    """ Counts render cache hits and misses across all renders.
+
+    A hit is a block whose cached text was reused, a miss is a block that had to be walked.
+
+    Example::
+
+        >>> from nginx.config.api import Block
+        >>> from nginx.config.api.render import cache_stats
+        >>> http = Block('http', Block('server', server_name='_'))
+        >>> cache_stats.reset()
+        >>> repr(http) == repr(http)
+        True
+        >>> cache_stats.as_dict()
+        {'hits': 1, 'misses': 2}
+
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self):
+        """ Zeroes the counters. """
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def __repr__(self):
+        return '<CacheStats hits={0} misses={1}>'.format(self.hits, self.misses)
+
+
+cache_stats = CacheStats()
+
+
+class RenderContext(object):
+    """ Options and state for a single render.
+
+    Every block remembers the text it last rendered to, which is discarded whenever the block or
+    anything below it is modified. ``use_cache`` controls whether that text is reused, and
+    ``fill_cache`` whether blocks that had to be walked store their text for the next render.
+    Filling the cache keeps a copy of the output around, so streaming renders leave it off by default.
+
+    :param int indent_level: indentation level of the outermost rendered object
+    :param str indent_char: character used for indenting nested directives (default: space)
+    :param int indent: number of ``indent_char`` per indentation level (default: 4)
+    :param bool use_cache: reuse text cached by previous renders (default: True)
+    :param bool fill_cache: cache the text of blocks rendered from scratch (default: True)
+    :param dict prerendered: maps ``id(node)`` to text to emit in place of rendering that node,
+        formatted like a chunk from :func:`iter_lines`, or to another node to render in its place
+        at the same level (default: None)
+    """
+    def __init__(self, indent_level=0, indent_char=' ', indent=4, use_cache=True, fill_cache=True, prerendered=None):
+        self.indent_level = indent_level
+        self.indent_char = indent_char
+        self.indent = indent
+        self.use_cache = use_cache
+        self.fill_cache = fill_cache
+        self.prerendered = prerendered
+        self.hits = 0
+        self.misses = 0
+        self._indents = []
+
+    def get_indent(self, level):
+        """ Returns the indentation prefix for the given level. """
+        indents = self._indents
+        while len(indents) <= level:
+            indents.append(self.indent_char * self.indent * len(indents))
+        return indents[level]
+
+    @property
+    def cache_key(self):
+        """ Identifies the indentation settings that cached text was rendered with. """
+        return (self.indent_char, self.indent)
+
+    def get_cached(self, node, level):
+        """ Returns the text cached for a block rendered at ``level``, or None. """
+        cached = node._render_cache
+        if cached is not None and cached[0] == self.cache_key and cached[1] == level:
+            return cached[2]
+        return None
+
+    @classmethod
+    def for_node(cls, node, **kwargs):
+        """ Creates a context matching the indentation settings of a node. """
+        return cls(
+            indent_level=node._indent_level,
+            indent_char=node._indent_char,
+            indent=node._indent,
+            **kwargs
+        )
+
+
+# stack markers, see iter_lines
+_CLOSE = object()
+_STORE = object()
+_END = object()
+
+
+def iter_lines(node, context=None):
+    """ Lazily renders a node, yielding the output one chunk at a time without leading newlines.
+
+    A chunk is usually a single indented line, but blocks served from the render cache and
+    fragments (see :class:`nginx.config.api.Fragment`) are yielded as one chunk spanning all of
+    their lines. Either way, joining the chunks with newlines produces the full output.
+
+    :param nginx.config.api.base.Base node: block or option to render
+    :param RenderContext context: render options (default: derived from the node, not filling the cache)
+    :rtype: iterator of str
+    """
+    if context is None:
+        context = RenderContext.for_node(node, fill_cache=False)
+    get_indent = context.get_indent
+    use_cache = context.use_cache
+    fill_cache = use_cache and context.fill_cache
+    cache_key = context.cache_key
+    prerendered = context.prerendered
+
+    tracer = get_tracer()
+    traced = tracer.enabled
+    if traced:
+        root_name = getattr(node, 'name', None) or type(node).__name__
+        tracer.start(root_name, 'render', {'root': True})
+
+    # Entries are (node, level), (_CLOSE, line) for a pre-rendered closing brace,
+    # (_STORE, (block, level)) once every line of a block being cached has been collected, or
+    # (_END, name) when a traced block is done.
+    # While blocks are being cached, output goes to the innermost buffer instead of being yielded.
+    stack = [(node, context.indent_level)]
+    pop = stack.pop
+    push = stack.append
+    buffers = []
+    hits = misses = 0
+
+    try:
+        while stack:
+            node, arg = pop()
+            if node is _CLOSE:
+                chunk = arg
+            elif node is _END:
+                tracer.end(arg, 'render')
+                continue
+            elif node is _STORE:
+                block, level = arg
+                chunk = '\n'.join(buffers.pop())
+                block._render_cache = (cache_key, level, chunk)
+                if not chunk:
+                    continue
+            elif prerendered is not None and id(node) in prerendered:
+                chunk = prerendered[id(node)]
+                if not isinstance(chunk, six.string_types):
+                    push((chunk, arg))
+                    continue
+                if not chunk:
+                    continue
+            elif not node._is_block:
+                if node._is_fragment:
+                    chunk = node._chunk(context, arg)
+                    if not chunk:
+                        continue
+                else:
+                    indent = get_indent(arg)
+                    if buffers:
+                        buffers[-1].extend([indent + line for line in node._lines()])
+                    else:
+                        for line in node._lines():
+                            yield indent + line
+                    continue
+            else:
+                level = arg
+                if use_cache:
+                    cached = node._render_cache
+                    if cached is not None and cached[0] == cache_key and cached[1] == level:
+                        hits += 1
+                        if not cached[2]:
+                            continue
+                        chunk = cached[2]
+                        if buffers:
+                            buffers[-1].append(chunk)
+                        else:
+                            yield chunk
+                        continue
+                    misses += 1
+                    if fill_cache:
+                        buffers.append([])
+                        push((_STORE, (node, level)))
+
+                directives = node._directives
+                if node._opens_scope:
+                    indent = get_indent(level)
+                    chunk = '{indent}{name} {{'.format(indent=indent, name=node.name)
+                    if traced:
+                        tracer.start(node.name, 'render')
+                        push((_END, node.name))
+                    push((_CLOSE, indent + '}'))
+                    level += 1
+                    for directive in reversed(directives):
+                        push((directive, level))
+                else:
+                    for directive in reversed(directives):
+                        push((directive, level))
+                    continue
+
+            if buffers:
+                buffers[-1].append(chunk)
+            else:
+                yield chunk
+    finally:
+        context.hits += hits
+        context.misses += misses
+        cache_stats.hits += hits
+        cache_stats.misses += misses
+        if traced:
+            # close the spans of any blocks left unfinished by an abandoned iteration
+            for marker, name in reversed(stack):
+                if marker is _END:
+                    tracer.end(name, 'render')
+            tracer.end(root_name, 'render')
+
+
+def render(node, context=None):
+    """ Renders a node to a string.
+
+    The result matches ``repr(node)`` for the same context: each line is preceded by a newline.
+
+    :param nginx.config.api.base.Base node: block or option to render
+    :param RenderContext context: render options (default: derived from the node)
+    :rtype: str
+    """
+    if context is None:
+        context = RenderContext.for_node(node)
+    chunks = list(iter_lines(node, context))
+    if not chunks:
+        return ''
+    return '\n' + '\n'.join(chunks)
@@ -39,6 +39,24 @@ This generates a simple config that looks like this::
         worker_connections 1024;
     }
 
+Large route tables are quicker to add in bulk, from rows or columns, without a wrapper per route::
+
+    with nginx.add_server() as server:
+        server.add_routes([('/foo', {'proxy_pass': 'http://foo'}), ('/bar', {'return': 404})])
+        server.add_routes(path=['/a', '/b'], proxy_pass=['http://a', 'http://b'])
+
+Building from several threads or tasks
+======================================
+
+The builder keeps track of where each thread and asyncio task is in the config separately (see
+:mod:`nginx.config.builder.cursor`), so a builder can be shared by threads or tasks that each add
+their own servers. Plugins make their changes to the config while holding :attr:`NginxConfigBuilder.lock`,
+and code changing blocks of the config directly while other threads are building should hold it too::
+
+    with nginx.add_server(hostname='a.example.com') as server:
+        with nginx.lock:
+            server.current_obj.options.listen = 443
+
 Plugins
 =======
 
@@ -77,10 +95,17 @@ a route::
         @property
 
 """
+import threading
 
 from ..api import EmptyBlock, Block, Config
+from ..helpers import render
+from ..index import ConfigIndex
+from ..tracing import get_tracer, traced
+from ..writer import ConfigWriter
 from .exceptions import ConfigBuilderConflictException, ConfigBuilderException, ConfigBuilderNoSuchMethodException
 from .baseplugins import RoutePlugin, ServerPlugin, Plugin
+from .cursor import Cursor
+from .instrumentation import InstrumentationReport
 
 
 DEFAULT_PLUGINS = (RoutePlugin, ServerPlugin)
@@ -92,14 +117,17 @@ class NginxConfigBuilder(object):
 
     Exposes a plugin-based architecture for generating nginx configurations.
 
+    :ivar threading.RLock lock: held while plugins change the config
     """
 
-    def __init__(self, worker_processes='auto', worker_connections=512, error_log='logs/error.log', daemon='off'):
+    def __init__(self, worker_processes='auto', worker_connections=512, error_log='logs/error.log', daemon='off',
+                 instrument=False):
         """
         :param worker_processes str|int: number of worker processes to start with (default: auto)
         :param worker_connections int: number of nginx worker connections (default: 512)
         :param error_log str: path to nginx error log (default: logs/error.log)
         :param daemon str: whether or not to daemonize nginx (default: on)
+        :param instrument bool: record calls to plugin methods in :attr:`instrumentation` (default: False)
         """
 
         self.plugins = []
@@ -114,13 +142,21 @@ class NginxConfigBuilder(object):
             include='../conf/mime.types'
         )
 
-        self._cwo = self._http
+        self._cursor = Cursor(self._http)
+        self.lock = threading.RLock()
         self._events = Block(
             'events',
             worker_connections=worker_connections
         )
 
         self._methods = {}
+        self._index = None
+
+        # plugins' methods are only wrapped when instrumenting, so there's no overhead otherwise
+        self.instrumentation = None
+        if instrument:
+            self.instrumentation = InstrumentationReport()
+            self.instrumentation.watch(self._top, self._http, self._events)
 
         for plugin in DEFAULT_PLUGINS:
             self.register_plugin(plugin(parent=self._http))
@@ -176,13 +212,30 @@ class NginxConfigBuilder(object):
         :param plugin nginx.builder.baseplugins.Plugin: nginx plugin to add to builder
         """
 
-        self._validate_plugin(plugin)
+        tracer = get_tracer()
+        if tracer.enabled:
+            with tracer.span('validate_plugin', 'builder', {'plugin': str(plugin.name)}):
+                self._validate_plugin(plugin)
+        else:
+            self._validate_plugin(plugin)
 
         # insert ourselves as the config builder for plugins
         plugin._config_builder = self
         self.plugins.append(plugin)
 
-        self._methods.update(plugin.exported_methods)
+        methods = plugin.exported_methods
+        if self.instrumentation is not None:
+            methods = self.instrumentation.wrap(plugin, methods)
+        self._methods.update(methods)
+
+    @property
+    def _cwo(self):
+        """ The current working object of the calling thread or task, see :mod:`nginx.config.builder.cursor`. """
+        return self._cursor.get()
+
+    @_cwo.setter
+    def _cwo(self, obj):
+        self._cursor.set(obj)
 
     @property
     def top(self):
@@ -194,6 +247,19 @@ class NginxConfigBuilder(object):
         """
         return self._http
 
+    @property
+    def index(self):
+        """ Returns an index of the servers and locations in the config.
+
+        The index is built the first time it is used and then kept up to date as the config is
+        modified, so plugins can look up existing servers and routes instead of walking the config.
+
+        :returns :class:`nginx.config.index.ConfigIndex`: index of the http block
+        """
+        if self._index is None:
+            self._index = ConfigIndex(self._http)
+        return self._index
+
     def __getattr__(self, attr):
         # Since we want this to be easy to use, we will do method lookup
         # on the methods that we've gotten from our different config plugins
@@ -202,9 +268,56 @@ class NginxConfigBuilder(object):
         # This means that plugins can just return a reference to the builder
         # so that users can just chain methods off of the builder.
         try:
-            return self._methods[attr]
+            method = self._methods[attr]
         except KeyError:
             raise ConfigBuilderNoSuchMethodException(attr, builder=self)
+        if get_tracer().enabled:
+            return traced(method, attr, 'builder')
+        return method
+
+    def _config(self):
+        return Config(self._top, self._events, self._http)
+
+    def iter_lines(self):
+        """ Lazily renders the built config one line at a time.
+
+        :rtype: iterator of str
+        """
+        return self._config().iter_lines()
+
+    def render_to(self, fp):
+        """ Streams the built config to a file-like object.
+
+        :param fp: any object with a ``write`` method accepting str
+        """
+        tracer = get_tracer()
+        if tracer.enabled:
+            with tracer.span('render_to', 'builder'):
+                self._config().render_to(fp)
+        else:
+            self._config().render_to(fp)
+
+    def render(self, workers=None, threads=False):
+        """ Renders the built config, optionally rendering server blocks in parallel.
+
+        See :func:`nginx.config.helpers.render` for details.
+
+        :param int workers: size of the pool, rendering serially if this is None or 1 (default: None)
+        :param bool threads: use a thread pool instead of a process pool (default: False)
+        :rtype: str
+        """
+        return render(self._config(), workers=workers, threads=threads)
+
+    def write(self, directory, **kwargs):
+        """ Writes the built config to a directory, with one included file per server.
+
+        Only files whose content changed are rewritten. See :class:`nginx.config.writer.ConfigWriter`
+        for the keyword arguments.
+
+        :param str directory: directory to write to
+        :returns :class:`nginx.config.writer.WriteResult`: the files that were written, left alone or removed
+        """
+        return ConfigWriter(directory, **kwargs).write(self._config())
 
     def __repr__(self):
-        return repr(Config(self._top, self._events, self._http))
+        return repr(self._config())
@@ -54,12 +54,10 @@ class Navigable(object):
         """ Traverse up the config hierarchy """
         self.chobj(self.current_obj.parent)
 
-    def add_child(self, child):
-        """ Adds a child to the config object
-
-        :param nginx.config.Builder child: child to insert into config tree
-        """
-        name = re.split(r'\s+', self.current_obj.name)[0]
+    def _checked_parent(self):
+        """ Returns the current object, after checking that it can hold this plugin's children. """
+        parent = self.current_obj
+        name = re.split(r'\s+', parent.name)[0]
         if self.valid_cfg_parents and name not in self.valid_cfg_parents:
             raise ConfigBuilderException(
                 '{parent} is not a valid parent for this plugin. Call this off of one of these: {valid_parents}'.format(
@@ -67,8 +65,16 @@ class Navigable(object):
                     valid_parents=self.valid_cfg_parents
                 ), plugin=self._get_name()
             )
+        return parent
+
+    def add_child(self, child):
+        """ Adds a child to the config object
 
-        self.current_obj.sections.add(child)
+        :param nginx.config.Builder child: child to insert into config tree
+        """
+        parent = self._checked_parent()
+        with self.config_builder.lock:
+            parent.sections.add(child)
 
     def __getattr__(self, attr):
         return getattr(self.config_builder, attr)
@@ -136,6 +142,60 @@ class Routable(Navigable):
 
         return RouteWrapper(self.current_obj, self.config_builder)
 
+    def add_routes(self, rows=(), **columns):
+        """ Adds many routes to the current server or route in one go.
+
+        Routes are given either as rows, each a ``(path, options)`` pair or a dict of options with
+        a ``path`` key, or as columns: a ``path`` list and one list per option, all of the same
+        length, but not both. The parent is only checked once, all the routes are added at once, and unlike
+        :meth:`add_route` the current object doesn't change, so nothing needs to be ended::
+
+            server.add_routes([('/a', {'proxy_pass': 'http://a'}), {'path': '/b', 'return': 404}])
+            server.add_routes(path=['/a', '/b'], proxy_pass=['http://a', 'http://b'])
+
+        :returns list: the :class:`nginx.config.api.Location` blocks that were added
+        """
+        parent = self._checked_parent()
+        locations = _build_locations(rows, **columns)
+        with self.config_builder.lock:
+            parent.sections.extend(locations)
+        return locations
+
+
+def _build_locations(rows=(), **columns):
+    """ Builds locations from rows or columns of paths and options, see :meth:`Routable.add_routes`.
+
+    :rtype: list of :class:`nginx.config.api.Location`
+    """
+    if columns:
+        if rows:
+            raise ConfigBuilderException('routes must be given either as rows or as columns, not both', plugin='route')
+        try:
+            paths = list(columns.pop('path'))
+        except KeyError:
+            raise ConfigBuilderException('routes given as columns need a path column', plugin='route')
+        names = list(columns)
+        values = [list(columns[name]) for name in names]
+        if any(len(column) != len(paths) for column in values):
+            raise ConfigBuilderException('every column must have one value per path', plugin='route')
+        rows = zip(paths, (dict(zip(names, row)) for row in zip(*values))) if names else ((path, {}) for path in paths)
+
+    locations = []
+    for row in rows:
+        if isinstance(row, dict):
+            options = dict(row)
+            try:
+                path = options.pop('path')
+            except KeyError:
+                raise ConfigBuilderException('route without a path: {0!r}'.format(row), plugin='route')
+        else:
+            path, options = row
+        location = Location(path)
+        if options:
+            location.options.update(options)
+        locations.append(location)
+    return locations
+
 
 @six.add_metaclass(ABCMeta)
 class Wrapper(object):
@@ -179,6 +239,7 @@ class RoutePlugin(Plugin, Routable, Endable):
     def exported_methods(self):
         return {
             'add_route': self.add_route,
+            'add_routes': self.add_routes,
         }
 
 
@@ -191,8 +252,31 @@ class ServerPlugin(Plugin, Routable, Endable):
     valid_cfg_parents = ('http',)
 
     # XXX: add more server options
-    def add_server(self, hostname='_', **kwargs):
-        server = Block('server', server_name=hostname, **kwargs)
+    def add_server(self, hostname='_', routes=(), template=None, **kwargs):
+        """ Adds a server, and makes it the current object.
+
+        With a template, the server is an instance of it and the keyword arguments are the values
+        of its placeholders, including ``hostname`` if the template has a placeholder by that name::
+
+            tenant = Template(Block('server', server_name=placeholder('hostname'), listen=placeholder('port')))
+            for i in range(10000):
+                nginx.add_server(hostname='tenant{0}.example.com'.format(i), port=8000 + i, template=tenant).end()
+
+        :param str hostname: server_name of the server (default: _)
+        :param routes: rows of routes to add to the server as it is created, see :meth:`Routable.add_routes`
+        :param nginx.config.templates.Template template: template of the server (default: None)
+        :raises ValueError: if a hostname is given and the template has no placeholder for it
+        """
+        if template is not None:
+            if 'hostname' in template.slots:
+                kwargs['hostname'] = hostname
+            elif hostname != '_':
+                raise ValueError('the template has no hostname placeholder for {0!r}'.format(hostname))
+            server = template.instantiate(**kwargs)
+        else:
+            server = Block('server', server_name=hostname, **kwargs)
+        if routes:
+            server.sections.extend(_build_locations(routes))
         self.add_child(server)
         self.chobj(server)
 
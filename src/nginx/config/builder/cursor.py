@@ -0,0 +1,76 @@
+"""
+The current object of a :class:`nginx.config.builder.NginxConfigBuilder`, kept separately for every
+thread and asyncio task.
+
+Plugins add to the builder's current object, which ``add_server``, ``add_route`` and ``end`` move
+around. Each thread starts out at the builder's http block, and each asyncio task starts out where
+the code that created it was, so threads or tasks can each fill in their own servers with the same
+builder::
+
+    def add_tenant(nginx, tenant):
+        with nginx.add_server(hostname=tenant.hostname) as server:
+            for path, upstream in tenant.routes:
+                server.add_route(path, proxy_pass=upstream).end()
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(functools.partial(add_tenant, nginx), tenants))
+
+Positions are kept in :mod:`contextvars` where it is available (Python 3.7 and up), and per thread
+otherwise. They only weakly refer to blocks, so a block removed from the config doesn't stay alive
+just because some thread was positioned in it; the cursor then goes back to the http block.
+"""
+import threading
+import weakref
+
+try:
+    import contextvars
+except ImportError:  # Python < 3.7
+    contextvars = None
+
+if contextvars is not None:
+    # id(cursor) -> (weak reference to the cursor, weak reference to its position) for the cursors
+    # moved in the current context; the dict is replaced instead of being modified, so contexts
+    # copied from this one (such as those of asyncio tasks) don't see each other's moves
+    _positions = contextvars.ContextVar('nginx_config_builder_positions', default={})
+
+
+class Cursor(object):
+    """ A position in a config tree, kept separately for every thread and asyncio task.
+
+    :param nginx.config.api.Block default: position of threads and tasks that haven't moved yet
+    """
+    def __init__(self, default):
+        self.default = default
+        self._ref = weakref.ref(self)
+        if contextvars is None:
+            self._local = threading.local()
+
+    def get(self):
+        """ Returns the current position.
+
+        :rtype: nginx.config.api.Block
+        """
+        if contextvars is None:
+            ref = getattr(self._local, 'ref', None)
+        else:
+            entry = _positions.get().get(id(self))
+            # ids can be reused once a cursor is gone
+            ref = entry[1] if entry is not None and entry[0]() is self else None
+        obj = ref() if ref is not None else None
+        return self.default if obj is None else obj
+
+    def set(self, obj):
+        """ Moves the cursor, for the current thread or task only.
+
+        :param nginx.config.api.Block obj: new position, or None for the default one
+        """
+        ref = weakref.ref(obj) if obj is not None else None
+        if contextvars is None:
+            self._local.ref = ref
+            return
+        # copying is also when the entries of cursors that are gone are dropped
+        positions = dict(
+            (key, entry) for key, entry in _positions.get().items() if entry[0]() is not None
+        )
+        positions[id(self)] = (self._ref, ref)
+        _positions.set(positions)
@@ -0,0 +1,147 @@
+"""
+Opt-in instrumentation of the methods plugins export to a :class:`nginx.config.builder.NginxConfigBuilder`.
+
+When a builder is created with ``instrument=True``, every exported method is wrapped as its plugin
+is registered, recording how often it was called, how long it took and how many nodes it added to
+the config::
+
+    nginx = NginxConfigBuilder(instrument=True)
+    with nginx.add_server() as server:
+        server.add_route('/foo').end()
+
+    print(nginx.instrumentation)
+    nginx.instrumentation.as_dict()['server']['calls']  # 1
+
+Builders created without ``instrument=True`` call the plugins' methods directly, so instrumentation
+costs nothing unless it is enabled.
+"""
+import functools
+
+from timeit import default_timer
+
+
+def count_nodes(node):
+    """ Counts a node and every block and option below it. """
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        if getattr(node, '_is_block', False):
+            stack.extend(node._directives)
+    return count
+
+
+class MethodStats(object):
+    """ Call statistics for one exported method. """
+    __slots__ = ('calls', 'total', 'max', 'nodes')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Zeroes every counter. """
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.nodes = 0
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+    def add(self, other):
+        self.calls += other.calls
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.nodes += other.nodes
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'total': self.total,
+            'mean': self.mean,
+            'max': self.max,
+            'nodes': self.nodes,
+        }
+
+
+class InstrumentationReport(object):
+    """ Collects call statistics for the exported methods of every plugin of a builder.
+
+    Times are wall clock seconds, and include time spent in any other exported methods called along
+    the way. Nodes are the blocks and options added to the config (or options set) during a call.
+    """
+    def __init__(self):
+        # plugin name -> method name -> MethodStats
+        self.plugins = {}
+        self._nodes = 0
+
+    def block_changed(self, block, added, removed, options):
+        """ Observer callback counting the nodes added to the config, see
+        :meth:`nginx.config.api.Block.add_observer`. """
+        self._nodes += len(options) + sum(count_nodes(node) for node in added)
+
+    def watch(self, *blocks):
+        """ Counts nodes added anywhere below the given blocks. """
+        for block in blocks:
+            block.add_observer(self)
+
+    def wrap(self, plugin, methods):
+        """ Returns a copy of a plugin's exported methods that record their calls in this report. """
+        stats = self.plugins.setdefault(plugin.name, {})
+        return dict(
+            (name, self._wrap_method(method, stats.setdefault(name, MethodStats())))
+            for (name, method) in methods.items()
+        )
+
+    def _wrap_method(self, method, stats):
+        @functools.wraps(method)
+        def instrumented(*args, **kwargs):
+            nodes = self._nodes
+            start = default_timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = default_timer() - start
+                stats.calls += 1
+                stats.total += elapsed
+                if elapsed > stats.max:
+                    stats.max = elapsed
+                stats.nodes += self._nodes - nodes
+        return instrumented
+
+    def plugin(self, name):
+        """ Returns the combined :class:`MethodStats` of every method of a plugin. """
+        total = MethodStats()
+        for stats in self.plugins.get(name, {}).values():
+            total.add(stats)
+        return total
+
+    def reset(self):
+        """ Zeroes every counter. """
+        # the wrapped methods hold on to their stats, so those are zeroed rather than replaced
+        for methods in self.plugins.values():
+            for stats in methods.values():
+                stats.reset()
+
+    def as_dict(self):
+        """ Returns the statistics of every plugin, with a breakdown per method under ``methods``. """
+        report = {}
+        for name, methods in self.plugins.items():
+            report[name] = self.plugin(name).as_dict()
+            report[name]['methods'] = dict((method, stats.as_dict()) for (method, stats) in methods.items())
+        return report
+
+    def __str__(self):
+        lines = ['{0:<40} {1:>8} {2:>12} {3:>12} {4:>12} {5:>8}'.format('method', 'calls', 'total', 'mean', 'max', 'nodes')]
+        rows = [
+            ('{0}.{1}'.format(plugin, method), stats)
+            for (plugin, methods) in self.plugins.items()
+            for (method, stats) in methods.items()
+        ]
+        for name, stats in sorted(rows, key=lambda row: row[1].total, reverse=True):
+            lines.append('{0:<40} {1:>8} {2:>12.6f} {3:>12.6f} {4:>12.6f} {5:>8}'.format(
+                name, stats.calls, stats.total, stats.mean, stats.max, stats.nodes
+            ))
+        return '\n'.join(lines)
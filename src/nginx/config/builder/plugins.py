@@ -65,17 +65,19 @@ class CacheRoutePlugin(Plugin):
                    for (k, v) in cache_valid.items())
         ))
 
-        # XXX: check if these are set the first time
-        # add options to top
-        self._set_cache_option('cache_key', cache_key)
-        self._set_cache_option('cache_min_uses', cache_min_uses)
-        self._set_cache_option('cache_bypass', cache_bypass)
-        self._set_cache_option('cache_use_stale', cache_use_stale)
-        self._set_cache_option('cache_convert_head', cache_convert_head)
-
-        if 'add_header' not in self.config_builder.top.options:
-            self.config_builder.top.options['add_header'] = []
-        self.config_builder.top.options['add_header'].extend(['X-Cache-Status', '$upstream_cache_status'])
+        # the top block is shared by every thread using the builder
+        with self.config_builder.lock:
+            # XXX: check if these are set the first time
+            # add options to top
+            self._set_cache_option('cache_key', cache_key)
+            self._set_cache_option('cache_min_uses', cache_min_uses)
+            self._set_cache_option('cache_bypass', cache_bypass)
+            self._set_cache_option('cache_use_stale', cache_use_stale)
+            self._set_cache_option('cache_convert_head', cache_convert_head)
+
+            if 'add_header' not in self.config_builder.top.options:
+                self.config_builder.top.options['add_header'] = []
+            self.config_builder.top.options['add_header'].extend(['X-Cache-Status', '$upstream_cache_status'])
 
         return self
 
@@ -1,9 +1,18 @@
 """
 This module contains functions and variables that provide a variety of commonly used nginx config
 boilerplate.
+
+Each group of options is also provided as a frozen :class:`nginx.config.api.Fragment`, named after
+it with a ``_fragment`` suffix. The groups themselves are blocks shared by everything they are
+added to, so changing one changes it everywhere without every user noticing; fragments can't be
+changed, and render without walking a tree however many times they are embedded::
+
+    >>> from nginx.config.api import Location
+    >>> from nginx.config.common import uwsgi_params_fragment
+    >>> locations = [Location('/app{0}'.format(i), uwsgi_params_fragment, uwsgi_pass='app') for i in range(100)]
 """
 from . import helpers
-from .api import Block, EmptyBlock, KeyMultiValueOption, KeyValueOption
+from .api import Block, EmptyBlock, Fragment, KeyMultiValueOption, KeyValueOption
 from .headers import uwsgi_param
 
 
@@ -168,6 +177,15 @@ buffer_options = _large_buffers()
 uwsgi_cache_location = _uwsgi_cache_location()
 statsd_options_location = _statsd_options_location()
 
+# frozen fragments
+uwsgi_params_fragment = Fragment.freeze(uwsgi_params)
+uwsgi_ssl_params_fragment = Fragment.freeze(uwsgi_ssl_params)
+uwsgi_cache_fragment = Fragment.freeze(uwsgi_cache)
+gzip_options_fragment = Fragment.freeze(gzip_options)
+buffer_options_fragment = Fragment.freeze(buffer_options)
+uwsgi_cache_location_fragment = Fragment.freeze(uwsgi_cache_location)
+statsd_options_location_fragment = Fragment.freeze(statsd_options_location)
+
 
 def user_agent_block(blocklist, return_code=403):
     return Block(
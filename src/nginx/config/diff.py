@@ -0,0 +1,136 @@
+"""
+Structural diffs between two config trees.
+
+:func:`diff` walks two trees side by side and reports which directives were added, removed or
+modified, as a list of :class:`Edit` objects. Directives are matched by name (and, for ``server``
+blocks, by ``server_name``) rather than by position, so reordering unrelated directives or adding a
+server doesn't misalign everything after it. Unnamed blocks (:class:`nginx.config.api.EmptyBlock`)
+are looked through, since their directives render as part of the block around them.
+
+Subtrees with equal fingerprints (see :mod:`nginx.config.api.fingerprint`) are skipped without
+being walked, so once the fingerprints of both trees are known, a diff takes time proportional to
+the size of the change rather than the size of the config.
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> from nginx.config.diff import diff
+    >>> old = Block('http', Block('server', Location('/'), server_name='a.com'))
+    >>> new = Block('http', Block('server', Location('/', expires='1d'), server_name='a.com'))
+    >>> for edit in diff(old, new):
+    ...     print(edit)
+    + http > server[a.com] > location / > expires
+
+"""
+from .index import is_server, server_names
+
+ADD = 'add'
+REMOVE = 'remove'
+MODIFY = 'modify'
+
+_SYMBOLS = {ADD: '+', REMOVE: '-', MODIFY: '~'}
+
+
+class Edit(object):
+    """ A single difference between two trees.
+
+    :ivar str op: :data:`ADD`, :data:`REMOVE` or :data:`MODIFY`
+    :ivar tuple path: labels of the directives leading to the edited one, starting at the root
+    :ivar old: the directive in the old tree, or None if it was added
+    :ivar new: the directive in the new tree, or None if it was removed
+    """
+    __slots__ = ('op', 'path', 'old', 'new')
+
+    def __init__(self, op, path, old=None, new=None):
+        self.op = op
+        self.path = path
+        self.old = old
+        self.new = new
+
+    def __eq__(self, other):
+        return isinstance(other, Edit) and (self.op, self.path, self.old, self.new) == (other.op, other.path, other.old, other.new)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.op, self.path))
+
+    def __str__(self):
+        return '{0} {1}'.format(_SYMBOLS[self.op], ' > '.join(self.path))
+
+    def __repr__(self):
+        return '<Edit {0} {1}>'.format(self.op, ' > '.join(self.path))
+
+
+def label(node):
+    """ Returns the label of a directive within its block, used to match it across trees. """
+    if is_server(node):
+        return 'server[{0}]'.format(' '.join(server_names(node)))
+    name = getattr(node, 'name', None)
+    return name if name is not None else type(node).__name__
+
+
+def _children(block):
+    """ Returns the directives of a block, looking through unnamed blocks, as a list of (key, node). """
+    children = []
+    counts = {}
+    stack = [iter(block._directives)]
+    while stack:
+        for node in stack[-1]:
+            if node._is_block and not node._opens_scope:
+                stack.append(iter(node._directives))
+                break
+            name = label(node)
+            occurrence = counts.get(name, 0)
+            counts[name] = occurrence + 1
+            children.append((name if not occurrence else '{0}#{1}'.format(name, occurrence), node))
+        else:
+            stack.pop()
+    return children
+
+
+def diff(old, new):
+    """ Returns the edits turning one tree into another.
+
+    Within each block, removed directives come first, followed by the rest in the order of the new tree.
+
+    Blocks missing from one of the trees are reported as a single edit, not one per directive inside them.
+    Since servers are matched by name, changing a ``server_name`` shows as removing one server and adding another.
+
+    :param nginx.config.api.base.Base old: the tree before the change
+    :param nginx.config.api.base.Base new: the tree after the change
+    :rtype: list of :class:`Edit`
+    """
+    edits = []
+    root = (label(old),) if not old._is_block or old._opens_scope else ()
+    # entries are edits found while comparing a parent, or (path, old, new) directives to compare
+    stack = [(root, old, new)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Edit):
+            edits.append(item)
+            continue
+        path, a, b = item
+        if a is b or a.fingerprint == b.fingerprint:
+            continue
+        if not (a._is_block and b._is_block) or a._opens_scope != b._opens_scope or (
+                a._opens_scope and a.name != b.name):
+            edits.append(Edit(MODIFY, path, a, b))
+            continue
+
+        old_children = _children(a)
+        new_children = _children(b)
+        old_by_key = dict(old_children)
+        new_keys = set(key for key, _ in new_children)
+
+        pending = [Edit(REMOVE, path + (key,), node, None) for key, node in old_children if key not in new_keys]
+        for key, node in new_children:
+            previous = old_by_key.get(key)
+            if previous is None:
+                pending.append(Edit(ADD, path + (key,), None, node))
+            else:
+                pending.append((path + (key,), previous, node))
+        # pushed in reverse, so edits come out in tree order
+        stack.extend(reversed(pending))
+    return edits
@@ -1,10 +1,43 @@
 """
 Convienence utilities for building nginx configs
 """
+import multiprocessing
+import sys
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from multiprocessing import cpu_count
 
 from .api import Config, Location, Section
 from .api.blocks import EmptyBlock
+from .api.render import RenderContext, render as render_node
+from .tracing import get_tracer
+
+
+def iterdumps(config_list):
+    """ Lazily renders a list of config objects, yielding the output a chunk at a time.
+
+    Each chunk is prefixed by its newline, so joining the chunks produces exactly the output
+    of :func:`dumps`. Chunks are single lines, except for blocks reused from the render cache.
+
+    :param list config_list: A list of config objects from this module
+    :rtype: iterator of str
+    """
+    for element in config_list:
+        for line in element.iter_lines():
+            yield '\n' + line
+
+
+def dump(config_list, fp):
+    """ Streams the rendered config to a file-like object. Accepts a list of config objects.
+
+    Unlike :func:`dumps`, the full output is never held in memory, only the current chunk.
+
+    :param list config_list: A list of config objects from this module
+    :param fp: any object with a ``write`` method accepting str
+    """
+    for chunk in iterdumps(config_list):
+        fp.write(chunk)
 
 
 def dumps(config_list):
@@ -13,7 +46,134 @@ def dumps(config_list):
     :param list config_list: A list of config objects from this module
     :rtype: str
     """
-    return ''.join([str(element) for element in config_list])
+    tracer = get_tracer()
+    if tracer.enabled:
+        with tracer.span('dumps', 'helpers', {'objects': len(config_list)}):
+            return ''.join(iterdumps(config_list))
+    return ''.join(iterdumps(config_list))
+
+
+def _find_http(config, level):
+    """ Finds the http block at the top of a config, along with the level it renders at. """
+    stack = [(config, level)]
+    while stack:
+        node, level = stack.pop()
+        if not node._is_block:
+            continue
+        if node._opens_scope:
+            if node.name == 'http':
+                return node, level
+            if node is not config:
+                continue
+            level += 1
+        stack.extend((child, level) for child in reversed(node._directives))
+    return None, None
+
+
+# Blocks waiting to be rendered by a forked process pool. Forked workers inherit these, so only
+# the slice boundaries need to be sent to them instead of pickling every block.
+_shared_nodes = None
+_shared_lock = threading.Lock()
+
+
+def _render_chunk(nodes, level, indent_char, indent):
+    """ Renders a list of sibling blocks. Runs in a worker, so it must be importable. """
+    context = RenderContext(indent_level=level, indent_char=indent_char, indent=indent)
+    return [render_node(node, context)[1:] for node in nodes]
+
+
+def _render_shared_chunk(bounds, level, indent_char, indent):
+    """ Renders a slice of :data:`_shared_nodes` in a forked worker. """
+    return _render_chunk(_shared_nodes[bounds[0]:bounds[1]], level, indent_char, indent)
+
+
+def _start_method():
+    """ Returns how the process pool starts its workers. Python 2 always forks them, except on Windows. """
+    if hasattr(multiprocessing, 'get_start_method'):
+        return multiprocessing.get_start_method()
+    return 'spawn' if sys.platform == 'win32' else 'fork'
+
+
+def _render_pending(pending, workers, threads, chunksize, context, level):
+    """ Renders blocks in a pool, returning their text in order. """
+    global _shared_nodes
+
+    if chunksize is None:
+        chunksize = max(1, -(-len(pending) // (workers * 4)))
+    bounds = [(i, min(i + chunksize, len(pending))) for i in range(0, len(pending), chunksize)]
+    args = ([level] * len(bounds), [context.indent_char] * len(bounds), [context.indent] * len(bounds))
+
+    if threads:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunks = [pending[start:stop] for (start, stop) in bounds]
+            return [text for texts in executor.map(_render_chunk, chunks, *args) for text in texts]
+
+    if _start_method() != 'fork':
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = [pending[start:stop] for (start, stop) in bounds]
+            return [text for texts in executor.map(_render_chunk, chunks, *args) for text in texts]
+
+    with _shared_lock:
+        _shared_nodes = pending
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return [text for texts in executor.map(_render_shared_chunk, bounds, *args) for text in texts]
+        finally:
+            _shared_nodes = None
+
+
+def render(config, workers=None, threads=False, chunksize=None):
+    """ Renders a config to a string, optionally rendering the blocks inside ``http`` in parallel.
+
+    The sections of the config's ``http`` block (typically one per ``server``) are split into chunks
+    which are rendered by a pool of ``workers`` processes, and then stitched back together in their
+    original order. The result is identical to ``repr(config)``. Blocks that are already in the
+    render cache are not sent to the pool.
+
+    Processes are used by default, since threads share the interpreter lock. A thread pool skips
+    pickling the blocks and fills their render cache, but rarely renders faster than serially.
+
+    Example::
+
+        from nginx.config.helpers import render
+        with open('nginx.conf', 'w') as fp:
+            fp.write(render(config, workers=8))
+
+    :param config: config object to render
+    :param int workers: size of the pool, rendering serially if this is None or 1 (default: None)
+    :param bool threads: use a thread pool instead of a process pool (default: False)
+    :param int chunksize: number of blocks per job (default: spread over four jobs per worker)
+    :rtype: str
+    """
+    context = RenderContext.for_node(config)
+    http, level = _find_http(config, context.indent_level)
+    if not workers or workers < 2 or http is None:
+        return render_node(config, context)
+
+    level += 1
+    prerendered = {}
+    pending = []
+    for section in http.sections:
+        if not section._is_block:
+            continue
+        cached = context.get_cached(section, level)
+        if cached is None:
+            pending.append(section)
+        else:
+            prerendered[id(section)] = cached
+
+    if pending:
+        tracer = get_tracer()
+        if tracer.enabled:
+            with tracer.span('render_pending', 'helpers', {'blocks': len(pending), 'workers': workers}):
+                texts = _render_pending(pending, workers, threads, chunksize, context, level)
+        else:
+            texts = _render_pending(pending, workers, threads, chunksize, context, level)
+        for node, text in zip(pending, texts):
+            prerendered[id(node)] = text
+
+    context.prerendered = prerendered
+    return render_node(config, context)
 
 
 def duplicate_options(key, values):
@@ -39,9 +199,7 @@ def duplicate_options(key, values):
 
     """
     duplicates = EmptyBlock()
-
-    for value in values:
-        duplicates.sections.add(EmptyBlock(**{key: value}))
+    duplicates.sections.add(*[duplicates._build_options(key, value) for value in values])
 
     return duplicates
 
@@ -0,0 +1,424 @@
+"""
+Indexes for looking up servers and locations in a config without walking the whole tree.
+
+A :class:`ConfigIndex` is built once from a block (usually ``http``) and then follows every change
+made below that block, so lookups stay constant time (or proportional to the length of the path
+for prefix lookups) no matter how big the config grows.
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> from nginx.config.index import ConfigIndex
+    >>> server = Block('server', Location('/'), Location('/static'), server_name='example.com www.example.com')
+    >>> http = Block('http', server)
+    >>> index = ConfigIndex(http)
+    >>> index.server('www.example.com') is server
+    True
+    >>> index.longest_prefix('example.com', '/static/app.js').name
+    'location /static'
+    >>> server.sections.add(Location('= /health'))
+    >>> index.location('example.com', '/health', modifier='=').name
+    'location = /health'
+
+"""
+import weakref
+
+import six
+
+from .api.options import KeyValueOption
+
+LOCATION_MODIFIERS = ('=', '^~', '~*', '~')
+PREFIX_MODIFIERS = ('', '^~')
+
+
+def is_server(node):
+    """ Returns whether a node is a ``server`` block. """
+    return node._is_block and node._opens_scope and node.name == 'server'
+
+
+def is_location(node):
+    """ Returns whether a node is a ``location`` block. """
+    return node._is_block and node._opens_scope and node.name.split(None, 1)[0] == 'location'
+
+
+def parse_location(name):
+    """ Splits the name of a location block into its modifier and path.
+
+    Example::
+
+        >>> parse_location('location ^~ /images/')
+        ('^~', '/images/')
+        >>> parse_location('location /')
+        ('', '/')
+
+    :param str name: name of a location block, such as ``'location = /foo'``
+    :rtype: tuple
+    """
+    spec = name.split(None, 1)[1].strip() if len(name.split(None, 1)) > 1 else ''
+    for modifier in LOCATION_MODIFIERS:
+        if spec.startswith(modifier):
+            return modifier, spec[len(modifier):].lstrip()
+    return '', spec
+
+
+def server_names(server):
+    """ Returns the names a server block answers to, from its ``server_name`` directives.
+
+    :param nginx.config.api.Block server: a server block
+    :rtype: list
+    """
+    names = []
+    for directive in server._directives:
+        if directive._is_block or not isinstance(directive, KeyValueOption) or directive.name != 'server_name':
+            continue
+        value = directive.value
+        if isinstance(value, list):
+            names.extend(str(name) for name in value)
+        else:
+            names.extend(str(value).split())
+    return names
+
+
+class _TrieNode(object):
+    __slots__ = ('children', 'value', 'present')
+
+    def __init__(self):
+        # first character of an edge -> (edge label, child node)
+        self.children = {}
+        self.value = None
+        self.present = False
+
+
+class PrefixTrie(object):
+    """ A radix tree mapping strings to values, supporting longest prefix lookups.
+
+    Example::
+
+        >>> trie = PrefixTrie()
+        >>> trie['/'] = 'root'
+        >>> trie['/static/'] = 'static'
+        >>> trie.longest_prefix('/static/app.js')
+        ('/static/', 'static')
+        >>> trie.longest_prefix('/api')
+        ('/', 'root')
+
+    """
+    __slots__ = ('_root', '_size')
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._size = 0
+
+    def _find(self, key):
+        node, i = self._root, 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None or not key.startswith(edge[0], i):
+                return None
+            i += len(edge[0])
+            node = edge[1]
+        return node
+
+    def __setitem__(self, key, value):
+        node, i = self._root, 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None:
+                child = _TrieNode()
+                node.children[key[i]] = (key[i:], child)
+                node = child
+                break
+            label, child = edge
+            common = 1
+            while common < len(label) and i + common < len(key) and label[common] == key[i + common]:
+                common += 1
+            if common < len(label):
+                # split the edge where the new key branches off
+                middle = _TrieNode()
+                middle.children[label[common]] = (label[common:], child)
+                node.children[key[i]] = (label[:common], middle)
+                child = middle
+            node = child
+            i += common
+        if not node.present:
+            self._size += 1
+        node.value = value
+        node.present = True
+
+    def __getitem__(self, key):
+        node = self._find(key)
+        if node is None or not node.present:
+            raise KeyError(key)
+        return node.value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __delitem__(self, key):
+        path = []
+        node, i = self._root, 0
+        while i < len(key):
+            edge = node.children.get(key[i])
+            if edge is None or not key.startswith(edge[0], i):
+                raise KeyError(key)
+            path.append((node, key[i]))
+            i += len(edge[0])
+            node = edge[1]
+        if not node.present:
+            raise KeyError(key)
+        node.present = False
+        node.value = None
+        self._size -= 1
+
+        # prune the emptied node, merging single children back into their parent edge
+        while path:
+            parent, first = path.pop()
+            label, child = parent.children[first]
+            if child.present:
+                break
+            if not child.children:
+                del parent.children[first]
+            elif len(child.children) == 1:
+                (child_label, grandchild), = child.children.values()
+                parent.children[first] = (label + child_label, grandchild)
+                break
+            else:
+                break
+
+    def __contains__(self, key):
+        node = self._find(key)
+        return node is not None and node.present
+
+    def __len__(self):
+        return self._size
+
+    def items(self):
+        """ Yields every (key, value) pair, shortest keys first along each branch. """
+        stack = [('', self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.present:
+                yield prefix, node.value
+            for label, child in node.children.values():
+                stack.append((prefix + label, child))
+
+    def prefixes(self, string):
+        """ Yields the (key, value) pairs of every key that is a prefix of ``string``, shortest first. """
+        node, i = self._root, 0
+        if node.present:
+            yield '', node.value
+        while i < len(string):
+            edge = node.children.get(string[i])
+            if edge is None or not string.startswith(edge[0], i):
+                return
+            i += len(edge[0])
+            node = edge[1]
+            if node.present:
+                yield string[:i], node.value
+
+    def longest_prefix(self, string, default=None):
+        """ Returns the (key, value) pair of the longest key that is a prefix of ``string``.
+
+        :param str string: string to match
+        :param default: returned if no key is a prefix of ``string`` (default: None)
+        """
+        found = default
+        for found in self.prefixes(string):
+            pass
+        return found
+
+
+class _ServerEntry(object):
+    """ The locations of a single server. """
+    __slots__ = ('server', 'names', 'locations', 'prefixes')
+
+    def __init__(self, server):
+        self.server = server
+        self.names = []
+        # (modifier, path) -> location, for locations at any depth
+        self.locations = {}
+        # path -> location, for prefix locations directly inside the server
+        self.prefixes = PrefixTrie()
+
+    def add_location(self, location, top_level):
+        modifier, path = parse_location(location.name)
+        self.locations.setdefault((modifier, path), location)
+        if top_level and modifier in PREFIX_MODIFIERS and path not in self.prefixes:
+            self.prefixes[path] = location
+
+
+class ConfigIndex(object):
+    """ Maps server names to server blocks, and location paths to location blocks within each server.
+
+    The index registers itself as an observer of ``root`` and is updated as servers and locations
+    are added to or removed from it, or as ``server_name`` directives change. Call :meth:`close`
+    to stop tracking changes.
+
+    When several servers share a name, the first one wins, as it does in nginx.
+
+    :param nginx.config.api.Block root: block to index, usually ``http`` or the whole config
+    """
+    def __init__(self, root):
+        # the index is kept alive by root's list of observers, so it mustn't keep root alive in turn
+        self._root_ref = weakref.ref(root)
+        self._servers = {}
+        self._names = {}
+        self.rebuild()
+        root.add_observer(self)
+
+    @property
+    def root(self):
+        return self._root_ref()
+
+    def close(self):
+        """ Stops following changes to the config. """
+        self.root.remove_observer(self)
+
+    def rebuild(self):
+        """ Re-indexes the whole config from scratch. """
+        self._servers.clear()
+        self._names.clear()
+        self._add_subtree(self.root, None, False)
+
+    # lookups
+
+    def _entry(self, server):
+        if isinstance(server, six.string_types):
+            server = self.server(server)
+            if server is None:
+                return None
+        return self._servers.get(id(server))
+
+    def server(self, name):
+        """ Returns the first server block named ``name``, or None. """
+        servers = self._names.get(name)
+        return servers[0] if servers else None
+
+    def servers(self, name=None):
+        """ Returns every server block named ``name``, or every indexed server if no name is given. """
+        if name is None:
+            return [entry.server for entry in self._servers.values()]
+        return list(self._names.get(name, ()))
+
+    def location(self, server, path, modifier=''):
+        """ Returns the location block matching a path and modifier within a server, or None.
+
+        :param server: name of the server, or the server block itself
+        :param str path: path of the location, such as ``'/foo'``
+        :param str modifier: location modifier, such as ``'='`` or ``'~'`` (default: prefix location)
+        """
+        entry = self._entry(server)
+        return entry.locations.get((modifier, path)) if entry is not None else None
+
+    def locations(self, server):
+        """ Returns a dict of (modifier, path) to location block for every location within a server. """
+        entry = self._entry(server)
+        return dict(entry.locations) if entry is not None else {}
+
+    def prefix_trie(self, server):
+        """ Returns the :class:`PrefixTrie` of the prefix locations directly inside a server, or None. """
+        entry = self._entry(server)
+        return entry.prefixes if entry is not None else None
+
+    def longest_prefix(self, server, uri):
+        """ Returns the top-level prefix location of a server with the longest path matching ``uri``, or None. """
+        entry = self._entry(server)
+        if entry is None:
+            return None
+        found = entry.prefixes.longest_prefix(uri)
+        return found[1] if found is not None else None
+
+    # maintenance
+
+    def _server_of(self, node):
+        """ Returns the closest server at or above a node, and whether a location lies in between. """
+        in_location = False
+        while node is not None:
+            if is_server(node):
+                return node, in_location
+            if is_location(node):
+                in_location = True
+            node = node._parent
+        return None, in_location
+
+    def _add_server(self, server):
+        self._remove_server(server)
+        entry = _ServerEntry(server)
+        self._servers[id(server)] = entry
+        self._add_subtree(server, entry, False, skip_root=True)
+        self._index_names(entry)
+
+    def _index_names(self, entry):
+        for name in entry.names:
+            servers = self._names.get(name, [])
+            if entry.server in servers:
+                servers.remove(entry.server)
+            if servers:
+                self._names[name] = servers
+            else:
+                self._names.pop(name, None)
+        entry.names = server_names(entry.server)
+        for name in entry.names:
+            self._names.setdefault(name, []).append(entry.server)
+
+    def _remove_server(self, server):
+        entry = self._servers.pop(id(server), None)
+        if entry is not None:
+            for name in entry.names:
+                servers = self._names.get(name, [])
+                if server in servers:
+                    servers.remove(server)
+                if not servers:
+                    self._names.pop(name, None)
+
+    def _add_subtree(self, node, entry, in_location, skip_root=False):
+        stack = [(node, in_location)]
+        while stack:
+            node, in_location = stack.pop()
+            if not node._is_block:
+                continue
+            if not skip_root:
+                if is_server(node):
+                    self._add_server(node)
+                    continue
+                if entry is not None and is_location(node):
+                    entry.add_location(node, not in_location)
+                    in_location = True
+            skip_root = False
+            stack.extend((child, in_location) for child in reversed(list(node.sections)))
+
+    def _servers_in(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if not node._is_block:
+                continue
+            if is_server(node):
+                yield node
+                continue
+            stack.extend(node.sections)
+
+    def block_changed(self, block, added, removed, options):
+        """ Observer callback, see :meth:`nginx.config.api.Block.add_observer`. """
+        server, in_location = self._server_of(block)
+        entry = self._servers.get(id(server)) if server is not None else None
+
+        for node in removed:
+            for removed_server in self._servers_in(node):
+                self._remove_server(removed_server)
+        if entry is not None and removed:
+            # duplicate paths may now be exposed, so this server is indexed again
+            self._remove_server(server)
+            self._add_server(server)
+            return
+
+        for node in added:
+            self._add_subtree(node, entry, in_location)
+
+        if entry is not None and block is server and (
+            'server_name' in options or any(getattr(node, 'name', None) == 'server_name' for node in added)
+        ):
+            self._index_names(entry)
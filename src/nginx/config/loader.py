@@ -0,0 +1,244 @@
+"""
+Loads a config spread over many files, following its ``include`` directives.
+
+:class:`ConfigLoader` parses the main file and every file it includes (expanding glob patterns the
+way nginx does), and returns a single tree in which each ``include`` is replaced by an unnamed
+block holding the included directives. Every parsed file is cached, keyed by its path, modification
+time and content hash, so loading the config again only parses the files that changed. The cache
+can be saved to disk, so that a command line tool starts with it already warm::
+
+    from nginx.config.loader import ConfigLoader
+
+    loader = ConfigLoader(cache_file='.nginx-parse-cache')
+    config = loader.load('/etc/nginx/nginx.conf')
+    print(loader.stats)  # {'parsed': 1, 'reused': 241}
+    loader.save()
+
+Blocks that don't contain an ``include`` are shared between the cache and the trees returned by
+:meth:`ConfigLoader.load`, which keeps loading cheap. A shared block is placed in each of those
+trees without being taken out of the others, so changing it shows in every tree holding it, and
+the loader notices and parses its file again the next time it is loaded. Blocks containing an
+``include`` are copied for each tree, so changing them only affects that tree.
+"""
+import glob
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import weakref
+
+from .api import Block, EmptyBlock
+from .parser import ParseError, parse_bytes
+from .tracing import get_tracer
+from .writer import write_atomic
+
+# bump whenever the format of the saved cache changes
+_CACHE_VERSION = 1
+
+
+def _is_include(node):
+    return not node._is_block and getattr(node, 'name', None) == 'include'
+
+
+class _FileWatcher(object):
+    """ Marks a cached file as changed whenever a block of its tree changes.
+
+    Observers are held by the blocks they watch, so the watcher only weakly refers to the cached
+    file, which holds the tree: otherwise the tree would keep itself alive.
+    """
+    __slots__ = ('entry_ref',)
+
+    def __init__(self, entry):
+        self.entry_ref = weakref.ref(entry)
+
+    def block_changed(self, block, added, removed, options):
+        """ Observer callback, see :meth:`nginx.config.api.Block.add_observer`. """
+        entry = self.entry_ref()
+        if entry is not None:
+            entry.dirty = True
+
+
+class _CachedFile(object):
+    """ The parsed tree of one file, with what's needed to tell whether it is still current. """
+    __slots__ = ('mtime', 'size', 'digest', 'tree', 'with_includes', 'dirty', '__weakref__')
+
+    def __init__(self, mtime, size, digest, tree):
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.tree = tree
+        self.dirty = False
+        self.with_includes = None
+
+    def prepare(self):
+        """ Finds the blocks containing includes, and watches the rest for changes. """
+        # ids of the blocks with an include anywhere below them, found from the bottom up
+        with_includes = set()
+        stack = [(self.tree, False)]
+        while stack:
+            node, done = stack.pop()
+            if not done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node._directives if child._is_block)
+            elif any(_is_include(child) or id(child) in with_includes for child in node._directives):
+                with_includes.add(id(node))
+        self.with_includes = with_includes
+
+        # any change to a block shared with the loaded trees means this file must be parsed again
+        watcher = _FileWatcher(self)
+        blocks = [self.tree]
+        while blocks:
+            block = blocks.pop()
+            block.add_observer(watcher)
+            if id(block) in with_includes:
+                blocks.extend(child for child in block._directives if child._is_block)
+
+    def __getstate__(self):
+        return (self.mtime, self.size, self.digest, self.tree)
+
+    def __setstate__(self, state):
+        self.mtime, self.size, self.digest, self.tree = state
+        self.dirty = False
+        self.with_includes = None
+
+
+class ConfigLoader(object):
+    """ Loads configs and the files they include, caching every parsed file.
+
+    :param str prefix: directory relative ``include`` paths are resolved against (default: the
+        directory of the file being loaded, as nginx does for its main configuration file)
+    :param str cache_file: file the cache is loaded from, if it exists, and saved to by :meth:`save`
+    :param bool comments: keep comments, see :func:`nginx.config.parser.parse_bytes` (default: True)
+    """
+    def __init__(self, prefix=None, cache_file=None, comments=True):
+        self.prefix = prefix
+        self.cache_file = cache_file
+        self.comments = comments
+        # absolute path -> _CachedFile
+        self.files = {}
+        self.stats = {'parsed': 0, 'reused': 0}
+        if cache_file is not None:
+            self._read_cache()
+
+    def _read_cache(self):
+        try:
+            with io.open(self.cache_file, 'rb') as fp:
+                version, files = pickle.load(fp)
+        except (IOError, OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
+            return
+        if version == _CACHE_VERSION and files.get('comments') == self.comments:
+            self.files = files['files']
+
+    def save(self, cache_file=None):
+        """ Saves the cache to disk, so that another loader can start with it. """
+        cache_file = cache_file or self.cache_file
+        if cache_file is None:
+            raise ValueError('no cache file to save to')
+        files = dict((path, entry) for path, entry in self.files.items() if not entry.dirty)
+        data = pickle.dumps((_CACHE_VERSION, {'comments': self.comments, 'files': files}), pickle.HIGHEST_PROTOCOL)
+        write_atomic(os.path.abspath(cache_file), data)
+
+    def clear(self):
+        """ Forgets every cached file. """
+        self.files.clear()
+
+    def load(self, path):
+        """ Loads a config file with all the files it includes.
+
+        :param str path: path of the main configuration file
+        :rtype: nginx.config.api.EmptyBlock
+        """
+        path = os.path.abspath(path)
+        prefix = os.path.abspath(self.prefix) if self.prefix is not None else os.path.dirname(path)
+        self.stats = {'parsed': 0, 'reused': 0}
+        tracer = get_tracer()
+        if tracer.enabled:
+            with tracer.span('load', 'loader', {'path': path}):
+                return self._load(path, prefix, [])
+        return self._load(path, prefix, [])
+
+    def _file(self, path):
+        """ Returns the cached tree of a file, parsing it if it changed since it was cached. """
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry is not None and not entry.dirty and (entry.mtime, entry.size) == (stat.st_mtime, stat.st_size):
+            if entry.with_includes is None:
+                entry.prepare()
+            self.stats['reused'] += 1
+            return entry
+
+        with io.open(path, 'rb') as fp:
+            try:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can't be mapped
+                data = fp.read()
+            try:
+                digest = hashlib.sha1(data).hexdigest()
+                if entry is not None and not entry.dirty and entry.digest == digest:
+                    # touched, but not changed
+                    entry.mtime, entry.size = stat.st_mtime, stat.st_size
+                    if entry.with_includes is None:
+                        entry.prepare()
+                    self.stats['reused'] += 1
+                    return entry
+                tracer = get_tracer()
+                if tracer.enabled:
+                    with tracer.span(path, 'parse'):
+                        tree = parse_bytes(data, path, self.comments)
+                else:
+                    tree = parse_bytes(data, path, self.comments)
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+
+        entry = self.files[path] = _CachedFile(stat.st_mtime, stat.st_size, digest, tree)
+        entry.prepare()
+        self.stats['parsed'] += 1
+        return entry
+
+    def _included_paths(self, pattern, prefix, source):
+        path = os.path.join(prefix, pattern)
+        if glob.has_magic(path):
+            return sorted(glob.glob(path))
+        if not os.path.exists(path):
+            raise ParseError('included file {0} does not exist'.format(path), source=source)
+        return [path]
+
+    def _load(self, path, prefix, including):
+        if path in including:
+            raise ParseError('include cycle: {0}'.format(' -> '.join(including + [path])), source=path)
+        entry = self._file(path)
+        if id(entry.tree) not in entry.with_includes:
+            return entry.tree
+
+        including = including + [path]
+        # (source block, copy being built, directives of the copy)
+        result = EmptyBlock()
+        stack = [(entry.tree, result, [])]
+        pending = [iter(entry.tree._directives)]
+        while pending:
+            for node in pending[-1]:
+                directives = stack[-1][2]
+                if _is_include(node):
+                    included = EmptyBlock()
+                    included.sections.extend(
+                        self._load(os.path.abspath(included_path), prefix, including)
+                        for included_path in self._included_paths(node.value, prefix, path)
+                    )
+                    directives.append(included)
+                elif node._is_block and id(node) in entry.with_includes:
+                    copy = node.__class__.__new__(node.__class__)
+                    Block.__init__(copy, node.name)
+                    directives.append(copy)
+                    stack.append((node, copy, []))
+                    pending.append(iter(node._directives))
+                    break
+                else:
+                    directives.append(node)
+            else:
+                pending.pop()
+                _, copy, directives = stack.pop()
+                copy.sections.extend(directives)
+        return result
@@ -0,0 +1,211 @@
+"""
+Loads existing nginx configs into block and option objects.
+
+The tokenizer runs in a single pass of one regular expression over the raw bytes of the config,
+handling single and double quotes (with backslash escapes), ``#`` comments and ``${var}``
+variables. :func:`parse_file` memory-maps the file, so even very large configs (such as ones with
+huge ``map`` blocks) are tokenized without first being read into a string.
+
+Blocks become :class:`nginx.config.api.Block` objects, or :class:`nginx.config.api.Location` for
+``location`` blocks, named after the block's directive and arguments (for instance
+``Block('map $uri $target')``). Directives become :class:`nginx.config.api.options.KeyOption` or
+:class:`nginx.config.api.options.KeyValueOption` objects, and comments become
+:class:`nginx.config.api.options.Comment` objects. Everything is added to the ``sections`` of its
+block, rather than its ``options``, so that the order of directives and any repeated directives are
+kept. Quotes are kept as they are, so rendering a parsed config gives back the same directives,
+reformatted; parsing and rendering that output again gives exactly the same text.
+
+Example::
+
+    >>> from nginx.config.parser import parse
+    >>> config = parse('http { server { listen 80; location / { return 200 "ok"; } } }')
+    >>> print(config)
+
+    http {
+        server {
+            listen 80;
+            location / {
+                return 200 "ok";
+            }
+        }
+    }
+
+Blocks of embedded code, such as ``content_by_lua_block``, are not supported.
+"""
+import io
+import mmap
+import re
+
+import six
+
+from .api import Comment, EmptyBlock, Block, Location, KeyOption, KeyValueOption
+
+# Each match is one token, along with any whitespace before it. Runs of plain characters are
+# matched in one go, which makes words much faster to match than one character at a time.
+_TOKENS = re.compile(br'''
+    \s*(?:
+        (?P<comment>\#[^\n]*)
+      | (?P<punct>[{};])
+      | (?P<word>(?:
+            [^\s{};"'\\$\#]+        # plain characters
+          | "(?:[^"\\]|\\.)*"       # double quoted
+          | '(?:[^'\\]|\\.)*'       # single quoted
+          | \$\{[^}\s]*\}           # ${var}
+          | \\.                     # escaped character
+          | [$\#]                  # $ of a variable, or # after the start of a word
+        )+)
+    )
+''', re.VERBOSE | re.DOTALL)
+_SPACE = re.compile(br'\s*')
+
+# token kinds yielded by tokenize
+WORD = 'word'
+OPEN = 'open'
+CLOSE = 'close'
+END = 'end'
+COMMENT = 'comment'
+
+
+class ParseError(ValueError):
+    """ Raised for syntax errors in a config.
+
+    :ivar int line: line number the error was found on, starting at 1
+    """
+    def __init__(self, msg, line=None, source=None):
+        self.msg = msg
+        self.line = line
+        self.source = source
+        super(ParseError, self).__init__('{0}:{1}: {2}'.format(source or '<string>', line, msg))
+
+
+if six.PY3:
+    def _decode(data):
+        return data.decode('utf-8')
+else:
+    def _decode(data):
+        return data
+
+
+def tokenize(data, source=None):
+    """ Splits a config into tokens.
+
+    :param data: config as bytes, or any object supporting the buffer protocol such as an mmap
+    :param str source: name of the config used in error messages
+    :returns: iterator of (kind, text, offset) tuples, where kind is one of :data:`WORD`,
+        :data:`OPEN`, :data:`CLOSE`, :data:`END` or :data:`COMMENT`, and offset is where the token ends
+    """
+    punctuation = {b'{': (OPEN, '{'), b'}': (CLOSE, '}'), b';': (END, ';')}
+    decode = _decode
+    position = 0
+    for match in _TOKENS.finditer(data):
+        if match.start() != position:
+            break
+        # tokens end where their match does, any whitespace is before them
+        position = match.end()
+        comment, punct, word = match.groups()
+        if word is not None:
+            yield WORD, decode(word), position
+        elif punct is not None:
+            kind, text = punctuation[punct]
+            yield kind, text, position
+        else:
+            yield COMMENT, decode(comment), position
+    position = _SPACE.match(data, position).end()
+    if position != len(data):
+        raise ParseError('unexpected {0!r}'.format(_decode(data[position:position + 1])),
+                         line=_line(data, position), source=source)
+
+
+def _line(data, offset):
+    # only used for errors, so copying the start of the data is fine
+    return data[:offset].count(b'\n') + 1
+
+
+def _directive(words):
+    if len(words) == 1:
+        return KeyOption(words[0])
+    return KeyValueOption(words[0], ' '.join(words[1:]))
+
+
+def _block(words):
+    if words[0] == 'location' and len(words) > 1:
+        return Location(' '.join(words[1:]))
+    return Block(' '.join(words))
+
+
+def parse_bytes(data, source=None, comments=True):
+    """ Parses a config held in bytes or a buffer, such as an mmap.
+
+    :param data: config as bytes, or any object supporting the buffer protocol
+    :param str source: name of the config used in error messages
+    :param bool comments: keep comments as :class:`nginx.config.api.options.Comment` objects (default: True)
+    :returns :class:`nginx.config.api.EmptyBlock`: the config, containing its top-level directives
+    """
+    config = EmptyBlock()
+    # (block, directives) of every open block; directives are added all at once when the block
+    # is closed, and the block is then added to its parent
+    stack = [(config, [])]
+    directives = stack[-1][1]
+    words = []
+    for kind, text, offset in tokenize(data, source):
+        if kind == WORD:
+            words.append(text)
+        elif kind == END:
+            if not words:
+                raise ParseError('unexpected ";"', _line(data, offset - 1), source)
+            directives.append(_directive(words))
+            words = []
+        elif kind == OPEN:
+            if not words:
+                raise ParseError('block without a name', _line(data, offset - 1), source)
+            block = _block(words)
+            directives.append(block)
+            directives = []
+            stack.append((block, directives))
+            words = []
+        elif kind == CLOSE:
+            if words:
+                raise ParseError('expected ";" before "}"', _line(data, offset - 1), source)
+            if len(stack) == 1:
+                raise ParseError('unexpected "}"', _line(data, offset - 1), source)
+            block, directives = stack.pop()
+            block.sections.extend(directives)
+            directives = stack[-1][1]
+        elif comments:
+            directives.append(Comment(comment=text[1:].strip()))
+
+    if words:
+        raise ParseError('unexpected end of file, expected ";" or "{"', _line(data, len(data)), source)
+    if len(stack) > 1:
+        raise ParseError('unexpected end of file, expected "}"', _line(data, len(data)), source)
+    config.sections.extend(directives)
+    return config
+
+
+def parse(text, source=None, comments=True):
+    """ Parses a config from a string. See :func:`parse_bytes`.
+
+    :param str text: the config
+    :rtype: nginx.config.api.EmptyBlock
+    """
+    if isinstance(text, six.text_type):
+        text = text.encode('utf-8')
+    return parse_bytes(text, source, comments)
+
+
+def parse_file(path, comments=True):
+    """ Parses a config file, memory-mapping it instead of reading it into memory. See :func:`parse_bytes`.
+
+    :param str path: path of the config file
+    :rtype: nginx.config.api.EmptyBlock
+    """
+    with io.open(path, 'rb') as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            return parse_bytes(fp.read(), path, comments)
+        try:
+            return parse_bytes(data, path, comments)
+        finally:
+            data.close()
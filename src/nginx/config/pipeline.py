@@ -0,0 +1,177 @@
+"""
+Generates a config from asynchronous data sources with :mod:`asyncio`, writing each server to disk
+as soon as it is built.
+
+:func:`generate` reads server specs from an async iterator, such as rows coming from an async
+database driver or pages from an API client, and adds each one to a builder as it arrives. Every
+server is rendered once it is complete and handed over to be written to its own file, the same way
+:class:`nginx.config.writer.ConfigWriter` lays out a config, while the next specs are being read
+and built. Waiting on the source, building and writing the files thus overlap instead of following
+one another, and only a bounded number of specs and rendered servers are ever waiting: a source
+faster than the builder is slowed down rather than buffered in memory, and so is a builder faster
+than the disk. The main file is written last, so nginx never sees it include a server that isn't
+written yet.
+
+Example::
+
+    import asyncio
+
+    from nginx.config.pipeline import generate
+    from nginx.config.writer import ConfigWriter
+
+    # any async iterable of dicts will do, here the rows of a database query
+    tenants = db.fetch('SELECT hostname, port AS listen FROM tenants')
+    result = asyncio.get_event_loop().run_until_complete(generate(tenants, ConfigWriter('/etc/nginx')))
+    if result.changed:
+        reload_nginx()
+
+This module requires Python 3.5 or later, it is left out when installing on Python 2. Sources written
+as asynchronous generators (``async def`` with ``yield``) need Python 3.6 or later.
+"""
+import asyncio
+import os
+
+from .api.render import RenderContext, render
+from .builder import NginxConfigBuilder
+from .helpers import _find_http
+from .index import is_server
+from .writer import WriteResult, _file_text
+
+# marks the end of a queue
+_DONE = object()
+
+
+async def _read(servers, queue):
+    """ Moves the specs from an async iterable to a queue, waiting while it is full. """
+    async for spec in servers:
+        await queue.put(spec)
+    await queue.put(_DONE)
+
+
+async def _routes(routes):
+    """ Returns the rows of routes given either as an iterable or an async iterable. """
+    if not hasattr(routes, '__aiter__'):
+        return list(routes)
+    rows = []
+    async for row in routes:
+        rows.append(row)
+    return rows
+
+
+async def _get(queue, tasks):
+    if queue.empty():
+        return await _unless_failed(queue.get(), tasks)
+    return queue.get_nowait()
+
+
+async def _put(queue, item, tasks):
+    if queue.full():
+        await _unless_failed(queue.put(item), tasks)
+    else:
+        queue.put_nowait(item)
+    # give the other stages a chance to run
+    await asyncio.sleep(0)
+
+
+async def _unless_failed(awaitable, tasks):
+    """ Returns the result of an awaitable, unless one of the tasks fails first: its exception is
+    raised instead, rather than waiting forever on a queue it was meant to fill or empty.
+    """
+    future = asyncio.ensure_future(awaitable)
+    while not future.done():
+        await asyncio.wait([future] + [task for task in tasks if not task.done()], return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                future.cancel()
+                task.result()
+    return future.result()
+
+
+def _write_files(writer, files, expected, result):
+    for relative, text in files:
+        writer._write_file(relative, text, expected, result)
+
+
+async def _write(writer, queue, expected, result):
+    """ Writes the files put in a queue off the event loop, taking all those waiting at once. """
+    loop = asyncio.get_event_loop()
+    done = False
+    while not done:
+        files = [await queue.get()]
+        while not queue.empty():
+            files.append(queue.get_nowait())
+        if files[-1] is _DONE:
+            done = True
+            files.pop()
+        await loop.run_in_executor(None, _write_files, writer, files, expected, result)
+
+
+async def generate(servers, writer, builder=None, queue_size=64):
+    """ Builds servers from an async source, writing each one as soon as it is built.
+
+    Each spec holds the keyword arguments of :meth:`nginx.config.builder.baseplugins.ServerPlugin.add_server`,
+    such as ``hostname``, server options or a ``template`` and its values. Its ``routes`` are rows
+    as taken by :meth:`nginx.config.builder.baseplugins.Routable.add_routes`, and can come from an
+    async iterable too. The files written are the same as those :meth:`nginx.config.writer.ConfigWriter.write`
+    writes for the finished config, including the servers the builder already had.
+
+    :param servers: async iterable of dicts, one per server
+    :param nginx.config.writer.ConfigWriter writer: where and how to write the config; snippets
+        aren't supported, as they need the whole config up front
+    :param nginx.config.builder.NginxConfigBuilder builder: builder to add the servers to (default: a new builder)
+    :param int queue_size: most specs read ahead of the builder, and most servers waiting to be written (default: 64)
+    :rtype: nginx.config.writer.WriteResult
+    """
+    if writer.snippets:
+        raise ValueError('snippets are not supported when generating configs from a pipeline')
+    if builder is None:
+        builder = NginxConfigBuilder()
+    config = builder._config()
+    context = RenderContext.for_node(config)
+    http, level = _find_http(config, context.indent_level)
+    server_context = RenderContext(indent_char=context.indent_char, indent=context.indent)
+    indent = context.get_indent(level + 1)
+
+    result = WriteResult()
+    expected = set()
+    directories = writer._directories()
+    specs = asyncio.Queue(queue_size)
+    files = asyncio.Queue(queue_size)
+    reader = asyncio.ensure_future(_read(servers, specs))
+    saver = asyncio.ensure_future(_write(writer, files, expected, result))
+
+    names = set()
+    prerendered = {}
+
+    async def add(server):
+        name = writer._file_name(server, len(prerendered), names)
+        prerendered[id(server)] = writer._include(name, indent)
+        text = _file_text(render(server, server_context))
+        await _put(files, (os.path.join(writer.include_dir, name), text), [saver])
+
+    try:
+        for server in [section for section in http.sections if is_server(section)]:
+            await add(server)
+        while True:
+            spec = await _get(specs, [reader, saver])
+            if spec is _DONE:
+                break
+            spec = dict(spec)
+            routes = await _routes(spec.pop('routes', ()))
+            wrapper = builder.add_server(routes=routes, **spec)
+            server = builder._cwo
+            wrapper.end()
+            await add(server)
+        await _put(files, _DONE, [saver])
+        await saver
+    finally:
+        for task in (reader, saver):
+            if not task.done():
+                task.cancel()
+
+    def finish():
+        writer._write_file(writer.main, writer._render_main(config, context, prerendered), expected, result)
+        writer._prune(directories, expected, result)
+
+    await asyncio.get_event_loop().run_in_executor(None, finish)
+    return result
@@ -0,0 +1,236 @@
+"""
+Offline request routing: work out which location block nginx would pick for a request.
+
+Locations are compiled into the order nginx matches them in: exact (``=``) locations first, then
+the longest matching prefix location (found through a :class:`nginx.config.index.PrefixTrie`),
+whose nested locations are searched the same way, then regular expression (``~`` and ``~*``)
+locations in the order they appear, unless the longest prefix was marked with ``^~``. Patterns are
+compiled once, so resolving large batches of URIs (for instance, replayed from access logs) is fast.
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> from nginx.config.routing import RouteTable
+    >>> server = Block(
+    ...     'server',
+    ...     Location('/'),
+    ...     Location('^~ /static/'),
+    ...     Location('~* \\\\.php$'),
+    ...     Location('= /'),
+    ... )
+    >>> routes = RouteTable(server)
+    >>> [location.name for location in routes.resolve_many(['/', '/index.php', '/static/x.php', '/about'])]
+    ['location = /', 'location ~* \\\\.php$', 'location ^~ /static/', 'location /']
+
+"""
+import re
+
+from .index import ConfigIndex, PrefixTrie, is_location, parse_location
+
+# how a location was matched
+EXACT = 'exact'
+PREFIX = 'prefix'
+REGEX = 'regex'
+
+
+class _Prefix(object):
+    __slots__ = ('location', 'noregex', 'nested')
+
+    def __init__(self, location, noregex, nested):
+        self.location = location
+        self.noregex = noregex
+        self.nested = nested
+
+
+class _Level(object):
+    """ The locations directly inside a server or location, compiled for matching. """
+    __slots__ = ('exact', 'prefixes', 'regexes')
+
+    def __init__(self):
+        self.exact = {}
+        self.prefixes = PrefixTrie()
+        # (compiled pattern, location, nested level) in config order
+        self.regexes = []
+
+    def __bool__(self):
+        return bool(self.exact or len(self.prefixes) or self.regexes)
+
+    __nonzero__ = __bool__
+
+
+def _compile(block):
+    level = _Level()
+    for location in _locations_in(block):
+        modifier, path = parse_location(location.name)
+        if path.startswith('@'):
+            # named locations are only reachable through internal redirects
+            continue
+        nested = _compile(location)
+        nested = nested if nested else None
+        if modifier == '=':
+            level.exact.setdefault(path, location)
+        elif modifier in ('~', '~*'):
+            pattern = re.compile(path, re.IGNORECASE if modifier == '~*' else 0)
+            level.regexes.append((pattern, location, nested))
+        elif path not in level.prefixes:
+            level.prefixes[path] = _Prefix(location, modifier == '^~', nested)
+    return level
+
+
+def _locations_in(block):
+    """ Returns the locations directly inside a block in config order, looking through unnamed blocks. """
+    found = []
+    stack = [iter(block._directives)]
+    while stack:
+        for directive in stack[-1]:
+            if not directive._is_block:
+                continue
+            if not directive._opens_scope:
+                stack.append(iter(directive._directives))
+                break
+            if is_location(directive):
+                found.append(directive)
+        else:
+            stack.pop()
+    return found
+
+
+def _find(level, uri):
+    """ Matches a URI against a compiled level the way ngx_http_core_find_location does.
+
+    :returns: tuple of (location, how it matched), or (None, None)
+    """
+    location = level.exact.get(uri)
+    if location is not None:
+        return location, EXACT
+
+    found, how, noregex = None, None, False
+    match = level.prefixes.longest_prefix(uri)
+    if match is not None:
+        prefix = match[1]
+        found, how, noregex = prefix.location, PREFIX, prefix.noregex
+        if prefix.nested is not None:
+            nested, nested_how = _find(prefix.nested, uri)
+            if nested_how in (EXACT, REGEX):
+                return nested, nested_how
+            if nested is not None:
+                found = nested
+
+    if not noregex:
+        for pattern, location, nested in level.regexes:
+            if pattern.search(uri):
+                if nested is not None:
+                    location = _find(nested, uri)[0] or location
+                return location, REGEX
+
+    return found, how
+
+
+class RouteTable(object):
+    """ The locations of a server block compiled into nginx's matching order.
+
+    The table is a snapshot: compile a new one after changing the server's locations.
+
+    :param nginx.config.api.Block server: server block to route requests for
+    """
+    def __init__(self, server):
+        self.server = server
+        self._level = _compile(server)
+
+    def match(self, uri):
+        """ Returns the location a URI is routed to, and how it was matched (``'exact'``,
+        ``'prefix'`` or ``'regex'``), or ``(None, None)`` if no location matches.
+
+        :param str uri: request URI; any query string is ignored
+        """
+        return _find(self._level, uri.split('?', 1)[0])
+
+    def resolve(self, uri):
+        """ Returns the location a URI is routed to, or None.
+
+        :param str uri: request URI; any query string is ignored
+        """
+        return self.match(uri)[0]
+
+    def resolve_many(self, uris):
+        """ Resolves a batch of URIs, returning the location for each in order.
+
+        Repeated URIs are only resolved once per batch.
+
+        :param iterable uris: request URIs
+        :rtype: list
+        """
+        level = self._level
+        seen = {}
+        results = []
+        for uri in uris:
+            try:
+                results.append(seen[uri])
+            except KeyError:
+                location = seen[uri] = _find(level, uri.split('?', 1)[0])[0]
+                results.append(location)
+        return results
+
+
+class Router(object):
+    """ Routes requests to the locations of every server in a config.
+
+    Servers are picked by exact ``server_name``; requests for unknown hosts go to the first server,
+    as they would without a ``default_server``. Route tables are compiled on first use and discarded
+    whenever the config changes.
+
+    :param nginx.config.api.Block root: block containing the servers, usually ``http``
+    """
+    def __init__(self, root):
+        self.index = ConfigIndex(root)
+        self._tables = {}
+        root.add_observer(self)
+
+    def block_changed(self, block, added, removed, options):
+        """ Observer callback, see :meth:`nginx.config.api.Block.add_observer`. """
+        self._tables.clear()
+
+    def close(self):
+        """ Stops following changes to the config. """
+        root = self.index.root
+        self.index.close()
+        if root is not None:
+            root.remove_observer(self)
+
+    def server(self, host):
+        """ Returns the server block that handles a host name, or None if there are no servers. """
+        server = self.index.server(host.split(':', 1)[0])
+        if server is None:
+            servers = self.index.servers()
+            server = servers[0] if servers else None
+        return server
+
+    def table(self, host):
+        """ Returns the :class:`RouteTable` of the server handling a host name, or None. """
+        server = self.server(host)
+        if server is None:
+            return None
+        table = self._tables.get(id(server))
+        if table is None:
+            table = self._tables[id(server)] = RouteTable(server)
+        return table
+
+    def resolve(self, host, uri):
+        """ Returns the location a request for ``host`` and ``uri`` is routed to, or None. """
+        table = self.table(host)
+        return table.resolve(uri) if table is not None else None
+
+    def resolve_many(self, requests):
+        """ Resolves a batch of (host, uri) pairs, returning the location for each in order. """
+        by_host = {}
+        for position, (host, uri) in enumerate(requests):
+            by_host.setdefault(host, []).append((position, uri))
+
+        results = [None] * sum(len(batch) for batch in by_host.values())
+        for host, batch in by_host.items():
+            table = self.table(host)
+            if table is None:
+                continue
+            for (position, _), location in zip(batch, table.resolve_many([uri for _, uri in batch])):
+                results[position] = location
+        return results
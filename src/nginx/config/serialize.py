@@ -0,0 +1,397 @@
+"""
+Compact serialization of config trees, for passing them between processes or pipeline stages.
+
+Two forms are supported:
+
+* :func:`to_dict` and :func:`from_dict` convert a tree to and from nested dicts and lists, which
+  can be written out with :mod:`json` (provided the option values can be).
+* :func:`to_bytes` and :func:`from_bytes` use a compact binary form: every string is stored once
+  in a table, and the tree is flattened into a single array of integers, one record per node in
+  post-order, so that it can be written and read by :mod:`marshal` in one go. Like marshal, the
+  binary form is only meant to be read by the same version of Python that wrote it.
+
+Both forms keep option values as they were assigned, so a round trip gives back a tree that
+renders the same and has the same options. Only None, booleans, numbers, strings and lists are
+kept as they are, though: values of other types, such as enums, are kept as the text they render
+as, and so are the items of lists. Trees are rebuilt from the bottom up, adding all of a
+block's sections at once. The binary form also records the option objects each block renders its
+options with, so they aren't converted again. Measured with ``python -m benchmarks.serialize``
+(servers of 10 locations each), loading the binary form takes about a third of the time of
+unpickling the same tree at 300 servers, and about a quarter at 2000 servers. Loading the dict
+form back from JSON is only about 1.3 times as fast as unpickling, because it converts every option again.
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> from nginx.config.serialize import from_bytes, to_bytes, to_dict
+    >>> server = Block('server', Location('/', proxy_pass='http://upstream'), listen=80)
+    >>> data = to_dict(server)
+    >>> data['options'], data['sections'][0]['name']
+    ([['listen', 80]], 'location /')
+    >>> repr(from_bytes(to_bytes(server))) == repr(server)
+    True
+
+Only the node types in :mod:`nginx.config.api` can be serialized, along with their subclasses,
+which are read back as the class they derive from; anything else raises TypeError.
+"""
+import array
+import gc
+import marshal
+
+import six
+
+from .api import Block, Comment, EmptyBlock, Fragment, KeyMultiValueOption, KeyOption, KeyValueOption, Location
+from .api.base import Base
+from .api.options import KeyValuesMultiLines
+
+_FORMAT = 'nginx-config'
+_VERSION = 1
+
+# node kinds; the blocks come first so that ``kind <= _LOCATION`` tells them apart
+_EMPTY, _BLOCK, _LOCATION, _KEY, _VALUE, _MULTI_VALUE, _LINES, _COMMENT, _FRAGMENT = range(9)
+
+_KINDS = {
+    EmptyBlock: _EMPTY,
+    Block: _BLOCK,
+    Location: _LOCATION,
+    KeyOption: _KEY,
+    KeyValueOption: _VALUE,
+    KeyMultiValueOption: _MULTI_VALUE,
+    KeyValuesMultiLines: _LINES,
+    Comment: _COMMENT,
+    Fragment: _FRAGMENT,
+}
+_CLASSES = dict((kind, cls) for cls, kind in _KINDS.items())
+_NAMES = ['empty', 'block', 'location', 'key', 'value', 'multivalue', 'lines', 'comment', 'fragment']
+_KINDS_BY_NAME = dict((name, kind) for kind, name in enumerate(_NAMES))
+
+# array typecodes the integers of the binary form are packed with, smallest first
+_TYPECODES = ('B', 'H', 'I', 'L')
+
+
+# option values of these types are kept as they are; others, such as enums, are kept as text
+_VALUE_TYPES = frozenset((type(None), bool, float, str, six.text_type) + six.integer_types)
+
+
+def _kind(node):
+    try:
+        return _KINDS[type(node)]
+    except KeyError:
+        pass
+    # subclasses are serialized as the closest class they derive from
+    for cls in type(node).__mro__:
+        if cls in _KINDS:
+            kind = _KINDS[type(node)] = _KINDS[cls]
+            return kind
+    raise TypeError('cannot serialize {0} objects'.format(type(node).__name__))
+
+
+def _value(value):
+    """ Returns an option value as it is serialized: a copy of a list, the text a value of any
+    other type than those of _VALUE_TYPES renders as, or the value itself.
+    """
+    if type(value) in _VALUE_TYPES:
+        return value
+    if isinstance(value, list):
+        return [item if type(item) in _VALUE_TYPES else str(item) for item in value]
+    return '{0}'.format(value)
+
+
+def _new_block(kind, name):
+    if kind == _EMPTY:
+        return EmptyBlock()
+    if kind == _BLOCK:
+        return Block(name)
+    # the name of a location already starts with "location"
+    block = Location.__new__(Location)
+    Block.__init__(block, name)
+    return block
+
+
+def _new_option(kind, name, value):
+    if kind == _FRAGMENT:
+        return Fragment._from_nested(value)
+    option = _CLASSES[kind].__new__(_CLASSES[kind])
+    if kind == _COMMENT:
+        option._offset = name
+        option._comment = value
+    elif kind == _LINES:
+        option._name = name
+        option._texts = list(value)
+    else:
+        option._name = name
+        option._value = name if kind == _KEY else value
+    return option
+
+
+def _copy(value):
+    return list(value) if isinstance(value, list) else value
+
+
+def _without_gc(func, *args):
+    """ Calls a function with the garbage collector paused. Trees hold no reference cycles, so
+    collecting while one is rebuilt would only slow down allocating every node.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return func(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def to_dict(node):
+    """ Converts a tree into nested dicts and lists.
+
+    Every node becomes a dict with a ``type`` (``empty``, ``block``, ``location``, ``key``,
+    ``value``, ``multivalue``, ``lines``, ``comment`` or ``fragment``). Blocks have a ``name`` (except for empty
+    blocks), and ``options`` and ``sections`` when they have any; options are a list of
+    ``[key, value]`` pairs, in order.
+
+    :param nginx.config.api.base.Base node: root of the tree
+    :rtype: dict
+    """
+    result = []
+    stack = [(node, result)]
+    while stack:
+        node, out = stack.pop()
+        kind = _kind(node)
+        data = {'type': _NAMES[kind]}
+        out.append(data)
+        if kind <= _LOCATION:
+            if kind != _EMPTY:
+                data['name'] = node.name
+            pending = []
+            if node.options:
+                options = data['options'] = []
+                for key, value in node.options.items():
+                    if isinstance(value, Base):
+                        # the value's dict is appended to the pair once it is converted
+                        pair = [key]
+                        pending.append((value, pair))
+                    else:
+                        pair = [key, _value(value)]
+                    options.append(pair)
+            if node.sections:
+                sections = data['sections'] = []
+                pending.extend((section, sections) for section in node.sections)
+            stack.extend(reversed(pending))
+        elif kind == _COMMENT:
+            data['offset'] = node._offset
+            data['comment'] = node._comment
+        elif kind == _LINES:
+            data['name'] = node.name
+            data['lines'] = list(node.lines)
+        elif kind == _FRAGMENT:
+            data['lines'] = [[depth, text] for depth, text in node._nested]
+        else:
+            data['name'] = node.name
+            if kind != _KEY:
+                data['value'] = _value(node.value)
+    return result[0]
+
+
+def from_dict(data):
+    """ Rebuilds a tree converted by :func:`to_dict`.
+
+    :param dict data: the converted tree
+    :rtype: nginx.config.api.base.Base
+    """
+    return _without_gc(_from_dict, data)
+
+
+def _from_dict(data):
+    built = []
+    stack = [(data, False)]
+    while stack:
+        data, ready = stack.pop()
+        try:
+            kind = _KINDS_BY_NAME[data['type']]
+        except (KeyError, TypeError):
+            raise ValueError('not a serialized node: {0!r}'.format(data))
+        if kind == _COMMENT:
+            built.append(_new_option(kind, data.get('offset', ''), data.get('comment', '')))
+            continue
+        if kind == _FRAGMENT:
+            built.append(_new_option(kind, None, data.get('lines', ())))
+            continue
+        if kind > _LOCATION:
+            built.append(_new_option(kind, data['name'], _copy(data.get('lines' if kind == _LINES else 'value'))))
+            continue
+
+        options = data.get('options', ())
+        sections = data.get('sections', ())
+        nodes = [value for _, value in options if isinstance(value, dict)]
+        if not ready:
+            # build the blocks used as option values and the sections first, then this block
+            stack.append((data, True))
+            stack.extend((child, False) for child in reversed(nodes + list(sections)))
+            continue
+
+        block = _new_block(kind, data.get('name'))
+        start = len(built) - len(nodes) - len(sections)
+        middle = start + len(nodes)
+        if options:
+            values = iter(built[start:middle])
+            block.options.update([(key, next(values) if isinstance(value, dict) else _copy(value)) for key, value in options])
+        if sections:
+            block.sections.extend(built[middle:])
+        del built[start:]
+        built.append(block)
+    return built[0]
+
+
+def _flatten(root):
+    """ Returns the (table, codes) of the binary form of a tree.
+
+    ``table`` holds every distinct name and value, and ``codes`` refers to them by position;
+    position 0 stands for "none" (the name of an unnamed block, or an option value that is the
+    option's own block). Each block is preceded by the option objects its options are rendered
+    with (see :meth:`nginx.config.api.options.OptionDict.prepared`), then by its sections. Its
+    record is ``kind, name, number of sections, number of options`` followed by a ``key, value``
+    pair for each option.
+    """
+    table = [None]
+    positions = {}
+    codes = []
+
+    def ref(value):
+        # values of different types can be equal (1 == True), so the type is part of the key
+        try:
+            key = (type(value), tuple(value) if type(value) is list else value)
+            position = positions.get(key)
+        except TypeError:
+            key = position = None
+        if position is None:
+            position = len(table)
+            table.append(value)
+            if key is not None:
+                positions[key] = position
+        return position
+
+    stack = [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        kind = _kind(node)
+        if kind <= _LOCATION:
+            options = node.options
+            if not ready:
+                stack.append((node, True))
+                prepared = options.prepared()
+                stack.extend((child, False) for child in reversed(prepared + node.sections.values()))
+                continue
+            codes.extend((kind, ref(node.name) if kind != _EMPTY else 0, len(node.sections), len(options)))
+            for key, value in options.items():
+                # a block used as an option value is its own prepared option
+                codes.extend((ref(key), 0 if isinstance(value, Base) else ref(_value(value))))
+        elif kind == _KEY:
+            codes.extend((kind, ref(node.name)))
+        elif kind == _COMMENT:
+            codes.extend((kind, ref(node._offset), ref(node._comment)))
+        elif kind == _LINES:
+            codes.extend((kind, ref(node.name), len(node.lines)))
+            codes.extend(ref(line) for line in node.lines)
+        elif kind == _FRAGMENT:
+            codes.extend((kind, len(node._nested)))
+            for depth, text in node._nested:
+                codes.extend((depth, ref(text)))
+        else:
+            codes.extend((kind, ref(node.name), ref(_value(node.value))))
+    return table, codes
+
+
+def _unflatten(table, codes):
+    """ Rebuilds a tree from the output of :func:`_flatten`. """
+    new_option = _new_option
+    built = []
+    position = 0
+    end = len(codes)
+    while position < end:
+        kind = codes[position]
+        if kind <= _LOCATION:
+            name, n_sections, n_options = codes[position + 1:position + 4]
+            position += 4
+            block = _new_block(kind, table[name])
+            start = len(built) - n_options - n_sections
+            if n_options:
+                items = []
+                for option in built[start:start + n_options]:
+                    key, value = codes[position:position + 2]
+                    position += 2
+                    value = table[value] if value else option
+                    items.append((table[key], list(value) if type(value) is list else value, option))
+                block.options._restore(items)
+            if n_sections:
+                block.sections.extend(built[start + n_options:])
+            del built[start:]
+            built.append(block)
+        elif kind == _KEY:
+            built.append(new_option(kind, table[codes[position + 1]], None))
+            position += 2
+        elif kind == _COMMENT:
+            built.append(new_option(kind, table[codes[position + 1]], table[codes[position + 2]]))
+            position += 3
+        elif kind == _LINES:
+            count = codes[position + 2]
+            lines = [table[line] for line in codes[position + 3:position + 3 + count]]
+            built.append(new_option(kind, table[codes[position + 1]], lines))
+            position += 3 + count
+        elif kind == _FRAGMENT:
+            count = codes[position + 1]
+            nested = codes[position + 2:position + 2 + 2 * count]
+            built.append(new_option(kind, None, zip(nested[::2], [table[text] for text in nested[1::2]])))
+            position += 2 + 2 * count
+        else:
+            value = table[codes[position + 2]]
+            built.append(new_option(kind, table[codes[position + 1]], list(value) if type(value) is list else value))
+            position += 3
+    if len(built) != 1:
+        raise ValueError('not a serialized config tree')
+    return built[0]
+
+
+def _pack(codes):
+    """ Packs non-negative integers into bytes, using the smallest item size that fits them. """
+    largest = max(codes) if codes else 0
+    for typecode in _TYPECODES:
+        if largest < 1 << (8 * array.array(typecode).itemsize):
+            break
+    packed = array.array(typecode, codes)
+    return typecode, packed.tobytes() if six.PY3 else packed.tostring()
+
+
+def _unpack(typecode, data):
+    codes = array.array(typecode)
+    if six.PY3:
+        codes.frombytes(data)
+    else:
+        codes.fromstring(data)
+    return codes.tolist()
+
+
+def to_bytes(node):
+    """ Serializes a tree into the compact binary form.
+
+    :param nginx.config.api.base.Base node: root of the tree
+    :rtype: bytes
+    """
+    table, codes = _flatten(node)
+    typecode, packed = _pack(codes)
+    return marshal.dumps((_FORMAT, _VERSION, table, typecode, packed))
+
+
+def from_bytes(data):
+    """ Rebuilds a tree serialized by :func:`to_bytes`.
+
+    :param bytes data: the serialized tree
+    :rtype: nginx.config.api.base.Base
+    """
+    try:
+        header, version, table, typecode, packed = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        raise ValueError('not a serialized config tree')
+    if header != _FORMAT or version != _VERSION:
+        raise ValueError('unsupported serialization format {0!r} {1!r}'.format(header, version))
+
+    return _without_gc(_unflatten, table, _unpack(typecode, packed))
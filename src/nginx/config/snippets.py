@@ -0,0 +1,148 @@
+"""
+Moves subtrees that appear many times in a config into snippet files that are included instead.
+
+Configs built from shared building blocks, such as the ``uwsgi_params`` or
+``statsd_options_location`` groups of :mod:`nginx.config.common`, repeat the same directives in
+every location. :func:`find_snippets` compares blocks by their fingerprint (see
+:mod:`nginx.config.api.fingerprint`), and picks the largest blocks that occur at least ``min_copies``
+times and render to at least ``min_bytes``. Each is written once as a snippet, and every copy is
+rendered as an ``include`` of it instead. The tree itself is left untouched.
+
+Example::
+
+    from nginx.config.snippets import find_snippets
+
+    plan = find_snippets(config, min_bytes=256)
+    for name, text in plan.snippets.items():
+        with open(os.path.join('/etc/nginx', name), 'w') as fp:
+            fp.write(text)
+    with open('/etc/nginx/nginx.conf', 'w') as fp:
+        fp.write(plan.render(config))
+    print('saved {0} bytes'.format(plan.bytes_saved))
+
+:class:`nginx.config.writer.ConfigWriter` does all of this when created with ``snippets=True``.
+"""
+from .api.options import KeyValueOption
+from .api.render import RenderContext, render
+
+
+def _measure(root, indent):
+    """ Measures the rendered size of every block below ``root``.
+
+    :returns: dict of id(block) -> (fingerprint, size at level 0, number of lines)
+    """
+    measures = {}
+    # (node, children pending) entries, children are measured before their parent
+    stack = [(root, True)]
+    while stack:
+        node, expand = stack.pop()
+        if not node._is_block or id(node) in measures:
+            continue
+        directives = node._directives
+        if expand:
+            stack.append((node, False))
+            stack.extend((child, True) for child in directives if child._is_block)
+            continue
+
+        size = lines = 0
+        for child in directives:
+            if child._is_block:
+                child_size, child_lines = measures[id(child)][1:]
+            else:
+                text = child._lines()
+                child_size = sum(len(line) + 1 for line in text)
+                child_lines = len(text)
+            size += child_size
+            lines += child_lines
+        if node._opens_scope:
+            # children are indented one level deeper, and the block adds its opening and closing lines
+            size += lines * indent + len(node.name) + 3 + 2
+            lines += 2
+        measures[id(node)] = (node.fingerprint, size, lines)
+    return measures
+
+
+class SnippetPlan(object):
+    """ The snippets chosen by :func:`find_snippets`, and where they are included.
+
+    :ivar dict snippets: snippet path -> snippet text
+    :ivar dict includes: id(node) -> (node, level, snippet path) for every copy being replaced, with
+        the level of its first copy when the same node is found at several levels
+    :ivar int bytes_saved: how many fewer bytes the config and its snippets take than the plain config
+    """
+    def __init__(self, include_dir):
+        self.include_dir = include_dir
+        self.snippets = {}
+        self.includes = {}
+        self.bytes_saved = 0
+
+    def prerendered(self):
+        """ Returns the ``include`` option replacing each copy, for use as ``RenderContext.prerendered``.
+
+        The options are rendered wherever the copies are, so this works for the config and for any
+        block nested in it alike.
+        """
+        options = {}
+        for path in self.snippets:
+            options[path] = KeyValueOption('include', path)
+        return dict((key, options[path]) for (key, (node, level, path)) in self.includes.items())
+
+    def render(self, config):
+        """ Renders a config with every copy replaced by an ``include`` of its snippet. """
+        context = RenderContext.for_node(config, use_cache=False)
+        context.prerendered = self.prerendered()
+        return render(config, context)
+
+
+def find_snippets(root, min_bytes=256, min_copies=2, include_dir='snippets', exclude=None):
+    """ Finds repeated subtrees worth moving into snippet files.
+
+    :param root: config object to search
+    :param int min_bytes: smallest size of a subtree to move, rendered without indentation (default: 256)
+    :param int min_copies: fewest copies of a subtree to move it (default: 2)
+    :param str include_dir: directory the snippets are written to and included from (default: snippets)
+    :param exclude: callable returning True for blocks that must not be moved, though their children may be
+    :rtype: SnippetPlan
+    """
+    context = RenderContext.for_node(root)
+    indent = len(context.indent_char) * context.indent
+    measures = _measure(root, indent)
+    rejected = set()
+
+    while True:
+        # the outermost qualifying copies of each subtree, found from the top down
+        found = {}
+        stack = [(root, context.indent_level)]
+        while stack:
+            node, level = stack.pop()
+            if not node._is_block:
+                continue
+            digest, size, lines = measures[id(node)]
+            if (node is not root and digest not in rejected and size >= min_bytes and
+                    (exclude is None or not exclude(node))):
+                found.setdefault(digest, []).append((node, level))
+                continue
+            level += 1 if node._opens_scope else 0
+            stack.extend((child, level) for child in node._directives)
+
+        # copies nested in other snippets aren't seen, so some subtrees may now be too rare
+        rare = [digest for digest, copies in found.items() if len(copies) < min_copies]
+        if not rare:
+            break
+        rejected.update(rare)
+
+    plan = SnippetPlan(include_dir)
+    snippet_context = RenderContext(indent_char=context.indent_char, indent=context.indent, fill_cache=False)
+    for digest, copies in found.items():
+        path = '{0}/{1}.conf'.format(include_dir.rstrip('/'), digest[:16]) if include_dir else digest[:16] + '.conf'
+        node = copies[0][0]
+        text = render(node, snippet_context)
+        plan.snippets[path] = text[1:] + '\n' if text else ''
+        size, lines = measures[id(node)][1:]
+
+        plan.bytes_saved -= size
+        for node, level in copies:
+            plan.includes.setdefault(id(node), (node, level, path))
+            include = len(context.get_indent(level)) + len('include {0};'.format(path)) + 1
+            plan.bytes_saved += size + lines * indent * level - include
+    return plan
@@ -0,0 +1,362 @@
+"""
+Templates for blocks that are repeated many times with a few differences, such as the servers of
+many tenants.
+
+A template is an ordinary block (usually a ``server``) in which :func:`placeholder` stands for
+the values that differ between instances, in block names, option values or anywhere inside them.
+The template renders itself once; each :meth:`Template.instantiate` then only fills the
+placeholders in that text. The tree of an instance is only built if it is looked at, and even then
+only the few blocks holding placeholders are copied while the rest is shared with the template
+(see :meth:`nginx.config.api.Block.clone`). Creating and rendering thousands of instances costs
+little more than joining strings.
+
+Example::
+
+    >>> from nginx.config.api import Block, Location
+    >>> from nginx.config.templates import Template, placeholder
+    >>> tenant = Template(Block(
+    ...     'server',
+    ...     Location('/', proxy_pass='http://{0}'.format(placeholder('upstream'))),
+    ...     server_name=placeholder('hostname'),
+    ...     listen=placeholder('port'),
+    ...     ssl_certificate='/etc/ssl/{0}.pem'.format(placeholder('hostname')),
+    ... ))
+    >>> print(tenant.instantiate(hostname='a.example.com', port=8443, upstream='backend_a'))
+
+        server {
+            server_name a.example.com;
+            listen 8443;
+            ssl_certificate /etc/ssl/a.example.com.pem;
+            location / {
+                proxy_pass http://backend_a;
+            }
+        }
+
+Templates can also be used through the builder, see
+:meth:`nginx.config.builder.baseplugins.ServerPlugin.add_server`. Instances share the blocks of the
+template that hold no placeholders, so use :meth:`nginx.config.api.Block.edit` to modify those in
+a single instance; the template itself must not be modified once it is created.
+"""
+import re
+
+import six
+
+from .api import Block
+from .api.base import _state_slots
+from .api.blocks import _origins
+from .api.render import RenderContext, iter_lines
+
+_MARKER = re.compile('\x00(\\w+)\x00')
+
+
+def placeholder(name):
+    """ Returns the text standing for a named value in a template.
+
+    The text can be used on its own, or as part of a longer string.
+
+    :param str name: name of the value, made of letters, digits and underscores
+    :rtype: str
+    """
+    if not re.match(r'\w+$', name):
+        raise ValueError('invalid placeholder name {0!r}'.format(name))
+    return '\x00{0}\x00'.format(name)
+
+
+# types of values whose text renders the same wherever they are used in an option; subclasses,
+# such as enums, may be formatted differently
+_STRING_TYPES = frozenset(six.string_types)
+_PLAIN_TYPES = frozenset(six.string_types + six.integer_types + (bool, list))
+
+
+def _plain(value, text):
+    """ Tells whether a value renders as its text in any option, and not, say, as a bare key. """
+    return type(value) in _PLAIN_TYPES and text and ' '.join(text.split()) == text
+
+
+def _text(value):
+    # the same conversions as KeyValueOption and KeyMultiValueOption
+    if isinstance(value, bool):
+        return 'on' if value else 'off'
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(item) for item in value)
+    if value is None:
+        return ''
+    return str(value)
+
+
+def _split_value(value):
+    """ Splits an option value holding placeholders into text and placeholder names alternately,
+    as a tuple, or each of the items of a list.
+    """
+    if isinstance(value, six.string_types):
+        return tuple(_MARKER.split(value))
+    return [_split_value(item) if isinstance(item, six.string_types) else item for item in value]
+
+
+def _join(parts, texts):
+    filled = list(parts)
+    filled[1::2] = [texts[name] for name in parts[1::2]]
+    return ''.join(filled)
+
+
+def _option_text(build, key, value):
+    """ Returns what follows the key in the line an option renders as. """
+    # the most common values, rendered as Block._build_options would without building an option
+    if isinstance(value, list):
+        return ' ' + ' '.join([str(item) for item in value])
+    if type(value) in _STRING_TYPES and value and ' ' not in value:
+        return ' ' + value
+    option = build(key, value)
+    if option._is_block:
+        raise TypeError('option {0!r} can only be given a value, not a block'.format(key))
+    return option._lines()[0][len(key):-1]
+
+
+def _names(value):
+    """ Returns the names of the placeholders in an option value or attribute. """
+    if isinstance(value, six.string_types):
+        return _MARKER.findall(value)
+    if isinstance(value, (list, tuple)):
+        return [name for item in value for name in _names(item)]
+    return []
+
+
+def _whole(value):
+    """ Tells whether an option value is a single placeholder. """
+    if not isinstance(value, six.string_types):
+        return False
+    match = _MARKER.match(value)
+    return match is not None and match.end() == len(value)
+
+
+def _fill_text(value, texts):
+    if isinstance(value, six.string_types):
+        return _MARKER.sub(lambda match: texts[match.group(1)], value)
+    if isinstance(value, list):
+        return [_fill_text(item, texts) for item in value]
+    return value
+
+
+def _fill_option(value, values, texts):
+    # an option that is nothing but a placeholder takes the value as it is, like any other option
+    if _whole(value):
+        return values[_MARKER.match(value).group(1)]
+    return _fill_text(value, texts)
+
+
+def _filled_leaf(leaf, texts):
+    copy = leaf.__class__.__new__(leaf.__class__)
+    for name in _state_slots(leaf.__class__):
+        if hasattr(leaf, name):
+            setattr(copy, name, _fill_text(getattr(leaf, name), texts))
+    return copy
+
+
+class TemplateInstance(Block):
+    """ A block created by :meth:`Template.instantiate`.
+
+    Instances start out with nothing but their name and rendered text: their sections and options
+    are only built the first time they are looked at, so instances that are only rendered never
+    build a tree at all. Otherwise they behave like any other block.
+    """
+    __slots__ = ('_template', '_values')
+
+    def __getattr__(self, name):
+        # only called while the sections and options haven't been built yet
+        if name in ('sections', 'options'):
+            self._template._build(self, self._values)
+            return getattr(self, name)
+        raise AttributeError(name)
+
+
+class Template(object):
+    """ A block with placeholders, pre-rendered once and instantiated any number of times.
+
+    :param nginx.config.api.Block block: the template, a named block with :func:`placeholder`
+        values; it must not be modified afterwards
+    :param int level: indentation level instances are rendered at, 1 for servers in the http block
+        of a config (default: 1)
+    :ivar frozenset slots: names of the placeholders
+    """
+    def __init__(self, block, level=1):
+        if not (block._is_block and block._opens_scope):
+            raise TypeError('templates must be named blocks')
+        self.block = block
+        self.level = level
+        # id(block) -> (placeholder in name, option keys with placeholders, dynamic children)
+        # for every block that holds a placeholder, or has one below it
+        self._dynamic = {}
+        # line of an option holding placeholders, as the template renders it -> (key, parts), see _split_value
+        self._options = {}
+        # names of the placeholders in options, and whether the text of those options is nothing
+        # but single words and placeholders separated by single spaces
+        option_slots = set()
+        spaced = True
+        slots = set()
+        stack = [(block, False)]
+        while stack:
+            node, done = stack.pop()
+            children = list(node.sections) + [value for value in node.options.values() if getattr(value, '_is_block', False)]
+            if not done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children if child._is_block)
+                continue
+            name_names = _names(getattr(node, 'name', None))
+            keys = []
+            for key, value in node.options.items():
+                found = _names(value)
+                if found:
+                    slots.update(found)
+                    keys.append(key)
+                    self._options[node._build_options(key, value)._lines()[0]] = (key, _split_value(value))
+                    option_slots.update(found)
+                    if isinstance(value, six.string_types) and ' '.join(value.split()) != value:
+                        spaced = False
+            dynamic = []
+            for child in children:
+                if child._is_block:
+                    if id(child) in self._dynamic:
+                        dynamic.append(child)
+                else:
+                    found = [name for slot in _state_slots(child.__class__) for name in _names(getattr(child, slot, None))]
+                    if found:
+                        slots.update(found)
+                        dynamic.append(child)
+            slots.update(name_names)
+            if name_names or keys or dynamic:
+                self._dynamic[id(node)] = (bool(name_names), keys, dynamic)
+        self.slots = frozenset(slots)
+        self._option_slots = tuple(option_slots) if spaced else None
+
+        # rendering the template also fills the render cache of the blocks instances share
+        context = RenderContext.for_node(block)
+        context.indent_level = level
+        self._cache_key = context.cache_key
+        text = '\n'.join(iter_lines(block, context))
+        self._parts = _MARKER.split(text)
+        self._option_parts = self._split(text, context.indent_char)
+
+    def _split(self, text, indent_char):
+        """ Splits the text of the template into text and placeholders, alternately, like
+        :attr:`_parts` except for the options holding placeholders.
+
+        Options render differently depending on their values: a bare key for None, values
+        separated by single spaces for a string with spaces, and so on. Filling the text of their
+        placeholders in is only right for most values; otherwise the text following the key of
+        such an option is a placeholder of its own, standing for the option's whole line.
+        """
+        parts = ['']
+        for number, line in enumerate(text.split('\n')):
+            if number:
+                parts[-1] += '\n'
+            content = line.lstrip(indent_char)
+            if content in self._options:
+                key = self._options[content][0]
+                parts[-1] += line[:len(line) - len(content)] + key
+                parts.extend((content, ';'))
+            else:
+                pieces = _MARKER.split(line)
+                parts[-1] += pieces[0]
+                parts.extend(pieces[1:])
+        return parts
+
+    def render(self, **values):
+        """ Returns the text of an instance, without building it, as it would be cached for :attr:`level`.
+
+        :rtype: str
+        """
+        return self._render(values, self._texts(values))
+
+    def _texts(self, values):
+        missing = self.slots.difference(values)
+        if missing:
+            raise ValueError('missing values for placeholders: {0}'.format(', '.join(sorted(missing))))
+        unknown = set(values).difference(self.slots)
+        if unknown:
+            raise ValueError('unknown placeholders: {0}'.format(', '.join(sorted(unknown))))
+        return dict((name, _text(value)) for name, value in values.items())
+
+    def _render(self, values, texts):
+        plain = self._option_slots is not None
+        if plain:
+            for name in self._option_slots:
+                if not _plain(values[name], texts[name]):
+                    plain = False
+                    break
+        if plain:
+            return _join(self._parts, texts)
+
+        texts = dict(texts)
+        build = self.block._build_options
+        for line, (key, parts) in self._options.items():
+            if type(parts) is list:
+                # the items of a list, which are filled in as text
+                value = [_join(item, texts) if type(item) is tuple else item for item in parts]
+            elif len(parts) == 3 and not parts[0] and not parts[2]:
+                # the value of an option that is nothing but a placeholder is taken as it is
+                value = values[parts[1]]
+            else:
+                value = _join(parts, texts)
+            texts[line] = _option_text(build, key, value)
+        return _join(self._option_parts, texts)
+
+    def instantiate(self, **values):
+        """ Creates an instance of the template with the given placeholder values.
+
+        The instance is given its rendered text right away. Its sections and options are only
+        built when they are first used; the blocks without placeholders are then shared with the
+        template, and only the others (and the blocks above them) are copied.
+
+        :rtype: TemplateInstance
+        """
+        texts = self._texts(values)
+        instance = TemplateInstance.__new__(TemplateInstance)
+        instance.name = _fill_text(self.block.name, texts)
+        instance._render_cache = (self._cache_key, self.level, self._render(values, texts))
+        instance._fingerprint = None
+        instance._template = self
+        instance._values = values
+        # lets Block.edit find the template's blocks in the instance
+        _origins[instance] = self.block
+        return instance
+
+    def _build(self, instance, values):
+        """ Builds the sections and options of an instance. """
+        texts = self._texts(values)
+        # the instance renders the same once built, and the blocks above it don't need to know
+        parent_ref = getattr(instance, '_parent_ref', None)
+        render_cache = instance._render_cache
+        instance._parent_ref = None
+        try:
+            instance.sections = self.block.sections._clone(instance)
+            instance.options = self.block.options._clone(instance)
+            stack = [(self.block, instance)]
+            while stack:
+                original, copy = stack.pop()
+                name_marked, keys, dynamic = self._dynamic.get(id(original), (False, (), ()))
+                if name_marked and copy is not instance:
+                    copy.name = _fill_text(original.name, texts)
+                if keys:
+                    copy.options.update([(key, _fill_option(original.options[key], values, texts)) for key in keys])
+                for child in dynamic:
+                    if not child._is_block:
+                        copy.sections._replace(child, _filled_leaf(child, texts))
+                        continue
+                    child_copy = child.clone()
+                    option_keys = [key for key, value in original.options.items() if value is child]
+                    if option_keys:
+                        copy.options.update([(key, child_copy) for key in option_keys])
+                    else:
+                        copy.sections._replace(child, child_copy)
+                    stack.append((child, child_copy))
+        finally:
+            instance._parent_ref = parent_ref
+            instance._render_cache = render_cache
+            instance._template = instance._values = None
+
+    def __getstate__(self):
+        # the blocks holding placeholders are found again when unpickling, since they're kept by id
+        return {'block': self.block, 'level': self.level}
+
+    def __setstate__(self, state):
+        self.__init__(state['block'], state['level'])
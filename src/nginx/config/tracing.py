@@ -0,0 +1,146 @@
+"""
+Tracing of where the time goes while building and rendering a config.
+
+The builder, the renderer and :mod:`nginx.config.helpers` open a span at the start of each phase
+(registering a plugin, calling a plugin method, rendering a block, dumping a config) and close it at
+the end, by calling the active :class:`Tracer`. The default tracer does nothing and is checked once
+per phase, so tracing costs nothing until a tracer is installed.
+
+:class:`ChromeTraceRecorder` records spans as Chrome ``trace_event`` JSON, which can be opened in
+``chrome://tracing`` or https://ui.perfetto.dev::
+
+    from nginx.config.tracing import ChromeTraceRecorder, use_tracer
+
+    recorder = ChromeTraceRecorder()
+    with use_tracer(recorder):
+        nginx = NginxConfigBuilder()
+        nginx.add_server()
+        nginx.render()
+    recorder.save('nginx-trace.json')
+
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+
+from timeit import default_timer
+
+
+class Tracer(object):
+    """ Receives the start and end of every traced span. This base class ignores them.
+
+    Subclasses set ``enabled`` to True and override :meth:`start` and :meth:`end`. Spans are
+    properly nested within a thread, and ``end`` is called even if the span raised.
+    """
+    #: callers skip tracing entirely while this is False
+    enabled = False
+
+    def start(self, name, category, args=None):
+        """ Called when a span starts.
+
+        :param str name: what is being done, such as ``'server'`` or ``'add_route'``
+        :param str category: the phase it is part of, such as ``'render'`` or ``'builder'``
+        :param dict args: extra details about the span (default: None)
+        """
+
+    def end(self, name, category):
+        """ Called when the span most recently started on this thread ends. """
+
+    @contextlib.contextmanager
+    def span(self, name, category, args=None):
+        """ Traces the body of a ``with`` statement as a span. """
+        self.start(name, category, args)
+        try:
+            yield
+        finally:
+            self.end(name, category)
+
+
+class ChromeTraceRecorder(Tracer):
+    """ Records spans in the Chrome ``trace_event`` format.
+
+    Timestamps are microseconds since the recorder was created.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+        self._start = default_timer()
+        self._pid = os.getpid()
+
+    def _event(self, phase, name, category, args=None):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': phase,
+            'ts': (default_timer() - self._start) * 1e6,
+            'pid': self._pid,
+            'tid': threading.current_thread().ident,
+        }
+        if args:
+            event['args'] = args
+        # list.append is atomic, so spans from several threads can be recorded at once
+        self.events.append(event)
+
+    def start(self, name, category, args=None):
+        self._event('B', name, category, args)
+
+    def end(self, name, category):
+        self._event('E', name, category)
+
+    def as_dict(self):
+        """ Returns the trace as a JSON serializable dict. """
+        return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}
+
+    def dump(self, fp):
+        """ Writes the trace as JSON to a file-like object. """
+        json.dump(self.as_dict(), fp)
+
+    def save(self, path):
+        """ Writes the trace as JSON to a file. """
+        with open(path, 'w') as fp:
+            self.dump(fp)
+
+
+#: the tracer that does nothing, active unless another one is installed
+NULL_TRACER = Tracer()
+
+# the active tracer; read it through get_tracer() so replacing it is seen everywhere
+_tracer = NULL_TRACER
+
+
+def get_tracer():
+    """ Returns the active tracer. """
+    return _tracer
+
+
+def set_tracer(tracer):
+    """ Installs a tracer for every thread, returning the one it replaces.
+
+    :param Tracer tracer: tracer to install, or None to stop tracing
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = tracer if tracer is not None else NULL_TRACER
+    return previous
+
+
+@contextlib.contextmanager
+def use_tracer(tracer):
+    """ Installs a tracer for the body of a ``with`` statement. """
+    previous = set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous)
+
+
+def traced(func, name, category):
+    """ Wraps a callable so every call is traced as a span by the tracer active at the time. """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _tracer.span(name, category):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,286 @@
+"""
+Writes a config as a directory of files, touching only the files whose content changed.
+
+The main file keeps everything except the ``server`` blocks directly inside ``http``, which are
+each replaced by an ``include`` of a file of their own. When the config is written again, every
+file is compared by content hash with what is already on disk and only rewritten if it differs, so
+a change to one server rewrites one small file. Files are written to a temporary file in the same
+directory and then renamed into place, so nginx never reads a partially written file.
+
+Example::
+
+    from nginx.config.writer import ConfigWriter
+
+    writer = ConfigWriter('/etc/nginx')
+    result = writer.write(config)
+    if result.changed:
+        reload_nginx()
+
+This produces ``/etc/nginx/nginx.conf`` and one file per server in ``/etc/nginx/servers/``,
+named after the server's first ``server_name``.
+"""
+import binascii
+import errno
+import hashlib
+import io
+import os
+import re
+import stat
+import tempfile
+
+from .api.render import RenderContext, render
+from .helpers import _find_http
+from .index import is_server, server_names
+from .snippets import find_snippets
+from .tracing import get_tracer
+
+_replace = getattr(os, 'replace', os.rename)
+_UNSAFE = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def _file_text(rendered):
+    # rendered text starts every line with a newline, files end every line with one
+    return rendered[1:] + '\n' if rendered else ''
+
+
+def server_key(server, position):
+    """ The default file name of a server: its first ``server_name``, or its position in ``http``.
+
+    :param nginx.config.api.Block server: server block being written
+    :param int position: position of the server among the servers of the ``http`` block
+    :rtype: str
+    """
+    names = [name for name in server_names(server) if name != '_']
+    return names[0] if names else 'server-{0}'.format(position)
+
+
+def content_hash(data):
+    """ Returns the hash used to compare file contents. """
+    return hashlib.sha1(data).hexdigest()
+
+
+def file_hash(path):
+    """ Returns the :func:`content_hash` of a file, or None if it doesn't exist. """
+    try:
+        with io.open(path, 'rb') as fp:
+            return content_hash(fp.read())
+    except (IOError, OSError):
+        return None
+
+
+def _create_temp(directory):
+    """ Like :func:`tempfile.mkstemp`, but the file gets the permissions of any new file (0666 less the
+    umask) rather than 0600, so files renamed over nothing stay readable by nginx's workers.
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    for _ in range(tempfile.TMP_MAX):
+        name = '.{0}.tmp'.format(binascii.hexlify(os.urandom(6)).decode('ascii'))
+        path = os.path.join(directory, name)
+        try:
+            return os.open(path, flags, 0o666), path
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+    raise IOError(errno.EEXIST, 'No usable temporary file name found')
+
+
+def write_atomic(path, data):
+    """ Writes bytes to a file through a temporary file renamed over it.
+
+    A file that is replaced keeps its permissions, a new one gets the default permissions.
+    """
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = _create_temp(directory)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        try:
+            os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+        except OSError as error:
+            if error.errno != errno.ENOENT:
+                raise
+        _replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class WriteResult(object):
+    """ The files affected by :meth:`ConfigWriter.write`, as absolute paths.
+
+    ``bytes_saved`` is roughly how much smaller the files are thanks to snippets, see :mod:`nginx.config.snippets`.
+    """
+    def __init__(self):
+        self.written = []
+        self.unchanged = []
+        self.removed = []
+        self.bytes_saved = 0
+
+    @property
+    def changed(self):
+        """ Whether any file was written or removed, that is whether nginx needs reloading. """
+        return bool(self.written or self.removed)
+
+    def as_dict(self):
+        return {'written': self.written, 'unchanged': self.unchanged, 'removed': self.removed}
+
+    def __repr__(self):
+        return '<WriteResult written={0} unchanged={1} removed={2}>'.format(
+            len(self.written), len(self.unchanged), len(self.removed)
+        )
+
+
+class ConfigWriter(object):
+    """ Writes a config to a main file and one included file per server.
+
+    :param str directory: directory to write to, created if missing
+    :param str main: name of the main file (default: nginx.conf)
+    :param str include_dir: directory for the server files, relative to ``directory`` (default: servers)
+    :param key: callable taking a server block and its position, and returning the name of its file
+        without extension (default: :func:`server_key`); servers with the same key get a numbered suffix
+    :param str include_prefix: path the ``include`` directives refer to the server files through
+        (default: ``include_dir``, which nginx resolves relative to its configuration prefix)
+    :param bool prune: remove ``.conf`` files in ``include_dir`` and ``snippet_dir`` that weren't written
+        to (default: True)
+    :param bool snippets: move subtrees repeated across the config into snippet files, see
+        :func:`nginx.config.snippets.find_snippets` (default: False)
+    :param int snippet_min_bytes: smallest subtree to move into a snippet (default: 256)
+    :param str snippet_dir: directory for the snippets, relative to ``directory`` and to nginx's
+        configuration prefix (default: snippets)
+    """
+    def __init__(self, directory, main='nginx.conf', include_dir='servers', key=server_key, include_prefix=None,
+                 prune=True, snippets=False, snippet_min_bytes=256, snippet_dir='snippets'):
+        self.directory = os.path.abspath(directory)
+        self.main = main
+        self.include_dir = include_dir
+        self.key = key
+        self.include_prefix = include_dir if include_prefix is None else include_prefix
+        self.prune = prune
+        self.snippets = snippets
+        self.snippet_min_bytes = snippet_min_bytes
+        self.snippet_dir = snippet_dir
+        self.bytes_saved = 0
+
+    def _file_name(self, server, position, seen):
+        """ Returns the file name of a server, given the names of the servers before it (which it is added to). """
+        base = _UNSAFE.sub('_', str(self.key(server, position))).strip('.') or 'server-{0}'.format(position)
+        name, suffix = base, 1
+        while name in seen:
+            suffix += 1
+            name = '{0}-{1}'.format(base, suffix)
+        seen.add(name)
+        return name + '.conf'
+
+    def _file_names(self, servers):
+        seen = set()
+        return [self._file_name(server, position, seen) for position, server in enumerate(servers)]
+
+    def _include(self, name, indent):
+        """ Returns the line including a server file in the main file. """
+        include = '/'.join((self.include_prefix.rstrip('/'), name)) if self.include_prefix else name
+        return '{0}include {1};'.format(indent, include)
+
+    def _render_main(self, config, context, prerendered):
+        # blocks containing an include must not be served from, or stored in, the render cache
+        context.use_cache = not prerendered
+        context.prerendered = prerendered
+        return _file_text(render(config, context))
+
+    def render_files(self, config):
+        """ Renders a config into the files :meth:`write` would write, without touching the disk.
+
+        When writing snippets, the number of bytes they save is stored in ``bytes_saved``.
+
+        :returns: list of (path relative to ``directory``, text) tuples, the main file first
+        """
+        context = RenderContext.for_node(config)
+        http, level = _find_http(config, context.indent_level)
+        servers = [section for section in http.sections if is_server(section)] if http is not None else []
+
+        files = []
+        prerendered = {}
+        server_context = RenderContext(indent_char=context.indent_char, indent=context.indent)
+        self.bytes_saved = 0
+        if self.snippets:
+            plan = find_snippets(config, min_bytes=self.snippet_min_bytes, include_dir=self.snippet_dir, exclude=is_server)
+            files.extend(sorted(plan.snippets.items()))
+            prerendered.update(plan.prerendered())
+            server_context.prerendered = plan.prerendered()
+            server_context.use_cache = not server_context.prerendered
+            self.bytes_saved = plan.bytes_saved
+
+        indent = context.get_indent(level + 1) if servers else ''
+        for server, name in zip(servers, self._file_names(servers)):
+            files.append((os.path.join(self.include_dir, name), _file_text(render(server, server_context))))
+            prerendered[id(server)] = self._include(name, indent)
+
+        files.insert(0, (self.main, self._render_main(config, context, prerendered)))
+        return files
+
+    def write(self, config):
+        """ Writes a config, only replacing files whose content changed.
+
+        :param config: config object to write, usually containing an ``http`` block
+        :rtype: WriteResult
+        """
+        tracer = get_tracer()
+        if tracer.enabled:
+            with tracer.span('write', 'writer', {'directory': self.directory}):
+                return self._write(config, tracer)
+        return self._write(config, None)
+
+    def _directories(self):
+        """ Creates the directories files are written to, and returns them. """
+        directories = [os.path.join(self.directory, self.include_dir)]
+        if self.snippets:
+            directories.append(os.path.join(self.directory, self.snippet_dir))
+        for directory in directories:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        return directories
+
+    def _write_file(self, relative, text, expected, result, tracer=None):
+        """ Writes a file unless it already has this content, recording it in ``expected`` and ``result``. """
+        path = os.path.join(self.directory, relative)
+        expected.add(os.path.normpath(path))
+        data = text.encode('utf-8')
+        if file_hash(path) == content_hash(data):
+            result.unchanged.append(path)
+            return
+        if tracer is not None:
+            with tracer.span(relative, 'writer', {'bytes': len(data)}):
+                write_atomic(path, data)
+        else:
+            write_atomic(path, data)
+        result.written.append(path)
+
+    def _prune(self, directories, expected, result):
+        """ Removes the files in ``directories`` that weren't expected, if pruning. """
+        if not self.prune:
+            return
+        for directory in directories:
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if name.endswith('.conf') and os.path.normpath(path) not in expected:
+                    os.unlink(path)
+                    result.removed.append(path)
+
+    def _write(self, config, tracer):
+        result = WriteResult()
+        directories = self._directories()
+
+        if tracer is not None:
+            with tracer.span('render_files', 'writer'):
+                files = self.render_files(config)
+        else:
+            files = self.render_files(config)
+        result.bytes_saved = self.bytes_saved
+
+        expected = set()
+        # included files go first, so the main file never includes a file that doesn't exist yet
+        for relative, text in files[1:] + files[:1]:
+            self._write_file(relative, text, expected, result, tracer)
+        self._prune(directories, expected, result)
+        return result
@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 5):
+    # the asyncio pipeline can't be imported, let alone tested
+    collect_ignore.append('test_pipeline.py')
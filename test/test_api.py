@@ -1,13 +1,25 @@
+from nginx.config import common, helpers
+from nginx.config.api import Config, Fragment, Location
 from nginx.config.api.blocks import Block, EmptyBlock
-from nginx.config.api.options import KeyOption, KeyValueOption, KeyMultiValueOption, KeyValuesMultilines
-from nginx.config.helpers import duplicate_options
+from nginx.config.api.options import KeyMultiValueOption, KeyOption, KeyValueOption, KeyValuesMultilines
+from nginx.config.api.render import RenderContext, cache_stats, render
+from nginx.config.helpers import dump, dumps, duplicate_options, simple_configuration
+from nginx.config.serialize import from_bytes, from_dict, to_bytes, to_dict
+from six import StringIO
+from threading import Thread
+import gc
+import multiprocessing
+import pickle
+import pytest
+import sys
+import weakref
 
 
 def test_block_options():
     block = Block('test')
 
-    assert block.options == {'_owner': block}
-    assert block.sections == {'_owner': block}
+    assert block.options == {}
+    assert list(block.sections) == []
 
     block.options.opt = 'val1'
 
@@ -21,12 +33,36 @@ def test_block_options():
 
     assert repr(block) == '\ntest {\n    opt;\n}'
 
+    block.options['flag'] = True
+    block.options.count = 2
+    del block.options.opt
+
+    assert repr(block) == '\ntest {\n    flag on;\n    count 2;\n}'
+    assert block.options == {'flag': True, 'count': 2}
+
+    # option objects are built when options are set, and kept until they change
+    flag, count = block._dump_options()
+    repr(block)
+    assert [id(option) for option in block._dump_options()] == [id(flag), id(count)]
+    block.options.count = 3
+    assert block._dump_options()[0] is flag and block._dump_options()[1] is not count
+
+    # lists changed in place after rendering are rendered as they are now
+    block = Block('test', opt=[1])
+    assert repr(block) == '\ntest {\n    opt 1;\n}'
+    block.options.opt.append(2)
+    assert repr(block) == '\ntest {\n    opt 1 2;\n}'
+    block.options.opt.extend([3])
+    assert repr(block) == '\ntest {\n    opt 1 2 3;\n}'
+    block.options.opt.reverse()
+    assert repr(block) == '\ntest {\n    opt 3 2 1;\n}'
+
 
 def test_emptyblock_options():
     block = EmptyBlock()
 
-    assert block.options == {'_owner': block}
-    assert block.sections == {'_owner': block}
+    assert block.options == {}
+    assert list(block.sections) == []
 
     block.options.opt = 'val'
 
@@ -60,3 +96,409 @@ def test_sections():
 def test_duplicates():
     dupes = duplicate_options('test', [1, 2, 3])
     assert sorted(repr(dupes).splitlines()) == sorted('\ntest 1;\ntest 2;\ntest 3;'.splitlines())
+    assert len(dupes.sections) == 3
+    assert not any(section._is_block for section in dupes.sections)
+
+
+def test_sections_multimap():
+    http = Block('http')
+    first, second = Block('server', listen=80), Block('server', listen=443)
+    http.sections.add(first, KeyValueOption('include', 'a.conf'), second, KeyValueOption('include', 'b.conf'))
+
+    assert list(http.sections) == [first, http.sections[1], second, http.sections[3]]
+    assert http.sections.server is http.sections['server'] is first
+    assert http.sections.getall('server') == [first, second]
+    assert [opt.value for opt in http.sections.getall('include')] == ['a.conf', 'b.conf']
+    assert 'server' in http.sections and 'location /' not in http.sections
+    assert second.parent is http
+    assert repr(http) == '\nhttp {\n    server {\n        listen 80;\n    }\n    include a.conf;\n' \
+        '    server {\n        listen 443;\n    }\n    include b.conf;\n}'
+
+    http.sections.remove(first)
+    assert http.sections.getall('server') == [second]
+
+    # assigning by name replaces every section with that name
+    third = Block('server', Location('/'))
+    http.sections.server = third
+    assert http.sections.getall('server') == [third]
+    assert list(http.sections)[1] is third
+
+    del http.sections.include
+    assert list(http.sections) == [third]
+    assert http.sections.get('include') is None
+
+
+def test_iter_lines():
+    block = Block('outer', Block('inner', KeyValuesMultilines('opt', values=['v1', 'v2'])), key='value')
+    block.sections.add(EmptyBlock(other=['a', 'b']))
+
+    lines = list(block.iter_lines())
+    assert lines[0] == 'outer {'
+    assert lines[-1] == '}'
+    assert ''.join('\n' + line for line in lines) == repr(block)
+
+
+def test_render_to():
+    config = simple_configuration()
+    fp = StringIO()
+    config.render_to(fp)
+    assert fp.getvalue() == repr(config)
+
+    fp = StringIO()
+    dump([config, Block('events')], fp)
+    assert fp.getvalue() == dumps([config, Block('events')]) == repr(config) + repr(Block('events'))
+
+
+def test_render_context():
+    inner = Block('inner', key='value')
+    block = Block('outer', inner)
+
+    assert render(block, RenderContext(indent=2)) == '\nouter {\n  inner {\n    key value;\n  }\n}'
+    assert render(block, RenderContext(indent_level=1, indent_char='\t', indent=1)) == '\n\touter {\n\t\tinner {\n\t\t\tkey value;\n\t\t}\n\t}'
+
+    # rendering must not leave indentation state behind on the nodes
+    repr(block)
+    assert inner._indent_level == 0
+    assert repr(inner) == '\ninner {\n    key value;\n}'
+
+    # setting the level on a node is still allowed, but the render context decides it
+    inner._indent_level = 3
+    assert inner._indent_level == 0
+    assert repr(inner) == '\ninner {\n    key value;\n}'
+
+
+def test_render_deep_nesting():
+    depth = sys.getrecursionlimit() * 2
+    top = block = Block('level')
+    for _ in range(depth):
+        child = Block('level')
+        block.sections.add(child)
+        block = child
+
+    lines = list(top.iter_lines())
+    assert len(lines) == 2 * (depth + 1)
+    assert lines[depth] == ' ' * 4 * depth + 'level {'
+
+
+def test_render_concurrently():
+    server = Block('server', server_name='_')
+    for i in range(50):
+        server.sections.add(Location('/{0}'.format(i), Location('/{0}/nested'.format(i), proxy_pass='upstream')))
+    expected = repr(server)
+
+    results = []
+
+    def worker():
+        for _ in range(20):
+            results.append(repr(server))
+
+    threads = [Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 80
+    assert all(result == expected for result in results)
+
+
+def test_render_cache():
+    location = Location('/foo', proxy_pass='upstream')
+    server = Block('server', location, server_name='_')
+    http = Block('http', server)
+    expected = repr(http)
+
+    context = RenderContext()
+    assert render(http, context) == expected
+    assert (context.hits, context.misses) == (1, 0)
+
+    # changing an option re-renders the changed path only
+    location.options.proxy_pass = 'other'
+    context = RenderContext()
+    assert render(http, context) == expected.replace('upstream', 'other')
+    assert (context.hits, context.misses) == (0, 3)
+
+    location.options['proxy_pass'] = 'upstream'
+    assert repr(http) == expected
+
+    server.sections.add(Location('/bar'))
+    context = RenderContext()
+    assert render(http, context) == expected.replace('        }\n    }', '        }\n        location /bar {\n        }\n    }')
+    assert (context.hits, context.misses) == (1, 3)
+
+    # the cache is keyed by indentation, so the same block rendered elsewhere is not reused
+    context = RenderContext(indent_level=1)
+    render(location, context)
+    assert (context.hits, context.misses) == (0, 1)
+    context = RenderContext(indent=2)
+    render(location, context)
+    assert (context.hits, context.misses) == (0, 1)
+
+    del location.options.proxy_pass
+    assert repr(location) == '\nlocation /foo {\n}'
+
+    cache_stats.reset()
+    repr(http)
+    repr(http)
+    assert cache_stats.as_dict() == {'hits': 2, 'misses': 3}
+
+
+def test_render_cache_shared_blocks():
+    # the same block can be placed in several others, like the groups of nginx.config.common
+    gzip = EmptyBlock(gzip='on')
+    first = Block('server', gzip, server_name='a')
+    second = Block('server', gzip, server_name='b')
+    http = Block('http', first, second)
+    assert repr(http).count('gzip on;') == 2
+
+    gzip.options.gzip = 'off'
+    assert repr(http).count('gzip off;') == 2
+    assert 'gzip off;' in repr(first) and 'gzip off;' in repr(second)
+
+    # a block taken out of one of them no longer changes it
+    first.sections.remove(gzip)
+    assert gzip._parents() == [second]
+    gzip.options.gzip = 'on'
+    assert 'gzip' not in repr(first)
+    assert 'gzip on;' in repr(second)
+
+    # options placed in sections are options objects that can be changed too
+    listen = KeyValueOption('listen', 80)
+    server = Block('server', listen)
+    http = Block('http', server)
+    assert 'listen 80;' in repr(http)
+    listen.value = 443
+    assert 'listen 443;' in repr(http) and 'listen 443;' in repr(server)
+
+
+def test_render_cache_list_options():
+    server = Block('server', add_header=['X-A', 'a'])
+    http = Block('http', server)
+    assert 'add_header X-A a;' in repr(http)
+    fingerprint = http.fingerprint
+
+    # lists set as options can be changed in place after rendering
+    server.options.add_header.extend(['X-B'])
+    assert 'add_header X-A a X-B;' in repr(http)
+    assert http.fingerprint != fingerprint
+    server.options.add_header[0] = 'X-C'
+    assert 'add_header X-C a X-B;' in repr(http)
+    del server.options.add_header[1:]
+    assert 'add_header X-C;' in repr(http)
+    assert server.options.add_header == ['X-C']
+
+    # but not the list that was assigned, nor one the option no longer holds
+    values = ['X-D']
+    server.options.add_header = values
+    values.append('X-E')
+    held = server.options.add_header
+    server.options.add_header = 'X-F'
+    held.append('X-G')
+    assert 'add_header X-F;' in repr(http)
+    assert pickle.loads(pickle.dumps(held)) == ['X-D', 'X-G']
+
+
+def test_parallel_render():
+    def config():
+        http = Block('http', include='mime.types')
+        for i in range(20):
+            server = Block('server', Location('/', proxy_pass='http://u{0}'.format(i)), server_name='s{0}'.format(i))
+            http.sections.add(server)
+        return Config(Block('events', worker_connections=512), http, daemon='off')
+
+    expected = repr(config())
+    assert helpers.render(config(), workers=2) == expected
+    assert helpers.render(config(), workers=3, chunksize=4) == expected
+
+    cfg = config()
+    assert helpers.render(cfg, workers=2, threads=True) == expected
+    # everything is cached now, so nothing is sent to the pool
+    assert helpers.render(cfg, workers=2, threads=True) == expected
+
+
+def test_parallel_render_processes(monkeypatch):
+    def config():
+        return Config(Block('http', *[Block('server', server_name='s{0}'.format(i)) for i in range(8)]))
+
+    expected = repr(config())
+
+    # without fork, the blocks are pickled and sent to the workers
+    monkeypatch.setattr(helpers, '_start_method', lambda: 'spawn')
+    assert helpers.render(config(), workers=2) == expected
+    monkeypatch.undo()
+
+    # Python 2 has no get_start_method, and forks
+    monkeypatch.delattr(multiprocessing, 'get_start_method')
+    assert helpers._start_method() == ('spawn' if sys.platform == 'win32' else 'fork')
+    assert helpers.render(config(), workers=2) == expected
+
+
+def test_pickle():
+    server = Block('server', Block('location /', proxy_pass='upstream'), server_name='_')
+    http = Block('http', server)
+
+    copy = pickle.loads(pickle.dumps(server))
+    assert repr(copy) == repr(server)
+    assert copy.parent is None
+    assert copy.sections['location /'].parent is copy
+    assert repr(pickle.loads(pickle.dumps(http))) == repr(http)
+
+
+def test_node_memory():
+    tracemalloc = pytest.importorskip('tracemalloc')
+
+    count = 10000
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        options = [KeyValueOption('proxy_pass', 'http://upstream') for _ in range(count)]
+        option_size = (tracemalloc.get_traced_memory()[0] - before) / float(count)
+
+        before = tracemalloc.get_traced_memory()[0]
+        locations = [Location('/', proxy_pass='http://upstream', proxy_read_timeout=30) for _ in range(count)]
+        location_size = (tracemalloc.get_traced_memory()[0] - before) / float(count)
+    finally:
+        tracemalloc.stop()
+
+    assert len(options) == len(locations) == count
+    assert option_size < 100
+    assert location_size < 750
+
+
+def test_freed_without_gc():
+    http = Block('http', Block('server', Location('/', KeyValueOption('proxy_pass', 'upstream'))))
+    location = weakref.ref(http.sections.server.sections['location /'])
+    assert location().parent is http.sections.server
+
+    gc.disable()
+    try:
+        del http
+        assert location() is None
+    finally:
+        gc.enable()
+
+
+def test_fingerprint():
+    def server(name):
+        return Block('server', Location('/', EmptyBlock(expires='1d')), server_name=name)
+
+    a, b = server('a.com'), server('a.com')
+    assert a.fingerprint == b.fingerprint
+    assert a.fingerprint != server('b.com').fingerprint
+    assert KeyValueOption('expires', '1d').fingerprint == KeyValueOption('expires', '1d').fingerprint
+    # wrapping a block in an unnamed block doesn't change what it renders to
+    assert EmptyBlock(a).fingerprint == a.fingerprint
+
+    # cached, and invalidated along the modified path
+    location = a.sections[0]
+    inner = location.sections[0]
+    before = a.fingerprint
+    assert a._fingerprint == before and inner._fingerprint is not None
+    inner.options.expires = '2d'
+    assert a._fingerprint is None and location._fingerprint is None
+    assert a.fingerprint != before
+    inner.options.expires = '1d'
+    assert a.fingerprint == before
+
+    location.sections.add(Location('/nested'))
+    assert a.fingerprint != b.fingerprint
+    assert pickle.loads(pickle.dumps(a)).fingerprint == a.fingerprint
+
+    deep = Block('level')
+    for _ in range(sys.getrecursionlimit() * 2):
+        deep = Block('level', deep)
+    assert len(deep.fingerprint) == 40
+
+
+def test_clone():
+    tracemalloc = pytest.importorskip('tracemalloc')
+
+    def build():
+        http = Block('http', include='mime.types')
+        for i in range(200):
+            http.sections.add(Block(
+                'server',
+                *[Location('/service{0}'.format(j), proxy_pass='http://up{0}'.format(j), expires='1d') for j in range(10)],
+                server_name='tenant{0}.example.com'.format(i)
+            ))
+        return EmptyBlock(http, worker_processes='auto')
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        production = build()
+        tree_size = tracemalloc.get_traced_memory()[0] - before
+        expected = repr(production)
+
+        before = tracemalloc.get_traced_memory()[0]
+        variants = []
+        for name in ('canary', 'staging'):
+            variant = production.clone()
+            server = production.sections.http.sections.getall('server')[42]
+            variant.edit(server.sections['location /service3']).options.proxy_pass = 'http://' + name
+            variant.edit(server).options.listen = 8080
+            variants.append(variant)
+        variants_size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    # each variant only copies the blocks on the path to its changes
+    assert variants_size < tree_size * 0.02
+    assert repr(production) == expected
+    for name, variant in zip(('canary', 'staging'), variants):
+        text = repr(variant)
+        assert text != expected
+        assert text.count('proxy_pass http://{0};'.format(name)) == 1 and text.count('listen 8080;') == 1
+        assert text.replace('proxy_pass http://{0};'.format(name), 'proxy_pass http://up3;').replace(
+            '\n        listen 8080;', '') == expected
+
+    canary = variants[0]
+    shared = canary.sections.http.sections.getall('server')
+    assert sum(server is original for server, original in zip(shared, production.sections.http.sections.getall('server'))) == 199
+    # editing again reuses the copies, and changes show in the clone's render
+    server = canary.edit(production.sections.http.sections.getall('server')[42])
+    assert server is shared[42]
+    server.options.listen = 9090
+    assert 'listen 9090;' in repr(canary) and 'listen 9090;' not in repr(production)
+
+    with pytest.raises(ValueError):
+        canary.edit(Block('server'))
+
+
+def test_fragments():
+    def config(cache, statsd):
+        return EmptyBlock(Block(
+            'http',
+            cache,
+            Block('server', *[Location('/app{0}'.format(i), statsd, uwsgi_pass='app') for i in range(3)]),
+        ))
+
+    frozen = config(common.uwsgi_cache_fragment, common.statsd_options_location_fragment)
+    plain = config(EmptyBlock(common.uwsgi_cache), EmptyBlock(common.statsd_options_location))
+    assert repr(frozen) == repr(plain)
+    context = RenderContext(indent_char='\t', indent=1)
+    assert render(frozen, context) == render(plain, RenderContext(indent_char='\t', indent=1))
+    assert frozen.fingerprint != plain.fingerprint
+
+    # a fragment has no parent, and can't be changed through the blocks it is embedded in
+    fragment = common.statsd_options_location_fragment
+    assert fragment.parent is None
+    locations = frozen.sections.http.sections.server.sections
+    locations['location /app1'].options.uwsgi_pass = 'other'
+    assert repr(frozen).count('statsd_count "nginx.requests" 1;') == 3
+    common.statsd_options_location.sections.add(KeyValueOption('statsd_sample_rate', 10))
+    try:
+        assert 'statsd_sample_rate' not in repr(frozen)
+    finally:
+        common.statsd_options_location.sections.remove(common.statsd_options_location.sections[-1])
+
+    text = Fragment('\nmap $uri $app {\n    default  0;\n\n    ~^/app 1;\n}\n')
+    assert repr(Block('http', text)) == '\nhttp {\n    map $uri $app {\n        default  0;\n\n        ~^/app 1;\n    }\n}'
+    assert repr(Block('http', Fragment())) == '\nhttp {\n}'
+
+    for copy in (pickle.loads(pickle.dumps(frozen)), from_dict(to_dict(frozen)), from_bytes(to_bytes(frozen))):
+        assert repr(copy) == repr(frozen)
+        assert render(copy, RenderContext(indent_char='\t', indent=1)) == render(frozen, context)
+
+    with pytest.raises(AttributeError):
+        fragment.text = 'gzip on;'
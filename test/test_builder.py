@@ -1,12 +1,19 @@
+from nginx.config.api import Block, Location
 from nginx.config.builder import NginxConfigBuilder
 from nginx.config.builder.baseplugins import Plugin
+from nginx.config.builder.cursor import Cursor
 from nginx.config.builder.plugins import UWSGICacheRoutePlugin
 from nginx.config.builder.exceptions import (
     ConfigBuilderException,
     ConfigBuilderConflictException,
     ConfigBuilderNoSuchMethodException
 )
+from nginx.config.templates import Template, placeholder
+from nginx.config.tracing import ChromeTraceRecorder, use_tracer
+from six import StringIO
 import pytest
+import threading
+import time
 
 
 def test_bad_plugin():
@@ -238,3 +245,209 @@ http {
         server.add_route('/bar').end()
 
     assert sorted(expected.splitlines()) == sorted(repr(nginx).splitlines())
+
+
+def test_render_to():
+    nginx = NginxConfigBuilder()
+    nginx.add_server().add_route('/foo').end().end()
+
+    fp = StringIO()
+    nginx.render_to(fp)
+    assert fp.getvalue() == repr(nginx)
+
+
+def test_add_routes():
+    def one_at_a_time(rows):
+        nginx = NginxConfigBuilder()
+        with nginx.add_server(hostname='a.com') as server:
+            for path, options in rows:
+                server.add_route(path, **options).end()
+        return nginx
+
+    rows = [('/r{0}'.format(i), {'proxy_pass': 'http://up{0}'.format(i), 'proxy_read_timeout': i}) for i in range(5)]
+    expected = repr(one_at_a_time(rows))
+
+    nginx = NginxConfigBuilder()
+    with nginx.add_server(hostname='a.com') as server:
+        locations = server.add_routes(rows[:2] + [dict(options, path=path) for path, options in rows[2:]])
+    assert repr(nginx) == expected
+    assert [location.name for location in locations] == ['location /r{0}'.format(i) for i in range(5)]
+
+    nginx = NginxConfigBuilder()
+    with nginx.add_server(hostname='a.com') as server:
+        server.add_routes(
+            path=[path for path, _ in rows],
+            proxy_pass=[options['proxy_pass'] for _, options in rows],
+            proxy_read_timeout=[options['proxy_read_timeout'] for _, options in rows],
+        )
+    assert repr(nginx) == expected
+
+    nginx = NginxConfigBuilder()
+    nginx.add_server(hostname='a.com', routes=rows[:3]).end()
+    index = nginx.index
+    with nginx.add_server(hostname='b.com') as server:
+        server.add_routes(rows[3:])
+    assert index.location('a.com', '/r2').name == 'location /r2'
+    assert index.location('b.com', '/r4').name == 'location /r4'
+
+    # the current object doesn't change, and routes can be nested
+    nginx = NginxConfigBuilder()
+    with nginx.add_server() as server:
+        with server.add_route('/api') as api:
+            api.add_routes(path=['/api/a', '/api/b'])
+            api.add_route('/api/c').end()
+    assert [location.name for location in nginx.top.sections.server.sections['location /api'].sections] == [
+        'location /api/a', 'location /api/b', 'location /api/c'
+    ]
+
+    with pytest.raises(ConfigBuilderException):
+        NginxConfigBuilder().add_routes(rows)
+    with pytest.raises(ConfigBuilderException):
+        NginxConfigBuilder().add_server().add_routes([{'proxy_pass': 'http://up'}])
+    with pytest.raises(ConfigBuilderException):
+        NginxConfigBuilder().add_server().add_routes(path=['/a', '/b'], proxy_pass=['http://up'])
+    with pytest.raises(ConfigBuilderException):
+        NginxConfigBuilder().add_server().add_routes(rows, path=['/a'])
+
+
+def test_index():
+    nginx = NginxConfigBuilder()
+    with nginx.add_server(hostname='a.com') as server:
+        server.add_route('/foo').end()
+
+    index = nginx.index
+    assert index.location('a.com', '/foo').name == 'location /foo'
+
+    with nginx.add_server(hostname='b.com') as server:
+        server.add_route('/bar').end()
+
+    assert index.server('b.com') is nginx.index.server('b.com')
+    assert index.location('b.com', '/bar').name == 'location /bar'
+    assert index.location('a.com', '/bar') is None
+
+
+def test_instrumentation():
+    nginx = NginxConfigBuilder()
+    assert nginx.instrumentation is None
+    assert nginx.add_server == nginx.plugins[1].add_server
+
+    nginx = NginxConfigBuilder(instrument=True)
+    nginx.add_server(hostname='a.com')
+    nginx.add_route('/foo').end()
+    nginx.add_route('/bar', expires='1d').end()
+
+    report = nginx.instrumentation.as_dict()
+    assert report['server']['calls'] == 1
+    assert report['server']['methods']['add_server']['calls'] == 1
+    assert report['route']['calls'] == 2
+    assert report['server']['nodes'] == 2  # server and its server_name
+    assert report['route']['methods']['add_route']['nodes'] == 3
+    assert report['route']['max'] >= report['route']['mean'] > 0
+    assert 'route.add_route' in str(nginx.instrumentation)
+
+    nginx.instrumentation.reset()
+    assert nginx.instrumentation.plugin('route').calls == 0
+    nginx.add_route('/baz').end()
+    report = nginx.instrumentation.as_dict()
+    assert report['route']['calls'] == 1
+    assert report['route']['methods']['add_route']['nodes'] == 1
+    assert report['server']['calls'] == 0
+
+
+def test_tracing():
+    recorder = ChromeTraceRecorder()
+    with use_tracer(recorder):
+        nginx = NginxConfigBuilder()
+        nginx.add_server()
+        nginx.render()
+
+    spans = [(event['cat'], event['name']) for event in recorder.events if event['ph'] == 'B']
+    assert ('builder', 'validate_plugin') in spans
+    assert ('builder', 'add_server') in spans
+    assert ('render', 'server') in spans
+
+
+def test_add_server_template():
+    tenant = Template(Block(
+        'server',
+        Location('/', proxy_pass=placeholder('upstream')),
+        server_name=placeholder('hostname'),
+        listen=placeholder('port'),
+    ))
+
+    expected = NginxConfigBuilder()
+    for i in range(3):
+        with expected.add_server(hostname='t{0}.com'.format(i), listen=8000 + i) as server:
+            server.add_route('/', proxy_pass='http://up{0}'.format(i)).end()
+
+    nginx = NginxConfigBuilder()
+    index = nginx.index
+    for i in range(3):
+        nginx.add_server(hostname='t{0}.com'.format(i), port=8000 + i, upstream='http://up{0}'.format(i), template=tenant).end()
+    assert repr(nginx) == repr(expected)
+    assert index.location('t1.com', '/').options.proxy_pass == 'http://up1'
+
+    # routes can be added to instances
+    with nginx.add_server(hostname='t3.com', port=8003, upstream='http://up3', template=tenant) as server:
+        server.add_route('/health', return_=200).end()
+    assert 'location /health' in repr(nginx)
+    assert index.location('t3.com', '/health') is not None
+
+    with pytest.raises(ValueError):
+        nginx.add_server(hostname='t4.com', template=tenant)
+
+    # a hostname the template has no placeholder for isn't dropped
+    fixed = Template(Block('server', server_name='fixed.com', listen=placeholder('port')))
+    with pytest.raises(ValueError):
+        nginx.add_server(hostname='t5.com', port=8005, template=fixed)
+    nginx.add_server(port=8005, template=fixed).end()
+    assert 'server_name fixed.com;' in repr(nginx)
+
+
+def test_concurrent_builders():
+    def add_tenant(nginx, i, pause=lambda: None):
+        with nginx.add_server(hostname='t{0}.com'.format(i)) as server:
+            for j in range(20):
+                server.add_route('/r{0}'.format(j), proxy_pass='http://t{0}'.format(i)).end()
+                pause()
+
+    expected = NginxConfigBuilder()
+    for i in range(4):
+        add_tenant(expected, i)
+
+    def check(nginx):
+        for i in range(4):
+            hostname = 't{0}.com'.format(i)
+            assert repr(nginx.index.server(hostname)) == repr(expected.index.server(hostname))
+
+    # threads interleave their routes, but each one stays in its own server
+    nginx = NginxConfigBuilder()
+    nginx.index
+    threads = [threading.Thread(target=add_tenant, args=(nginx, i, lambda: time.sleep(0.001))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert nginx._cwo is nginx.top
+    check(nginx)
+
+    # so do contexts, like those asyncio runs each task in
+    contextvars = pytest.importorskip('contextvars')
+    nginx = NginxConfigBuilder()
+    contexts = [contextvars.copy_context() for _ in range(4)]
+    servers = [context.run(nginx.add_server, hostname='t{0}.com'.format(i)) for i, context in enumerate(contexts)]
+    assert nginx._cwo is nginx.top
+    for j in range(20):
+        for i, (context, server) in enumerate(zip(contexts, servers)):
+            context.run(lambda: server.add_route('/r{0}'.format(j), proxy_pass='http://t{0}'.format(i)).end())
+    for context, server in zip(contexts, servers):
+        context.run(server.end)
+    check(nginx)
+
+    # a cursor falls back to its default once its position is gone
+    cursor = Cursor(nginx.top)
+    block = Block('server')
+    cursor.set(block)
+    assert cursor.get() is block
+    del block
+    assert cursor.get() is nginx.top
@@ -0,0 +1,40 @@
+from nginx.config.api import Block, EmptyBlock, Location
+from nginx.config.diff import ADD, MODIFY, REMOVE, diff
+
+
+def test_diff():
+    def config(*servers):
+        return Block('http', *servers, include='mime.types')
+
+    def server(name, *locations, **options):
+        return Block('server', *locations, server_name=name, **options)
+
+    old = config(
+        server('a.com', Location('/', EmptyBlock(expires='1d')), Location('/old')),
+        server('b.com', Location('/')),
+    )
+    new = config(
+        server('c.com'),
+        server('b.com', Location('/')),
+        server('a.com', Location('/', EmptyBlock(expires='2d')), Location('/new'), listen=80),
+    )
+
+    edits = diff(old, new)
+    assert [(edit.op, edit.path) for edit in edits] == [
+        (ADD, ('http', 'server[c.com]')),
+        (REMOVE, ('http', 'server[a.com]', 'location /old')),
+        (ADD, ('http', 'server[a.com]', 'listen')),
+        (MODIFY, ('http', 'server[a.com]', 'location /', 'expires')),
+        (ADD, ('http', 'server[a.com]', 'location /new')),
+    ]
+    modified = edits[3]
+    assert (modified.old.value, modified.new.value) == ('1d', '2d')
+    assert str(edits[1]) == '- http > server[a.com] > location /old'
+
+    assert diff(old, old) == []
+    assert diff(old, config(server('a.com'), server('a.com'))) != []
+    # identical subtrees are not walked
+    new.sections[1]._fingerprint = old.sections[1].fingerprint
+    new.sections[1].sections[0]._fingerprint = 'stale'
+    assert not [edit for edit in diff(old, new) if 'server[b.com]' in edit.path]
+    assert [edit.op for edit in diff(Block('http'), Block('events'))] == [MODIFY]
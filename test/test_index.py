@@ -0,0 +1,63 @@
+from nginx.config.api import Block, EmptyBlock, Location
+from nginx.config.index import ConfigIndex, PrefixTrie
+
+
+def test_prefix_trie():
+    trie = PrefixTrie()
+    for key in ['/', '/static/', '/static/img/', '/status', '/api']:
+        trie[key] = key.upper()
+
+    assert len(trie) == 5
+    assert trie['/status'] == '/STATUS'
+    assert '/stat' not in trie
+    assert trie.longest_prefix('/static/img/a.png') == ('/static/img/', '/STATIC/IMG/')
+    assert trie.longest_prefix('/statistics') == ('/', '/')
+    assert [key for key, _ in trie.prefixes('/static/x')] == ['/', '/static/']
+    assert PrefixTrie().longest_prefix('/') is None
+
+    del trie['/static/']
+    assert trie.longest_prefix('/static/x') == ('/', '/')
+    assert trie.longest_prefix('/static/img/') == ('/static/img/', '/STATIC/IMG/')
+    assert sorted(trie.items()) == [('/', '/'), ('/api', '/API'), ('/static/img/', '/STATIC/IMG/'), ('/status', '/STATUS')]
+
+
+def test_config_index():
+    nested = Location('/app/admin')
+    app = Location('/app', nested)
+    first = Block('server', Location('/'), app, Location('= /exact'), server_name='a.com www.a.com')
+    http = Block('http', first)
+    index = ConfigIndex(http)
+
+    assert index.server('www.a.com') is first
+    assert index.server('b.com') is None
+    assert index.location('a.com', '/app/admin') is nested
+    assert index.location('a.com', '/exact') is None
+    assert index.location(first, '/exact', modifier='=').name == 'location = /exact'
+    # nested locations are only matched through their parent
+    assert index.longest_prefix('a.com', '/app/admin/users') is app
+
+    # adding servers and locations updates the index
+    second = Block('server', server_name=['b.com'])
+    http.sections.add(second)
+    static = Location('^~ /static/')
+    second.sections.add(EmptyBlock(static))
+    assert index.server('b.com') is second
+    assert index.longest_prefix('b.com', '/static/app.js') is static
+
+    # so do renames and removals
+    second.options.server_name = 'c.com'
+    assert index.server('b.com') is None
+    assert index.server('c.com') is second
+
+    first.sections.remove(app)
+    assert index.location('a.com', '/app') is None
+    assert index.location('a.com', '/app/admin') is None
+    assert index.longest_prefix('a.com', '/app/x').name == 'location /'
+
+    http.sections.remove(second)
+    assert index.server('c.com') is None
+    assert index.servers() == [first]
+
+    index.close()
+    http.sections.add(Block('server', server_name='d.com'))
+    assert index.server('d.com') is None
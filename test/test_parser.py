@@ -0,0 +1,185 @@
+from nginx.config.api import Block, Location
+from nginx.config.api.options import Comment, KeyOption, KeyValueOption
+from nginx.config.helpers import simple_configuration
+from nginx.config.loader import ConfigLoader
+from nginx.config.parser import ParseError, parse, parse_file, tokenize
+import gc
+import os
+import pytest
+import weakref
+
+CONFIG = r'''
+# main config
+worker_processes 4; #trailing
+events { worker_connections 1024; }
+http {
+    log_format main '$remote_addr - "$request" \'q\'';
+    map $http_host $backend {
+        default   a;
+        ~^(www\.)?example\.com$  b;
+        "quoted key;{}" c;
+    }
+    server {
+        listen 80 default_server;
+        set $x "${host}abc";
+        location ~* \.(png|jpg)$ { expires 30d; }
+        if ($request_method = POST) { return 405; }
+        add_header X-A a;
+        add_header X-A b;
+        rewrite ^/a#b /c;
+        internal;
+    }
+}
+'''
+
+
+def test_tokenize():
+    tokens = [(kind, text) for kind, text, _ in tokenize(b'set $a "${b} }{;"; # done\nx{}')]
+    assert tokens == [
+        ('word', 'set'), ('word', '$a'), ('word', '"${b} }{;"'), ('end', ';'), ('comment', '# done'),
+        ('word', 'x'), ('open', '{'), ('close', '}'),
+    ]
+
+
+def test_parse():
+    config = parse(CONFIG)
+    comment, processes, trailing, events, http = config.sections
+
+    assert isinstance(comment, Comment) and repr(trailing) == '\n# trailing'
+    assert isinstance(processes, KeyValueOption) and processes.value == '4'
+    assert events.name == 'events'
+
+    map_block, server = [section for section in http.sections if section._is_block]
+    assert map_block.name == 'map $http_host $backend'
+    assert [option.name for option in map_block.sections] == ['default', r'~^(www\.)?example\.com$', '"quoted key;{}"']
+
+    location = server.sections.getall('location ~* \\.(png|jpg)$')[0]
+    assert isinstance(location, Location)
+    assert location.parent is server and server.parent is http
+    # repeated directives and their order are kept
+    assert [option.value for option in server.sections.getall('add_header')] == ['X-A a', 'X-A b']
+    assert isinstance(server.sections.internal, KeyOption)
+    assert server.sections.set.value == '$x "${host}abc"'
+    assert server.sections.rewrite.value == '^/a#b /c'
+
+    assert len(parse(CONFIG, comments=False).sections) == 3
+
+
+def test_round_trip(tmpdir):
+    rendered = repr(parse(CONFIG))
+    assert repr(parse(rendered)) == rendered
+    assert 'location ~* \\.(png|jpg)$ {\n            expires 30d;\n        }' in rendered
+
+    generated = repr(simple_configuration())
+    assert repr(parse(generated)) == generated
+
+    path = tmpdir.join('nginx.conf')
+    path.write(rendered)
+    assert repr(parse_file(str(path))) == rendered
+    tmpdir.join('empty.conf').write('')
+    assert repr(parse_file(str(tmpdir.join('empty.conf')))) == ''
+
+
+def test_parse_errors():
+    cases = [
+        ('http {\n', 'unexpected end of file, expected "}"', 2),
+        ('a;\n}', 'unexpected "}"', 2),
+        ('a b', 'unexpected end of file, expected ";" or "{"', 1),
+        ('a;\nb "unterminated;', 'unexpected \'"\'', 2),
+        ('{ a; }', 'block without a name', 1),
+        ('a;\n\n;', 'unexpected ";"', 3),
+        ('a { b }', 'expected ";" before "}"', 1),
+    ]
+    for text, message, line in cases:
+        with pytest.raises(ParseError) as error:
+            parse(text, source='test.conf')
+        assert (error.value.msg, error.value.line) == (message, line)
+        assert str(error.value).startswith('test.conf:{0}: '.format(line))
+
+    assert isinstance(parse('a { b; }').sections[0], Block)
+
+
+def test_loader(tmpdir):
+    def write(name, text, mtime=None):
+        path = tmpdir.join(name)
+        path.write(text, ensure=True)
+        if mtime is not None:
+            os.utime(str(path), (mtime, mtime))
+        return str(path)
+
+    main = write('nginx.conf', 'http {\n    include conf.d/*.conf;\n    server { location / { include common.conf; } }\n}\n')
+    write('conf.d/a.conf', 'server { server_name a.com; }', mtime=1000)
+    write('conf.d/b.conf', 'server { server_name b.com; include common.conf; }')
+    write('common.conf', 'proxy_set_header Host $host;')
+
+    loader = ConfigLoader()
+    config = loader.load(main)
+    assert loader.stats == {'parsed': 4, 'reused': 1}
+    rendered = repr(config)
+    assert rendered.count('proxy_set_header Host $host;') == 2
+    assert rendered.index('server_name a.com') < rendered.index('server_name b.com') < rendered.index('location /')
+    assert repr(parse(rendered)) == rendered
+
+    assert repr(loader.load(main)) == rendered
+    assert loader.stats == {'parsed': 0, 'reused': 5}
+
+    # touched without being changed
+    write('conf.d/a.conf', 'server { server_name a.com; }', mtime=2000)
+    loader.load(main)
+    assert loader.stats == {'parsed': 0, 'reused': 5}
+
+    write('conf.d/a.conf', 'server { server_name c.com; }', mtime=3000)
+    config = loader.load(main)
+    assert loader.stats == {'parsed': 1, 'reused': 4}
+    assert 'server_name c.com' in repr(config)
+
+    # modifying a loaded tree doesn't leak into the cache: blocks with includes are copies...
+    server_b = config.sections[0].sections[0].sections[1].sections[0]
+    server_b.options.listen = 80
+    assert 'listen 80' not in repr(loader.load(main))
+    assert loader.stats == {'parsed': 0, 'reused': 5}
+    # ...and changing a shared block means parsing its file again
+    server_a = config.sections[0].sections[0].sections[0].sections[0]
+    server_a.options.listen = 81
+    assert 'listen 81' not in repr(loader.load(main))
+    assert loader.stats == {'parsed': 1, 'reused': 4}
+
+    cache_file = str(tmpdir.join('cache'))
+    loader.save(cache_file)
+    warm = ConfigLoader(cache_file=cache_file)
+    assert repr(warm.load(main)) == repr(loader.load(main))
+    assert warm.stats == {'parsed': 0, 'reused': 5}
+
+    write('common.conf', 'include nginx.conf;', mtime=4000)
+    with pytest.raises(ParseError) as error:
+        loader.load(main)
+    assert 'include cycle' in str(error.value)
+
+    write('common.conf', 'include missing.conf;', mtime=5000)
+    with pytest.raises(ParseError):
+        loader.load(main)
+
+
+def test_loader_shared_blocks(tmpdir):
+    main = tmpdir.join('nginx.conf')
+    main.write('http {\n    include servers.conf;\n}\n')
+    tmpdir.join('servers.conf').write('server { server_name a.com; }\n')
+
+    loader = ConfigLoader()
+    first = loader.load(str(main))
+    second = loader.load(str(main))
+    server = first.sections.http.sections[0].sections[0].sections.server
+    assert server is second.sections.http.sections[0].sections[0].sections.server
+    repr(first), repr(second)
+
+    # a shared block is in every loaded tree, and changing it re-renders all of them
+    server.options.listen = 80
+    assert 'listen 80;' in repr(first)
+    assert 'listen 80;' in repr(second)
+    assert 'listen 80;' not in repr(loader.load(str(main)))
+
+    # the cache doesn't keep the trees it parsed alive once the loader is gone
+    tree = weakref.ref(loader.files[str(tmpdir.join('servers.conf'))].tree)
+    del loader, first, second, server
+    gc.collect()
+    assert tree() is None
@@ -0,0 +1,65 @@
+from nginx.config.builder import NginxConfigBuilder
+from nginx.config.pipeline import generate
+from nginx.config.writer import ConfigWriter
+import asyncio
+import pytest
+
+
+def test_pipeline(tmpdir):
+    class Source(object):
+        """ Stands in for an async data source, answering after a short delay. """
+        def __init__(self, items, fail=False):
+            self.items = list(items)
+            self.fail = fail
+            self.read = 0
+
+        def __aiter__(self):
+            return self
+
+        def __anext__(self):
+            if not self.items:
+                if self.fail:
+                    raise RuntimeError('source went away')
+                raise StopAsyncIteration
+            self.read += 1
+            ahead.append(self.read - len(builder.top.sections))
+            return asyncio.sleep(0.001, result=self.items.pop(0))
+
+    def specs():
+        for i in range(20):
+            routes = [('/r{0}'.format(j), {'proxy_pass': 'http://t{0}'.format(i)}) for j in range(3)]
+            yield {'hostname': 't{0}.com'.format(i % 15), 'listen': 8000 + i, 'routes': Source(routes) if i % 2 else routes}
+
+    def run(coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def contents(directory):
+        return dict((str(path.relto(directory)), path.read()) for path in directory.visit() if path.check(file=1))
+
+    ahead = []
+    builder = NginxConfigBuilder()
+    builder.add_server(hostname='existing.com').end()
+    source = Source(specs())
+    result = run(generate(source, ConfigWriter(str(tmpdir.join('pipeline'))), builder, queue_size=2))
+    assert len(result.written) == 22 and result.written[-1] == str(tmpdir.join('pipeline', 'nginx.conf'))
+    # the source is never read far ahead of the servers being built
+    assert max(ahead) <= 2 + 3
+
+    # the same files as writing the finished config
+    ConfigWriter(str(tmpdir.join('writer'))).write(builder._config())
+    expected = contents(tmpdir.join('writer'))
+    assert contents(tmpdir.join('pipeline')) == expected
+    assert 'servers/t3.com-2.conf' in expected and 'location /r2' in expected['servers/t3.com-2.conf']
+
+    result = run(generate(Source([]), ConfigWriter(str(tmpdir.join('pipeline'))), builder))
+    assert not result.changed and len(result.unchanged) == 22
+
+    with pytest.raises(RuntimeError):
+        run(generate(Source([{'hostname': 'a.com'}], fail=True), ConfigWriter(str(tmpdir.join('failed')))))
+    assert not tmpdir.join('failed', 'nginx.conf').check()
+    with pytest.raises(ValueError):
+        run(generate(Source([]), ConfigWriter(str(tmpdir.join('failed')), snippets=True)))
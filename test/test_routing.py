@@ -0,0 +1,40 @@
+from nginx.config.api import Block, EmptyBlock, Location
+from nginx.config.routing import EXACT, PREFIX, REGEX, RouteTable, Router
+
+
+def test_routing():
+    root = Location('/')
+    images = Location('^~ /images/', Location('~ \\.gif$'))
+    api = Location('/api/', Location('/api/v2/'), Location('~ /api/.*/debug$'))
+    php = Location('~* \\.php$')
+    exact = Location('= /login')
+    server = Block('server', root, EmptyBlock(images), api, php, exact, Location('@fallback'), server_name='a.com')
+    routes = RouteTable(server)
+
+    assert routes.match('/login') == (exact, EXACT)
+    assert routes.match('/login/') == (root, PREFIX)
+    assert routes.match('/INDEX.PHP?x=1') == (php, REGEX)
+    # ^~ stops regex matching, but nested locations are still searched
+    assert routes.match('/images/a.php') == (images, PREFIX)
+    assert routes.match('/images/a.gif') == (images.sections[0], REGEX)
+    # the longest nested prefix wins, unless a regex matches
+    assert routes.match('/api/v2/users') == (api.sections[0], PREFIX)
+    assert routes.match('/api/v2/debug') == (api.sections[1], REGEX)
+    assert routes.match('/api/v2/x.php') == (php, REGEX)
+    assert RouteTable(Block('server')).match('/') == (None, None)
+
+    uris = ['/login', '/a.php', '/login', '/other']
+    assert routes.resolve_many(uris) == [exact, php, exact, root]
+
+    http = Block('http', server, Block('server', Location('/b'), server_name='b.com'))
+    router = Router(http)
+    assert router.resolve('a.com', '/login') is exact
+    assert router.resolve('b.com:8080', '/b/c').name == 'location /b'
+    assert router.resolve('unknown.com', '/login') is exact
+    assert router.resolve_many([('b.com', '/b'), ('a.com', '/x.php')]) == [http.sections[1].sections[0], php]
+
+    # route tables follow changes to the config
+    health = Location('= /health')
+    http.sections[1].sections.add(health)
+    assert router.resolve('b.com', '/health') is health
+    router.close()
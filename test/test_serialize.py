@@ -0,0 +1,62 @@
+from nginx.config.api import Block, Comment, EmptyBlock, Location
+from nginx.config.api.options import KeyOption, KeyValuesMultilines
+from nginx.config.builder import NginxConfigBuilder
+from nginx.config.builder.plugins import CacheUseStale, UWSGICacheRoutePlugin
+from nginx.config.helpers import duplicate_options
+from nginx.config.serialize import from_bytes, from_dict, to_bytes, to_dict
+import json
+import pytest
+
+
+def test_serialize():
+    server = Block(
+        'server',
+        Comment(comment='generated'),
+        Location('/', EmptyBlock(expires='1d'), KeyOption('internal'), proxy_pass='http://upstream'),
+        duplicate_options('add_header', ['X-A 1', 'X-B 2']),
+        KeyValuesMultilines('allow', ['10.0.0.0/8', ['127.0.0.1', '::1']]),
+        listen=80, ssl=False, server_name='a.com b.com', access_log=['logs/a.log', 'combined'], http2=None,
+        nested=Block('if ($x)', return_=403),
+    )
+    config = EmptyBlock(Block('http', server), worker_processes='auto')
+
+    for copy in (from_dict(json.loads(json.dumps(to_dict(config)))), from_bytes(to_bytes(config))):
+        assert type(copy) is EmptyBlock
+        assert repr(copy) == repr(config)
+        assert copy.fingerprint == config.fingerprint
+        server_copy = copy.sections.http.sections.server
+        assert server_copy.parent is copy.sections.http
+        assert dict(server_copy.options, nested=None) == dict(server.options, nested=None)
+        assert server_copy.options.nested.parent is server_copy
+        assert type(server_copy.sections['location /']) is Location
+        # values are copied, not shared
+        server_copy.options.access_log.append('gzip')
+        assert server.options.access_log == ['logs/a.log', 'combined']
+
+    data = to_dict(Block('events', worker_connections=512))
+    assert data == {'type': 'block', 'name': 'events', 'options': [['worker_connections', 512]]}
+
+    # subclasses are read back as the class they derive from
+    class Custom(Block):
+        pass
+
+    config = Block('http', Custom('server', listen=80))
+    assert type(from_bytes(to_bytes(config)).sections[0]) is Block
+    assert from_dict(to_dict(config)).sections[0].options == {'listen': 80}
+
+    # values of other types are kept as the text they render as
+    nginx = NginxConfigBuilder()
+    nginx.register_plugin(UWSGICacheRoutePlugin())
+    with nginx.add_server() as server:
+        server.add_route('/').cache_uwsgi_route(cache_valid={'200': '1m'}, cache_use_stale=CacheUseStale.error).end()
+    config = nginx._config()
+    assert 'uwsgi_cache_use_stale error;' in repr(config)
+    for copy in (from_dict(json.loads(json.dumps(to_dict(config)))), from_bytes(to_bytes(config))):
+        assert repr(copy) == repr(config)
+
+    with pytest.raises(TypeError):
+        to_bytes(Block('http', object()))
+    with pytest.raises(ValueError):
+        from_bytes(b'garbage')
+    with pytest.raises(ValueError):
+        from_dict({'type': 'unknown'})
@@ -0,0 +1,60 @@
+from nginx.config.api import Block, EmptyBlock, Location
+from nginx.config.serialize import from_bytes, to_bytes
+from nginx.config.templates import Template, TemplateInstance, placeholder
+import pytest
+
+
+def test_templates():
+    def server(hostname, port, upstream):
+        return Block(
+            'server',
+            Location('/', proxy_pass='http://{0}'.format(upstream)),
+            Location('/static', root='/var/www', expires='1d'),
+            server_name=hostname,
+            listen=port,
+            ssl_certificate='/etc/ssl/{0}.pem'.format(hostname),
+        )
+
+    template = Template(server(placeholder('hostname'), placeholder('port'), placeholder('upstream')), level=0)
+    assert template.slots == frozenset(['hostname', 'port', 'upstream'])
+
+    instance = template.instantiate(hostname='a.example.com', port=8443, upstream='backend_a')
+    assert isinstance(instance, TemplateInstance)
+    expected = repr(server('a.example.com', 8443, 'backend_a'))
+    assert repr(instance) == expected
+    assert template.render(hostname='a.example.com', port=8443, upstream='backend_a') == expected[1:]
+    # the tree is only built when it is looked at, and renders the same once it is
+    assert instance._template is not None
+    assert instance.options.listen == 8443
+    assert instance._template is None
+    assert repr(instance) == expected
+    instance._render_cache = None
+    assert repr(instance) == expected
+
+    # blocks without placeholders are shared with the template, and each instance has its own values
+    other = template.instantiate(hostname='b.example.com', port=443, upstream='backend_b')
+    assert other.sections['location /static'] is instance.sections['location /static'] is template.block.sections[1]
+    assert other.sections['location /'] is not instance.sections['location /']
+    assert 'backend_b' in repr(other) and 'backend_b' not in repr(instance)
+
+    # values are rendered like the options of the same tree built directly, whatever their type
+    for port in ([443, 'ssl'], None, '', True, '443  ssl'):
+        assert repr(template.instantiate(hostname='c.example.com', port=port, upstream='c')) == repr(server('c.example.com', port, 'c'))
+    assert 'listen 443 ssl;' in template.render(hostname='c.example.com', port=[443, 'ssl'], upstream='c')
+
+    # instances can be changed like any other block
+    other.sections.add(Location('/health', return_=200))
+    other.edit(template.block.sections[1]).options.expires = '1h'
+    text = repr(other)
+    assert 'location /health' in text and 'expires 1h;' in text
+    assert repr(instance) == expected
+    assert repr(from_bytes(to_bytes(other))) == text
+
+    with pytest.raises(ValueError):
+        template.instantiate(hostname='a.example.com', port=80)
+    with pytest.raises(ValueError):
+        template.instantiate(hostname='a.example.com', port=80, upstream='a', root='/srv')
+    with pytest.raises(ValueError):
+        placeholder('not a name')
+    with pytest.raises(TypeError):
+        Template(EmptyBlock())
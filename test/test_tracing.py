@@ -0,0 +1,43 @@
+from nginx.config.api import Block, Location
+from nginx.config.api.render import RenderContext
+from nginx.config.helpers import dumps
+from nginx.config.tracing import ChromeTraceRecorder, NULL_TRACER, get_tracer, use_tracer
+import json
+
+
+def test_tracing():
+    http = Block('http', Block('server', Location('/foo'), server_name='_'))
+    recorder = ChromeTraceRecorder()
+    with use_tracer(recorder):
+        dumps([http])
+        repr(http)
+        # cached blocks aren't walked again, so aren't traced
+        repr(http)
+    assert get_tracer() is NULL_TRACER
+
+    names = [(event['ph'], event['name']) for event in recorder.events]
+    assert names[:9] == [
+        ('B', 'dumps'),
+        ('B', 'http'),
+        ('B', 'http'),
+        ('B', 'server'),
+        ('B', 'location /foo'),
+        ('E', 'location /foo'),
+        ('E', 'server'),
+        ('E', 'http'),
+        ('E', 'http'),
+    ]
+    assert names[9] == ('E', 'dumps')
+    assert names[10:] == names[1:9] + [('B', 'http'), ('E', 'http')]
+    timestamps = [event['ts'] for event in recorder.events]
+    assert timestamps == sorted(timestamps)
+    assert json.loads(json.dumps(recorder.as_dict()))['traceEvents'][0]['cat'] == 'helpers'
+
+    # abandoned iterations still close their spans
+    recorder = ChromeTraceRecorder()
+    with use_tracer(recorder):
+        lines = http.iter_lines(RenderContext(use_cache=False))
+        next(lines)
+        next(lines)
+        lines.close()
+    assert [event['ph'] for event in recorder.events] == ['B', 'B', 'B', 'E', 'E', 'E']
@@ -0,0 +1,103 @@
+from nginx.config.api import Block, Config, EmptyBlock, Location
+from nginx.config.api.render import RenderContext, render
+from nginx.config.common import uwsgi_params
+from nginx.config.snippets import find_snippets
+from nginx.config.writer import ConfigWriter
+import os
+import stat
+
+
+def test_config_writer(tmpdir):
+    def server(name, *locations):
+        return Block('server', *[Location(path) for path in locations], server_name=name)
+
+    http = Block('http', server('a.com', '/a'), server('b.com', '/b'), server('a.com'), include='mime.types')
+    config = Config(http, daemon='off')
+    writer = ConfigWriter(str(tmpdir))
+
+    result = writer.write(config)
+    assert result.changed
+    assert sorted(os.path.relpath(path, str(tmpdir)) for path in result.written) == [
+        'nginx.conf', 'servers/a.com-2.conf', 'servers/a.com.conf', 'servers/b.com.conf',
+    ]
+    assert tmpdir.join('nginx.conf').read() == (
+        'daemon off;\n'
+        'http {\n'
+        '    include mime.types;\n'
+        '    include servers/a.com.conf;\n'
+        '    include servers/b.com.conf;\n'
+        '    include servers/a.com-2.conf;\n'
+        '}\n'
+    )
+    assert tmpdir.join('servers', 'b.com.conf').read() == 'server {\n    server_name b.com;\n    location /b {\n    }\n}\n'
+    # the tree itself renders as before
+    assert 'location /a' in repr(config)
+
+    result = writer.write(config)
+    assert not result.changed
+    assert len(result.unchanged) == 4
+
+    # new files get the default permissions, replaced files keep theirs
+    umask = os.umask(0o022)
+    os.umask(umask)
+    assert stat.S_IMODE(os.stat(str(tmpdir.join('nginx.conf'))).st_mode) == 0o666 & ~umask
+    os.chmod(str(tmpdir.join('servers', 'b.com.conf')), 0o640)
+
+    http.sections[1].sections.add(Location('/c'))
+    http.sections.remove(http.sections[2])
+    result = writer.write(config)
+    assert result.written == [str(tmpdir.join('servers', 'b.com.conf')), str(tmpdir.join('nginx.conf'))]
+    assert result.removed == [str(tmpdir.join('servers', 'a.com-2.conf'))]
+    assert 'location /c' in tmpdir.join('servers', 'b.com.conf').read()
+    assert stat.S_IMODE(os.stat(str(tmpdir.join('servers', 'b.com.conf'))).st_mode) == 0o640
+    assert not [name for name in os.listdir(str(tmpdir.join('servers'))) if name.endswith('.tmp')]
+
+
+def test_snippets(tmpdir):
+    def server(name):
+        return Block(
+            'server',
+            Location('/a', uwsgi_params, uwsgi_pass='a'),
+            Location('/b', EmptyBlock(uwsgi_params), uwsgi_pass='b'),
+            Location('/c', uwsgi_pass='c'),
+            server_name=name,
+        )
+
+    config = Config(Block('http', server('a.com'), server('b.com')))
+    plain = repr(config)
+
+    plan = find_snippets(config, exclude=lambda node: getattr(node, 'name', '') == 'server')
+    # the whole of /a and /b repeat across servers, uwsgi_params repeats within them, /c is too small
+    assert len(plan.snippets) == 2
+    rendered = plan.render(config)
+    assert rendered.count('include snippets/') == 4
+    assert 'location /c' in rendered
+    assert plan.bytes_saved == len(plain) - len(rendered) - sum(len(text) for text in plan.snippets.values())
+    assert repr(config) == plain
+
+    plan = find_snippets(config, exclude=lambda node: getattr(node, 'name', '').startswith(('server', 'location')))
+    # shared objects and copies count alike
+    assert list(plan.snippets.values()) == [repr(uwsgi_params)[1:] + '\n']
+    assert plan.render(config).count('include snippets/') == 4
+
+    result = ConfigWriter(str(tmpdir), snippets=True).write(config)
+    assert result.bytes_saved > 0
+    assert len(tmpdir.join('snippets').listdir()) == 2
+    assert 'include snippets/' in tmpdir.join('servers', 'a.com.conf').read()
+
+
+def test_snippets_at_several_levels():
+    # the same block placed at two depths is included at the indentation of each
+    server = Block('server', Location('/a', uwsgi_params), Location('/b', Location('/b/c', uwsgi_params)), server_name='a.com')
+    config = Config(Block('http', server))
+
+    plan = find_snippets(config, exclude=lambda node: node is not uwsgi_params)
+    path, = plan.snippets
+    rendered = plan.render(config)
+    assert '\n        location /a {\n            include ' + path + ';\n        }' in rendered
+    assert '\n            location /b/c {\n                include ' + path + ';\n            }' in rendered
+
+    # as the writer does, a block nested in the config can be rendered on its own
+    rendered = render(server, RenderContext(use_cache=False, prerendered=plan.prerendered()))
+    assert '\n    location /a {\n        include ' + path + ';\n    }' in rendered
+    assert '\n        location /b/c {\n            include ' + path + ';\n        }' in rendered